@@ -0,0 +1,128 @@
+# Допуск запросов к /fire, /status, /batch и /events и тех же команд /ws:
+# ведро жетонов на адрес клиента и на место игрока в партии плюс общий
+# предел запросов, обрабатываемых одновременно. Лишний запрос сразу получает
+# 429 (или 503, если сервер занят целиком) с Retry-After, а не встаёт
+# в очередь и не отнимает время у идущих партий.
+#
+# Настройка - переменные окружения, "0" отключает ограничение:
+#   BATTLESHIP_IP_RATE       = запросов в секунду/запас, по умолчанию 100/200
+#   BATTLESHIP_PLAYER_RATE   = то же для места игрока, по умолчанию 20/40
+#   BATTLESHIP_MAX_IN_FLIGHT = запросов одновременно, по умолчанию 256
+# Адрес клиента - адрес соединения; X-Forwarded-For не учитывается,
+# за обратным прокси ограничение по адресу надо отключить.
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from engine import GameError
+
+IP_RATE = "100/200"
+PLAYER_RATE = "20/40"
+MAX_IN_FLIGHT = 256
+# Сколько вёдер помнить; давно не приходившие клиенты вытесняются,
+# их ведро к тому времени всё равно полное
+MAX_BUCKETS = 100000
+# /events - только подключение: поток после него запросом не считается
+LIMITED_ROUTES = frozenset({"/fire", "/status", "/batch", "/events"})
+# Те же ограничения для команд WebSocket /ws; subscribe - как подключение к /events
+LIMITED_OPS = frozenset({"fire", "status", "subscribe"})
+
+
+class RateLimited(GameError):
+    def __init__(self, message, retry_after, status=429):
+        super().__init__(message, status)
+        # Целые секунды для заголовка Retry-After, не меньше одной
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBuckets:
+    # Ведро на ключ: rate жетонов в секунду, не больше burst в запасе
+    def __init__(self, rate, burst, max_buckets=MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        # Ключ -> (жетонов, когда посчитано); в начале давно не приходившие
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, cost=1, now=None):
+        # 0 - жетоны списаны, иначе через сколько секунд их хватит
+        if now is None:
+            now = time.monotonic()
+        cost = min(cost, self.burst)
+        with self.lock:
+            bucket = self.buckets.pop(key, None)
+            if bucket is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / self.rate
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+            return wait
+
+
+def parse_rate(value):
+    # "100/200" -> (100.0, 200.0), "50" -> (50.0, 50.0), "0" -> None
+    rate, _, burst = value.partition("/")
+    rate = float(rate)
+    burst = float(burst) if burst else rate
+    if rate <= 0:
+        return None
+    return rate, max(1.0, burst)
+
+
+class Admission:
+    # Без аргументов ничего не ограничивает
+    def __init__(self, ip_rate=None, player_rate=None, max_in_flight=0):
+        self.ips = TokenBuckets(*ip_rate) if ip_rate else None
+        self.players = TokenBuckets(*player_rate) if player_rate else None
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = {"ip": 0, "player": 0, "in_flight": 0}
+        self.lock = threading.Lock()
+
+    def admit(self, ip, player=None, cost=1):
+        # player - (game_id, место) или None; cost - сколько команд в запросе.
+        # После успешного admit обязателен release
+        if self.ips is not None:
+            wait = self.ips.take(ip, cost)
+            if wait:
+                self.reject("ip")
+                raise RateLimited("Слишком много запросов", wait)
+        if self.players is not None and player is not None:
+            wait = self.players.take(player, cost)
+            if wait:
+                self.reject("player")
+                raise RateLimited("Слишком много запросов от игрока", wait)
+        with self.lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.rejected["in_flight"] += 1
+                raise RateLimited("Сервер перегружен, попробуйте позже", 1, 503)
+            self.in_flight += 1
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def reject(self, reason):
+        with self.lock:
+            self.rejected[reason] += 1
+
+    def to_json(self):
+        with self.lock:
+            return {"in_flight": self.in_flight, "rejected": dict(self.rejected)}
+
+
+def open_admission():
+    ip_rate = parse_rate(os.environ.get("BATTLESHIP_IP_RATE", IP_RATE))
+    player_rate = parse_rate(os.environ.get("BATTLESHIP_PLAYER_RATE", PLAYER_RATE))
+    max_in_flight = int(os.environ.get("BATTLESHIP_MAX_IN_FLIGHT", MAX_IN_FLIGHT))
+    return Admission(ip_rate, player_rate, max_in_flight)
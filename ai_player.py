@@ -0,0 +1,303 @@
+# Компьютерный игрок без GUI. Может занять любое место в партии через
+# обычные /place_ships и /fire, либо играть сам с собой в процессе
+# для генерации нагрузки. Поле, флот и запрет касаний берутся из правил
+# партии (ответ на создание или вход), ИИ играет на полях до 32x32.
+#
+#   python ai_player.py --server http://127.0.0.1:5000            # создать игру
+#   python ai_player.py --server http://127.0.0.1:5000 --game ID  # войти в игру
+#   python ai_player.py --selfplay 1000                           # ИИ против ИИ
+#   python ai_player.py --selfplay 100 --rules '{"fleet": [4, 3, 3, 2, 2, 2, 1, 1, 1, 1], "touching": false}'
+import argparse
+import json
+import random
+import time
+from collections import Counter
+
+import numpy as np
+
+from board import PLACEMENT_TABLE_LIMIT
+from engine import DEFAULT_RULES, Rules
+
+# Матрицы всех положений кораблей на больших полях не помещаются в память
+MAX_CELLS = PLACEMENT_TABLE_LIMIT
+
+_placements_cache = {}
+
+
+def placements(length, width, height):
+    # Все положения корабля длины length на поле width x height:
+    # матрица (число положений, width*height), строка - маска клеток корабля
+    key = (length, width, height)
+    if key not in _placements_cache:
+        rows = []
+        for r in range(height):
+            for c in range(width - length + 1):
+                rows.append([r * width + c + i for i in range(length)])
+        if length > 1:
+            for r in range(height - length + 1):
+                for c in range(width):
+                    rows.append([(r + i) * width + c for i in range(length)])
+        masks = np.zeros((len(rows), width * height), dtype=bool)
+        for i, cells in enumerate(rows):
+            masks[i, cells] = True
+        _placements_cache[key] = masks
+    return _placements_cache[key]
+
+
+class Targeting:
+    # Карта плотности: для каждой клетки - сколько допустимых положений
+    # оставшихся кораблей её накрывают. После каждого выстрела вычитаются
+    # только положения, которые этот выстрел исключил.
+    def __init__(self, rules=DEFAULT_RULES, rng=None):
+        self.width = rules.width
+        self.height = rules.height
+        self.touching = rules.touching
+        self.rng = rng or np.random.default_rng()
+        self.remaining = Counter(rules.fleet)
+        self.masks = {length: placements(length, rules.width, rules.height) for length in self.remaining}
+        self.alive = {length: np.ones(len(masks), dtype=bool) for length, masks in self.masks.items()}
+        self.density = np.zeros(rules.cells, dtype=np.int64)
+        for length, masks in self.masks.items():
+            self.density += self.remaining[length] * masks.sum(axis=0)
+        self.shot = np.zeros(rules.cells, dtype=bool)
+        # Попадания в ещё не потопленные корабли - режим добивания
+        self.open_hits = np.zeros(rules.cells, dtype=bool)
+
+    def next_cell(self):
+        if self.open_hits.any():
+            score = self.target_scores()
+            score[self.shot] = -1
+            if score.max() > 0:
+                return self.pick(score)
+        score = self.density.astype(float)
+        score[self.shot] = -1
+        return self.pick(score)
+
+    def pick(self, score):
+        # Шум меньше единицы только разбивает ничьи между равными клетками
+        score = score + self.rng.random(score.size) * 0.5
+        return int(np.argmax(score))
+
+    def target_scores(self):
+        # Положения кораблей, проходящие через открытые попадания
+        score = np.zeros(self.density.size, dtype=np.int64)
+        for length, masks in self.masks.items():
+            if not self.remaining[length]:
+                continue
+            through = self.alive[length] & masks[:, self.open_hits].any(axis=1)
+            score += self.remaining[length] * masks[through].sum(axis=0)
+        return score
+
+    def block(self, cell):
+        # Клетка больше не может принадлежать ни одному оставшемуся кораблю
+        for length, masks in self.masks.items():
+            covering = self.alive[length] & masks[:, cell]
+            if covering.any():
+                self.density -= self.remaining[length] * masks[covering].sum(axis=0)
+                self.alive[length][covering] = False
+
+    def sink(self, length, cells):
+        self.density -= self.masks[length][self.alive[length]].sum(axis=0)
+        self.remaining[length] -= 1
+        self.open_hits[cells] = False
+        for cell in cells:
+            self.block(cell)
+        if not self.touching:
+            # Корабли не касаются: вокруг потопленного кораблей нет,
+            # стрелять туда незачем
+            for cell in self.around(cells):
+                if not self.shot[cell]:
+                    self.shot[cell] = True
+                    self.block(cell)
+
+    def around(self, cells):
+        width, height = self.width, self.height
+        for cell in cells:
+            row, col = divmod(cell, width)
+            for r in range(max(row - 1, 0), min(row + 2, height)):
+                for c in range(max(col - 1, 0), min(col + 2, width)):
+                    yield r * width + c
+
+    def record(self, cell, hit, sunk_cells=None):
+        self.shot[cell] = True
+        if not hit:
+            self.block(cell)
+            return
+        self.open_hits[cell] = True
+        # Если остались только однопалубные, любое попадание - потопление
+        if sunk_cells is None and set(+self.remaining) == {1}:
+            sunk_cells = [cell]
+        if sunk_cells:
+            self.sink(len(sunk_cells), sunk_cells)
+
+
+class AIPlayer:
+    def __init__(self, rules=None, seed=None):
+        self.rules = rules or DEFAULT_RULES
+        if self.rules.cells > MAX_CELLS:
+            raise ValueError(f"ИИ играет на полях до {MAX_CELLS} клеток")
+        self.rng = np.random.default_rng(seed)
+        self.targeting = Targeting(self.rules, rng=self.rng)
+
+    def place_fleet(self):
+        # Расстановка по правилам партии, как её делает /random_fleet
+        ships = self.rules.random_fleet(random.Random(int(self.rng.integers(1 << 31))))
+        return [self.rules.format_cells(cells) for cells in ships]
+
+    def next_shot(self):
+        return self.rules.format_cell(self.targeting.next_cell())
+
+    def observe(self, coord, hit, sunk=None):
+        # sunk - клетки потопленного корабля, если сервер их сообщил
+        if sunk:
+            sunk = [self.rules.parse_cell(cell) for cell in sunk]
+        self.targeting.record(self.rules.parse_cell(coord), hit, sunk)
+
+    def observe_cell(self, cell, hit, sunk=None):
+        # То же с номерами клеток, как в компактном протоколе
+        self.targeting.record(cell, hit, sunk)
+
+
+def play_local(seed=None, rules=None):
+    # Партия ИИ против ИИ внутри процесса на движке правил сервера
+    from engine import MISS, SUNK, WIN, Match, opponent_of
+
+    match = Match(rules)
+    rng = np.random.default_rng(seed)
+    ais = {seat: AIPlayer(match.rules, int(rng.integers(1 << 31))) for seat in ("player1", "player2")}
+    for seat, ai in ais.items():
+        match.place(seat, ai.place_fleet())
+    shots = 0
+    while not match.game_over:
+        seat = match.current_turn
+        target = ais[seat].next_shot()
+        outcome = match.shoot(seat, target)
+        sunk = None
+        if outcome in (SUNK, WIN):
+            sunk = match.players[opponent_of(seat)].ship_cells(match.rules.parse_cell(target))
+        ais[seat].observe_cell(match.rules.parse_cell(target), outcome != MISS, sunk)
+        shots += 1
+    return match.winner, shots
+
+
+def apply_snapshot(state, snapshot):
+    # Снимок из /events или ответ /status: чей ход, кто готов, кто победил
+    state["turn"] = snapshot["current_turn"]
+    state["ready"] = {seat for seat in ("player1", "player2") if snapshot[f"{seat}_ready"]}
+    state["winner"] = snapshot["winner"]
+
+
+def play_remote(server_url, game_id=None, player=None, seed=None, rules=None):
+    # Занимает место в партии на сервере и играет до конца.
+    # Выстрелы идут в компактном протоколе: код исхода и номера клеток.
+    # Запросы - через ServerAPI клиента: на 429/503 он ждёт Retry-After
+    # и повторяет не больше THROTTLED_RETRIES раз
+    import protocol
+    from client_core import RETRY_MAX, RETRY_MIN, THROTTLED_RETRIES, ServerAPI, new_session, read_events
+    from engine import MISS
+
+    compact = {"Content-Type": protocol.CONTENT_TYPE, "Accept": protocol.CONTENT_TYPE}
+
+    api = ServerAPI(server_url)
+    session = new_session()
+    if game_id is None:
+        payload = {"player": player}
+        if rules is not None:
+            payload["rules"] = rules
+        joined = api.call(session, "POST", "/games", json=payload).json()
+    else:
+        joined = api.call(session, "POST", f"/games/{game_id}/join", json={"player": player}).json()
+    if "error" in joined:
+        raise RuntimeError(joined["error"])
+    game_id, player = joined["game_id"], joined["player"]
+    print(f"Игра {game_id}, место {player}")
+
+    # Поле и флот - по правилам партии, которые прислал сервер
+    ai = AIPlayer(Rules.from_json(joined.get("rules")), seed)
+    response = api.place_ships(session, {
+        "game_id": game_id, "player": player, "ships": ai.place_fleet()
+    })
+    if "error" in response:
+        raise RuntimeError(response["error"])
+
+    # Ход отслеживаем по потоку /events, стреляем, когда очередь наша
+    state = {"turn": None, "both_ready": False, "ready": set(), "winner": None}
+    failures = 0
+    with api.events(session, game_id) as stream:
+        for event in read_events(stream):
+            kind = event["type"]
+            if kind == "snapshot":
+                apply_snapshot(state, event)
+            elif kind == "ready":
+                (state["ready"].add if event["ready"] else state["ready"].discard)(event["player"])
+            elif kind == "turn":
+                state["turn"] = event["turn"]
+            elif kind == "game_over":
+                state["winner"] = event["winner"]
+
+            if state["winner"]:
+                return state["winner"]
+            while len(state["ready"]) == 2 and state["turn"] == player and not state["winner"]:
+                cell = ai.targeting.next_cell()
+                command = [protocol.FIRE, game_id, protocol.SEATS.index(player), cell, None]
+                response = api.call(session, "POST", "/fire", data=protocol.pack(command), headers=compact)
+                result = protocol.unpack(response.content)
+                if isinstance(result, dict):
+                    failures += 1
+                    if response.status_code in (429, 503) or failures > THROTTLED_RETRIES:
+                        # Повторы кончились, а сервер всё ещё перегружен
+                        # или раз за разом не принимает выстрел
+                        raise RuntimeError(result["error"])
+                    # Выстрел не принят: сверяемся с /status после паузы, а не
+                    # ждём события turn, которое могло прийти раньше ошибки
+                    time.sleep(min(RETRY_MIN * 2 ** (failures - 1), RETRY_MAX))
+                    _, snapshot = api.status(session, game_id)
+                    if "error" in snapshot:
+                        raise RuntimeError(snapshot["error"])
+                    apply_snapshot(state, snapshot)
+                    continue
+                failures = 0
+                code, turn, game_over, winner, _, sunk, _ = result
+                ai.observe_cell(cell, code != MISS, sunk)
+                if turn is not None:
+                    state["turn"] = protocol.SEATS[turn]
+                if game_over:
+                    state["winner"] = protocol.SEATS[winner]
+            if state["winner"]:
+                return state["winner"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Компьютерный игрок в морской бой")
+    parser.add_argument("--server", help="адрес сервера, например http://127.0.0.1:5000")
+    parser.add_argument("--game", help="код игры, в которую войти")
+    parser.add_argument("--player", choices=["player1", "player2"], help="желаемое место")
+    parser.add_argument("--selfplay", type=int, help="сыграть N партий ИИ против ИИ в процессе")
+    parser.add_argument("--rules", type=json.loads,
+                        help='правила новой партии или самоигры в JSON, например \'{"fleet": [3, 2, 1]}\'')
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.selfplay:
+        rules = Rules.from_json(args.rules)
+        rng = np.random.default_rng(args.seed)
+        started = time.perf_counter()
+        wins = Counter()
+        shots = 0
+        for _ in range(args.selfplay):
+            winner, game_shots = play_local(int(rng.integers(1 << 31)), rules)
+            wins[winner] += 1
+            shots += game_shots
+        elapsed = time.perf_counter() - started
+        print(f"партий: {args.selfplay}, {args.selfplay / elapsed * 60:.0f} партий/мин, "
+              f"в среднем {shots / args.selfplay:.1f} выстрелов, победы: {dict(wins)}")
+        return
+
+    if not args.server:
+        parser.error("нужен --server или --selfplay")
+    winner = play_remote(args.server.rstrip("/"), args.game, args.player, args.seed, args.rules)
+    print(f"Победил {winner}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Сводная статистика сыгранных партий (GET /stats), копится на лету.
+#
+# Выстрелы раунда (от создания или рестарта партии) собираются по событиям
+# shot, а когда партия выиграна, раунд целиком складывается в агрегаты:
+# тепловые карты выстрелов и попаданий по размерам поля, распределение
+# длины партий, доля побед у сделавшего первый выстрел и доля попаданий
+# по местам. Агрегаты ограничены по памяти и не зависят от числа партий.
+#
+# Ответ /stats кодируется один раз после изменения и дальше отдаётся
+# готовыми байтами, запрос ничего не пересчитывает. При шардировании
+# у каждого шарда своя статистика.
+import json
+import threading
+from array import array
+
+from engine import SEATS
+from game import RoundListener
+from metrics import Histogram
+
+# Границы корзин длины партии в выстрелах обоих игроков: "не больше le"
+LENGTH_BUCKETS = (20, 30, 40, 50, 60, 70, 80, 90, 100, 120, 150, 200, 300, 500, 1000, 5000)
+# Тепловые карты заводятся для стольких размеров поля, не больше
+# MAX_HEATMAP_CELLS клеток; партии на остальных полях идут только в итоги
+MAX_HEATMAPS = 16
+MAX_HEATMAP_CELLS = 10000
+
+
+class Heatmap:
+    __slots__ = ("width", "height", "games", "shots", "hits")
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.games = 0
+        self.shots = array("I", bytes(4 * width * height))
+        self.hits = array("I", bytes(4 * width * height))
+
+    def rows(self, counts):
+        width = self.width
+        return [counts[row * width:(row + 1) * width].tolist() for row in range(self.height)]
+
+    def to_json(self):
+        return {
+            "width": self.width,
+            "height": self.height,
+            "games": self.games,
+            "shots": self.rows(self.shots),
+            "hits": self.rows(self.hits)
+        }
+
+
+class Analytics(RoundListener):
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.games = 0
+        self.wins = [0, 0]
+        self.first_mover_wins = 0
+        self.seat_shots = [0, 0]
+        self.seat_hits = [0, 0]
+        self.lengths = Histogram(LENGTH_BUCKETS)
+        self.heatmaps = {}
+        self.other_boards = 0
+        # Готовый ответ /stats и число партий, по которым он собран
+        self.body = None
+        self.body_games = -1
+
+    def shot_entry(self, game, event):
+        # Выстрел раунда: (клетка, место 0/1, попал)
+        return game.rules.parse_cell(event["target"]), SEATS.index(event["player"]), event["hit"]
+
+    def finish_round(self, game, shots):
+        if shots:
+            self.add(game.rules, SEATS.index(game.winner), shots)
+
+    def add(self, rules, winner, shots):
+        heatmap = None
+        key = (rules.width, rules.height)
+        with self.lock:
+            self.games += 1
+            self.wins[winner] += 1
+            if shots[0][1] == winner:
+                self.first_mover_wins += 1
+            self.lengths.observe(len(shots))
+            heatmap = self.heatmaps.get(key)
+            if heatmap is None and len(self.heatmaps) < MAX_HEATMAPS and rules.cells <= MAX_HEATMAP_CELLS:
+                heatmap = self.heatmaps[key] = Heatmap(rules.width, rules.height)
+            if heatmap is None:
+                self.other_boards += 1
+            else:
+                heatmap.games += 1
+            seat_shots, seat_hits = self.seat_shots, self.seat_hits
+            for cell, seat, hit in shots:
+                seat_shots[seat] += 1
+                if hit:
+                    seat_hits[seat] += 1
+                if heatmap is not None:
+                    heatmap.shots[cell] += 1
+                    if hit:
+                        heatmap.hits[cell] += 1
+
+    def to_json(self):
+        # Вызывается под self.lock
+        games = self.games
+        lengths = self.lengths
+        buckets = [{"le": bound, "games": count} for bound, count in zip(lengths.bounds, lengths.counts)]
+        buckets.append({"le": None, "games": lengths.count - sum(lengths.counts)})
+        return {
+            "games": games,
+            "wins": dict(zip(SEATS, self.wins)),
+            "first_mover_win_rate": self.first_mover_wins / games if games else None,
+            "seats": {
+                seat: {
+                    "shots": shots,
+                    "hits": hits,
+                    "hit_ratio": hits / shots if shots else None
+                }
+                for seat, shots, hits in zip(SEATS, self.seat_shots, self.seat_hits)
+            },
+            "game_length": {
+                "mean": lengths.sum / lengths.count if lengths.count else None,
+                # le: null - длиннее последней границы
+                "buckets": buckets
+            },
+            "heatmaps": [self.heatmaps[key].to_json() for key in sorted(self.heatmaps)],
+            "other_boards": self.other_boards
+        }
+
+    def render(self):
+        # Байты ответа /stats; кодируются заново, только если с прошлого
+        # раза закончилась хотя бы одна партия
+        with self.lock:
+            if self.body_games != self.games:
+                self.body = (json.dumps(self.to_json(), separators=(",", ":")) + "\n").encode()
+                self.body_games = self.games
+            return self.body
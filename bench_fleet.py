@@ -0,0 +1,63 @@
+# Сколько стоит случайная расстановка флота (Rules.random_fleet, за ней
+# /random_fleet) и проверка расстановки (Rules.parse_fleet, за ней
+# /place_ships) на полях разного размера: до 32x32 - по таблицам положений
+# и битовым маскам, на больших полях - выборкой по множеству клеток.
+#
+#   python bench_fleet.py
+#   python bench_fleet.py --repeat 20000 --json
+import argparse
+import json
+import random
+import time
+
+from engine import Rules
+
+CLASSIC = (4, 3, 3, 2, 2, 2, 1, 1, 1, 1)
+CASES = (
+    ("10x10, 5x1", Rules()),
+    ("10x10, классика без касаний", Rules(10, 10, CLASSIC, False)),
+    ("30x30, классика x4 без касаний", Rules(30, 30, CLASSIC * 4, False)),
+    ("100x100, классика x10 без касаний", Rules(100, 100, CLASSIC * 10, False)),
+)
+
+
+def measure(rules, repeat, rng):
+    # Средние мкс на расстановку и на её проверку
+    fleets = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fleets.append(rules.random_fleet(rng))
+    generate = time.perf_counter() - started
+    started = time.perf_counter()
+    for ships in fleets:
+        rules.parse_fleet(ships)
+    validate = time.perf_counter() - started
+    return generate / repeat * 1e6, validate / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Случайная расстановка и проверка флота")
+    parser.add_argument("--repeat", type=int, default=5000, help="расстановок на случай")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="вывести итог в JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = []
+    for name, rules in CASES:
+        # Первая расстановка строит таблицы положений, в замер она не входит
+        rules.random_fleet(rng)
+        generate_us, validate_us = measure(rules, args.repeat, rng)
+        rows.append({"case": name, "random_fleet_us": generate_us, "parse_fleet_us": validate_us})
+
+    if args.json:
+        print(json.dumps({"repeat": args.repeat, "cases": rows}, indent=2, ensure_ascii=False))
+        return
+    print(f"{args.repeat} расстановок на случай, среднее на одну")
+    for row in rows:
+        print(f"  {row['case']:<36} расстановка {row['random_fleet_us']:8.1f} мкс, "
+              f"проверка {row['parse_fleet_us']:7.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Время запуска клиентов: сколько занимает импорт client_core, client_cli
+# и client (окно Tk) в свежем интерпретаторе по python -X importtime
+# и не подтянул ли импорт тяжёлые модули (requests, tkinter, numpy).
+# Код выхода 1, если клиент без окна вышел за бюджет - годится для CI.
+#
+#   python bench_import.py
+#   python bench_import.py --budget-ms 10 --repeat 15 --json
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from bench_load import ROOT
+
+MODULES = ("client_core", "client_cli", "client")
+# Модули, без которых клиент без окна должен запускаться
+HEAVY = ("requests", "urllib3", "tkinter", "numpy", "msgpack")
+# Бюджет на импорт клиента без окна, мс
+BUDGET_MS = 20
+# Бюджет проверяется для этих модулей; client всегда тянет tkinter
+HEADLESS = ("client_core", "client_cli")
+
+
+def import_time(module):
+    # Накопленное время импорта модуля, мкс, из вывода -X importtime
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module and not parts[2].startswith("  "):
+            return int(parts[1])
+    raise RuntimeError(f"нет строки importtime для {module}")
+
+
+def loaded_heavy(module):
+    code = (f"import sys, {module}; "
+            f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта клиентов")
+    parser.add_argument("--repeat", type=int, default=9, help="запусков на модуль")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS,
+                        help="бюджет на импорт клиента без окна, мс (медиана)")
+    parser.add_argument("--json", action="store_true", help="вывести итог в JSON")
+    args = parser.parse_args()
+
+    rows = []
+    failed = []
+    for module in MODULES:
+        try:
+            times = [import_time(module) / 1000 for _ in range(args.repeat)]
+        except subprocess.CalledProcessError as error:
+            # client без tkinter в системе не импортируется - это не провал
+            rows.append({"module": module, "error": error.stderr.strip().splitlines()[-1]})
+            continue
+        heavy = loaded_heavy(module)
+        row = {"module": module, "median_ms": statistics.median(times),
+               "min_ms": min(times), "max_ms": max(times), "heavy": heavy}
+        rows.append(row)
+        if module in HEADLESS:
+            if row["median_ms"] > args.budget_ms:
+                failed.append(f"{module}: {row['median_ms']:.1f} мс > {args.budget_ms} мс")
+            if heavy:
+                failed.append(f"{module}: при импорте загружены {', '.join(heavy)}")
+
+    if args.json:
+        print(json.dumps({"budget_ms": args.budget_ms, "modules": rows, "failed": failed},
+                         indent=2, ensure_ascii=False))
+    else:
+        print(f"импорт в свежем интерпретаторе, {args.repeat} запусков, бюджет {args.budget_ms} мс")
+        for row in rows:
+            if "error" in row:
+                print(f"  {row['module']:<12} не импортируется: {row['error']}")
+                continue
+            print(f"  {row['module']:<12} медиана {row['median_ms']:6.1f} мс "
+                  f"(мин {row['min_ms']:.1f}, макс {row['max_ms']:.1f}), "
+                  f"тяжёлые модули: {', '.join(row['heavy']) or 'нет'}")
+        for problem in failed:
+            print(f"  ПРЕВЫШЕНО: {problem}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Нагрузочный тест сервера: запросы в секунду и задержки p50/p99 для /fire и /status.
+#
+#   python bench_load.py --mode both              # поднимет оба сервера по очереди
+#   python bench_load.py --url http://host:5000   # уже запущенный сервер
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SERVERS = {
+    "flask": [
+        sys.executable, "-c",
+        "import server; server.app.run(host='127.0.0.1', port={port}, threaded=True)"
+    ],
+    "async": [
+        sys.executable, "-m", "hypercorn", "server_async:app", "-b", "127.0.0.1:{port}"
+    ],
+}
+# Нагрузка идёт с одного адреса, поэтому ограничения допуска
+# (admission.py) у поднятых бенчмарком серверов отключены
+UNLIMITED = {"BATTLESHIP_IP_RATE": "0", "BATTLESHIP_PLAYER_RATE": "0", "BATTLESHIP_MAX_IN_FLIGHT": "0"}
+# Корабли обоих игроков стоят в ряду J, выстрелы по рядам A-I всегда мимо,
+# поэтому ход переходит от игрока к игроку и партия не заканчивается
+SHIPS = [f"J{n}" for n in range(1, 6)]
+TARGETS = [f"{l}{n}" for l in "ABCDEFGHI" for n in range(1, 11)]
+
+
+class Client:
+    def __init__(self, host, port):
+        self.conn = http.client.HTTPConnection(host, port, timeout=10)
+
+    def call(self, method, path, body=None):
+        headers = {}
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        return response.status, json.loads(response.read())
+
+
+def new_match(client):
+    game_id = client.call("POST", "/games")[1]["game_id"]
+    client.call("POST", f"/games/{game_id}/join")
+    for player in ("player1", "player2"):
+        client.call("POST", "/place_ships", {
+            "game_id": game_id, "player": player, "ships": SHIPS
+        })
+    return game_id
+
+
+def worker(host, port, deadline, stats, errors):
+    client = Client(host, port)
+    fire_times, status_times = [], []
+    try:
+        game_id = new_match(client)
+        shot = 0
+        while time.perf_counter() < deadline:
+            if shot == len(TARGETS):
+                game_id = new_match(client)
+                shot = 0
+            for player in ("player1", "player2"):
+                start = time.perf_counter()
+                code, _ = client.call("POST", "/fire", {
+                    "game_id": game_id, "player": player, "target": TARGETS[shot]
+                })
+                fire_times.append(time.perf_counter() - start)
+                if code != 200:
+                    errors.append(code)
+            shot += 1
+
+            start = time.perf_counter()
+            code, _ = client.call("GET", f"/status?game_id={game_id}")
+            status_times.append(time.perf_counter() - start)
+            if code != 200:
+                errors.append(code)
+    except (OSError, http.client.HTTPException) as e:
+        errors.append(repr(e))
+    stats["fire"].extend(fire_times)
+    stats["status"].extend(status_times)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run(url, concurrency, duration):
+    parts = urlsplit(url)
+    stats = {"fire": [], "status": []}
+    errors = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=worker, args=(parts.hostname, parts.port, deadline, stats, errors))
+        for _ in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = 0
+    for route, times in stats.items():
+        times.sort()
+        total += len(times)
+        print(f"  /{route:<7} {len(times) / elapsed:9.1f} req/s   "
+              f"p50 {percentile(times, 50) * 1000:7.2f} ms   "
+              f"p99 {percentile(times, 99) * 1000:7.2f} ms")
+    print(f"  всего   {total / elapsed:9.1f} req/s, ошибок: {len(errors)}")
+    if errors:
+        print(f"  первая ошибка: {errors[0]}")
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Сервер не поднялся на порту {port}")
+
+
+def run_mode(mode, port, concurrency, duration):
+    command = [part.format(port=port) for part in SERVERS[mode]]
+    process = subprocess.Popen(
+        command, cwd=ROOT, env=dict(os.environ, **UNLIMITED),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_port(port)
+        print(f"{mode}: {concurrency} клиентов, {duration} с")
+        run(f"http://127.0.0.1:{port}", concurrency, duration)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервера морского боя")
+    parser.add_argument("--mode", choices=["flask", "async", "both"], default="both")
+    parser.add_argument("--url", help="адрес уже запущенного сервера")
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    if args.url:
+        print(f"{args.url}: {args.concurrency} клиентов, {args.duration} с")
+        run(args.url, args.concurrency, args.duration)
+        return
+
+    modes = ["flask", "async"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        run_mode(mode, args.port, args.concurrency, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Сравнение JSON и компактного протокола (protocol.py) на типичных
+# сообщениях: размер в байтах, время кодирования на сервере и разбора
+# на клиенте. Партии разыгрываются в процессе, без HTTP.
+#
+#   python bench_protocol.py
+#   python bench_protocol.py --size 1000 --shots 5000 --json
+import argparse
+import json
+import random
+import time
+
+import msgpack
+
+import protocol
+from engine import Rules
+from game import Game
+
+SEATS = ("player1", "player2")
+
+
+def play(rules, shots, seed):
+    # Партия, в которой сделано shots выстрелов (или меньше, если кончилась)
+    rng = random.Random(seed)
+    game = Game("bench", rules=rules)
+    # Game меняется под своим замком, как на сервере
+    game.lock.acquire()
+    for seat in SEATS:
+        ships = rng.sample(range(rules.cells), len(rules.fleet))
+        game.place_ships(seat, [rules.format_cell(cell) for cell in ships])
+    order = {seat: rng.sample(range(rules.cells), rules.cells) for seat in SEATS}
+    fires = []
+    for _ in range(shots):
+        if game.game_over:
+            break
+        seat = game.current_turn
+        target = rules.format_cell(order[seat].pop())
+        result = game.fire(seat, target)
+        fires.append(({"game_id": game.game_id, "player": seat, "target": target,
+                       "since": game.version}, result))
+    return game, fires
+
+
+def messages(game, fires):
+    # (имя, JSON-сообщение, компактное сообщение как объект MessagePack)
+    rules = game.rules
+    command, result = fires[-1]
+    misses = [r for _, r in fires if r["result"] == "Мимо!"] or [result]
+    fire_delta = dict(misses[-1], delta=game.delta(max(0, game.version - 3)))
+    status = game.status()
+    delta = game.delta(max(0, game.version - 10))
+    seat = protocol.SEATS.index(command["player"])
+    cell = rules.parse_cell(command["target"])
+    return [
+        ("fire: запрос", command,
+         [protocol.FIRE, command["game_id"], seat, cell, command["since"]]),
+        ("fire: ответ", misses[-1], protocol.compact_fire(misses[-1], rules)),
+        ("fire: ответ с delta", fire_delta, protocol.compact_fire(fire_delta, rules)),
+        ("status: снимок", status, protocol.compact_status(status, rules)),
+        ("status: 10 событий", delta, protocol.compact_status(delta, rules)),
+    ], {"fire": misses[-1], "status": status}
+
+
+def per_call(fn, seconds):
+    # Среднее время одного вызова, мкс
+    calls = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    batch = 1
+    while elapsed < seconds:
+        for _ in range(batch):
+            fn()
+        calls += batch
+        batch *= 2
+        elapsed = time.perf_counter() - started
+    return elapsed / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON против компактного протокола")
+    parser.add_argument("--size", type=int, default=10, help="сторона квадратного поля")
+    parser.add_argument("--shots", type=int, default=60, help="выстрелов до замера")
+    parser.add_argument("--seconds", type=float, default=0.2, help="время замера одной операции")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="вывести итог в JSON")
+    args = parser.parse_args()
+
+    rules = Rules(args.size, args.size)
+    game, fires = play(rules, args.shots, args.seed)
+    samples, results = messages(game, fires)
+
+    rows = []
+    for name, plain, compact in samples:
+        text = json.dumps(plain).encode()
+        packed = msgpack.packb(compact)
+        rows.append({
+            "message": name,
+            "json_bytes": len(text),
+            "compact_bytes": len(packed),
+            "json_decode_us": per_call(lambda: json.loads(text), args.seconds),
+            "compact_decode_us": per_call(lambda: msgpack.unpackb(packed), args.seconds),
+        })
+    # Кодирование на сервере: JSON из словаря результата против перевода
+    # в массивы с номерами клеток и упаковки в MessagePack
+    for op, result in results.items():
+        row = next(r for r in rows if r["message"] == ("fire: ответ" if op == "fire" else "status: снимок"))
+        row["json_encode_us"] = per_call(lambda: json.dumps(result).encode(), args.seconds)
+        row["compact_encode_us"] = per_call(lambda: protocol.encode(op, result, rules), args.seconds)
+
+    if args.json:
+        print(json.dumps({"size": args.size, "shots": len(fires), "messages": rows}, indent=2,
+                         ensure_ascii=False))
+        return
+
+    print(f"поле {args.size}x{args.size}, выстрелов {len(fires)}, версия партии {game.version}")
+    print(f"{'сообщение':<22}{'JSON, Б':>9}{'MsgPack, Б':>12}{'доля':>7}"
+          f"{'разбор JSON':>13}{'разбор MP':>11}{'код. JSON':>11}{'код. MP':>9}  мкс")
+    for row in rows:
+        encode = ""
+        if "json_encode_us" in row:
+            encode = f"{row['json_encode_us']:>11.2f}{row['compact_encode_us']:>9.2f}"
+        print(f"{row['message']:<22}{row['json_bytes']:>9}{row['compact_bytes']:>12}"
+              f"{row['compact_bytes'] / row['json_bytes']:>7.0%}"
+              f"{row['json_decode_us']:>13.2f}{row['compact_decode_us']:>11.2f}{encode}")
+
+
+if __name__ == "__main__":
+    main()
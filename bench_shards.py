@@ -0,0 +1,119 @@
+# Масштабирование по шардам: поднимает 1, 2, 4 ... процесса сервера
+# с общим кольцом (BATTLESHIP_SHARDS) и гоняет /fire и /status из нескольких
+# процессов нагрузки. Каждый поток нагрузки создаёт партии на своём шарде
+# и дальше ходит прямо к владельцу, как клиент, знающий кольцо (GET /shards).
+# Печатает запросы в секунду и эффективность относительно одного шарда.
+#
+#   python bench_shards.py --shards 1,2,4 --duration 10
+#   python bench_shards.py --mode flask --shards 1,2 --clients 4 --threads 16
+import argparse
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+
+from bench_load import ROOT, SERVERS, UNLIMITED, percentile, wait_for_port, worker
+from sharding import HashRing
+
+
+def load(args):
+    # Один процесс нагрузки: потоки bench_load.worker, поток i - на шарде i % N
+    urls, threads, duration, offset = args
+    stats = {"fire": [], "status": []}
+    errors = []
+    deadline = time.perf_counter() + duration
+    workers = []
+    for i in range(threads):
+        host, port = urls[(offset + i) % len(urls)].rsplit("//", 1)[1].split(":")
+        workers.append(threading.Thread(target=worker, args=(host, int(port), deadline, stats, errors)))
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return len(stats["fire"]), len(stats["status"]), sorted(stats["fire"]), errors[:1], len(errors)
+
+
+def check_ring(urls, samples=10000):
+    # Доля ключей у каждого шарда - насколько ровно кольцо делит партии
+    ring = HashRing(urls)
+    counts = {url: 0 for url in urls}
+    for i in range(samples):
+        counts[ring.owner(f"{i:012x}")] += 1
+    return min(counts.values()) / samples * len(urls), max(counts.values()) / samples * len(urls)
+
+
+def run(mode, shards, clients, threads, duration, base_port):
+    urls = [f"http://127.0.0.1:{base_port + i}" for i in range(shards)]
+    processes = []
+    try:
+        for i, url in enumerate(urls):
+            env = dict(os.environ, BATTLESHIP_SHARDS=",".join(urls), BATTLESHIP_SHARD=url, **UNLIMITED)
+            env.pop("BATTLESHIP_STORE", None)
+            env.pop("BATTLESHIP_REPLAYS", None)
+            command = [part.format(port=base_port + i) for part in SERVERS[mode]]
+            processes.append(subprocess.Popen(
+                command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            ))
+        for i in range(shards):
+            wait_for_port(base_port + i)
+
+        started = time.perf_counter()
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(load, [(urls, threads, duration, c * threads) for c in range(clients)])
+        elapsed = time.perf_counter() - started
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    fires = sum(r[0] for r in results)
+    statuses = sum(r[1] for r in results)
+    fire_times = sorted(t for r in results for t in r[2])
+    errors = sum(r[4] for r in results)
+    first_error = next((r[3][0] for r in results if r[3]), None)
+    return {
+        "shards": shards,
+        "rps": (fires + statuses) / elapsed,
+        "fire_p50_ms": percentile(fire_times, 50) * 1000,
+        "fire_p99_ms": percentile(fire_times, 99) * 1000,
+        "errors": errors,
+        "first_error": first_error,
+    }
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    default = [n for n in (1, 2, 4, 8, 16) if n <= max(1, cpus // 2)] or [1]
+    parser = argparse.ArgumentParser(description="Масштабирование сервера по шардам")
+    parser.add_argument("--mode", choices=sorted(SERVERS), default="async")
+    parser.add_argument("--shards", default=",".join(map(str, default)),
+                        help="сколько шардов поднимать, через запятую")
+    parser.add_argument("--clients", type=int, help="процессов нагрузки (по умолчанию 2 на шард)")
+    parser.add_argument("--threads", type=int, default=8, help="потоков в процессе нагрузки")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=5100, help="порт первого шарда")
+    args = parser.parse_args()
+
+    counts = [int(n) for n in args.shards.split(",")]
+    print(f"{args.mode}: процессоров {cpus}, шардов {counts}, {args.duration} с на замер")
+    if cpus < 2 * max(counts):
+        print("  мало процессоров: шарды и нагрузка делят ядра, рост будет ниже линейного")
+    low, high = check_ring([f"http://127.0.0.1:{args.port + i}" for i in range(max(counts))])
+    print(f"  кольцо: доля партий у шарда от {low:.2f} до {high:.2f} от равной")
+
+    base = None
+    for shards in counts:
+        result = run(args.mode, shards, args.clients or 2 * shards, args.threads,
+                     args.duration, args.port)
+        base = base or result["rps"] / shards
+        print(f"  шардов {shards:>2}: {result['rps']:9.1f} req/s, "
+              f"эффективность {result['rps'] / (base * shards):6.1%}, "
+              f"/fire p50 {result['fire_p50_ms']:.2f} мс, p99 {result['fire_p99_ms']:.2f} мс, "
+              f"ошибок {result['errors']}"
+              + (f" ({result['first_error']})" if result["first_error"] else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# Нагрузочный тест зрителей: N подписчиков /spectate на одной партии,
+# пока два игрока обмениваются выстрелами. Печатает, сколько зрителей
+# подключилось, сколько событий дошло, задержку доставки p50/p99 и память
+# сервера. Медленные зрители (--slow) не читают поток: когда буферы сокетов
+# заполнятся и зритель отстанет больше чем на SPECTATOR_MAX_LAG событий,
+# сервер должен его отключить.
+#
+#   python bench_spectators.py --spectators 10000 --shots 50
+#   python bench_spectators.py --mode flask --spectators 500
+#   python bench_spectators.py --spectators 20 --slow 5 --shots 30000 --interval 0
+import argparse
+import asyncio
+import http.client
+import os
+import re
+import socket
+import time
+from urllib.parse import urlsplit
+
+from bench_load import SERVERS, Client, percentile, wait_for_port
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+EVENT_ID = re.compile(rb"\nid: (\d+)\n|^id: (\d+)\n")
+# Сколько соединений открывать одновременно, чтобы не переполнить backlog
+CONNECT_CONCURRENCY = 200
+# Большое поле: корабли в первой строке, выстрелы по остальным всегда мимо,
+# так что партия не кончается при любом числе выстрелов
+RULES = {"width": 1000, "height": 1000, "fleet": [1] * 5}
+SHIPS = list(range(5))
+
+
+def process_tree(pid):
+    # hypercorn обслуживает запросы в дочернем процессе
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def server_rss_mb(pid):
+    # Память сервера вместе с дочерними процессами; None - нет /proc
+    total = 0
+    try:
+        for member in process_tree(pid):
+            with open(f"/proc/{member}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+    except OSError:
+        return None
+    return total / 1024
+
+
+class Spectator:
+    def __init__(self, slow=False):
+        self.slow = slow
+        self.reader = None
+        self.writer = None
+        self.arrivals = {}
+        self.dropped = False
+        self.closed = False
+
+    async def connect(self, host, port, game_id):
+        if self.slow:
+            # Маленький буфер приёма, чтобы отставание проявилось быстро
+            sock = socket.socket()
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            sock.setblocking(False)
+            await asyncio.get_running_loop().sock_connect(sock, (host, port))
+            self.reader, self.writer = await asyncio.open_connection(sock=sock, limit=4096)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(
+            f"GET /spectate?game_id={game_id} HTTP/1.1\r\nHost: {host}\r\n"
+            f"Accept: text/event-stream\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        if b" 200 " not in head.split(b"\r\n", 1)[0]:
+            raise ConnectionError(head.split(b"\r\n", 1)[0].decode())
+
+    async def read(self):
+        # Разбор по id: без учёта chunked-разметки, она не содержит "id: "
+        tail = b""
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                now = time.perf_counter()
+                data = tail + data
+                for match in EVENT_ID.finditer(data):
+                    version = int(match.group(1) or match.group(2))
+                    self.arrivals.setdefault(version, now)
+                if b"event: dropped" in data:
+                    self.dropped = True
+                tail = data[-32:]
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        self.closed = True
+
+    async def drain_slow(self):
+        # Медленный зритель дочитывает накопленное только в конце теста
+        await self.read()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def open_spectators(host, port, game_id, count, slow):
+    spectators = [Spectator(i < slow) for i in range(count)]
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    failures = []
+
+    async def connect(spectator):
+        async with semaphore:
+            for attempt in range(3):
+                try:
+                    await spectator.connect(host, port, game_id)
+                    return True
+                except OSError as e:
+                    error = e
+                    await asyncio.sleep(0.1 * (attempt + 1))
+            failures.append(repr(error))
+            spectator.close()
+            return False
+
+    results = await asyncio.gather(*[connect(spectator) for spectator in spectators])
+    connected = [s for s, ok in zip(spectators, results) if ok]
+    return connected, failures
+
+
+async def run(url, spectators, slow, shots, interval, pid=None):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port
+    loop = asyncio.get_running_loop()
+
+    # Партия, в которой все выстрелы мимо: ход переходит туда-обратно
+    client = Client(host, port)
+    game_id = client.call("POST", "/games", {"rules": RULES})[1]["game_id"]
+    client.call("POST", f"/games/{game_id}/join")
+    for player in ("player1", "player2"):
+        client.call("POST", "/place_ships", {"game_id": game_id, "player": player, "ships": SHIPS})
+
+    started = time.perf_counter()
+    connected, failures = await open_spectators(host, port, game_id, spectators, slow)
+    connect_seconds = time.perf_counter() - started
+    fast = [s for s in connected if not s.slow]
+    slow_list = [s for s in connected if s.slow]
+    readers = [asyncio.ensure_future(s.read()) for s in fast]
+    print(f"подключено {len(connected)} из {spectators} зрителей за {connect_seconds:.1f} с"
+          + (f", ошибок: {len(failures)} ({failures[0]})" if failures else ""))
+    rss = server_rss_mb(pid) if pid else None
+    if rss:
+        print(f"память сервера с зрителями: {rss:.0f} МБ")
+
+    # Выстрелы делаются в отдельном потоке, чтобы чтение потоков не ждало HTTP.
+    # Соединение новое: прежнее могло закрыться по keep-alive, пока
+    # подключались зрители
+    sent = {}
+    errors = []
+
+    def shoot():
+        shooter = Client(host, port)
+        for shot in range(shots):
+            player = ("player1", "player2")[shot % 2]
+            target = RULES["width"] + shot // 2
+            start = time.perf_counter()
+            try:
+                code, response = shooter.call("POST", "/fire", {
+                    "game_id": game_id, "player": player, "target": target
+                })
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(repr(e))
+                return
+            if code == 200:
+                # Промах даёт два события: shot и turn
+                sent[response["version"] - 1] = start
+                sent[response["version"]] = start
+            time.sleep(interval)
+
+    await loop.run_in_executor(None, shoot)
+    if errors:
+        print(f"ошибка выстрела: {errors[0]}")
+    # Даём последним событиям дойти
+    await asyncio.sleep(max(2.0, interval * 4))
+    for spectator in slow_list:
+        readers.append(asyncio.ensure_future(spectator.drain_slow()))
+    await asyncio.sleep(1.0)
+    for spectator in connected:
+        spectator.close()
+    await asyncio.gather(*readers, return_exceptions=True)
+
+    latencies = []
+    complete = 0
+    for spectator in fast:
+        got = [v for v in sent if v in spectator.arrivals]
+        if len(got) == len(sent):
+            complete += 1
+        latencies.extend(spectator.arrivals[v] - sent[v] for v in got)
+    latencies.sort()
+    expected = len(sent) * len(fast)
+    print(f"событий: {len(sent)}, доставлено {len(latencies)} из {expected}, "
+          f"все события у {complete} из {len(fast)} зрителей")
+    print(f"задержка доставки p50 {percentile(latencies, 50) * 1000:.1f} мс, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} мс, "
+          f"max {(latencies[-1] if latencies else 0) * 1000:.1f} мс")
+    if slow_list:
+        dropped = sum(1 for s in slow_list if s.dropped)
+        print(f"медленных зрителей отключено: {dropped} из {len(slow_list)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест зрителей /spectate")
+    parser.add_argument("--mode", choices=["flask", "async"], default="async")
+    parser.add_argument("--url", help="адрес уже запущенного сервера")
+    parser.add_argument("--port", type=int, default=5078)
+    parser.add_argument("--spectators", type=int, default=10000)
+    parser.add_argument("--slow", type=int, default=0, help="сколько зрителей не читают поток")
+    parser.add_argument("--shots", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.2, help="пауза между выстрелами, с")
+    args = parser.parse_args()
+
+    if args.url:
+        asyncio.run(run(args.url, args.spectators, args.slow, args.shots, args.interval))
+        return
+
+    import subprocess
+
+    command = [part.format(port=args.port) for part in SERVERS[args.mode]]
+    process = subprocess.Popen(
+        command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_port(args.port)
+        print(f"{args.mode}: {args.spectators} зрителей, {args.shots} выстрелов")
+        asyncio.run(run(f"http://127.0.0.1:{args.port}", args.spectators, args.slow,
+                        args.shots, args.interval, process.pid))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Сколько процессорного времени сервер тратит на один опрос /status:
+# без кэша (снимок кодируется заново на каждый запрос, как раньше),
+# с кэшем байтов на версию партии и с If-None-Match (ответ 304).
+# Запросы идут через тестовый клиент Flask в этом же процессе, без сети,
+# поэтому видна именно работа сервера.
+#
+#   python bench_status.py
+#   python bench_status.py --size 30 --shots 400 --requests 5000 --json
+import argparse
+import json
+import os
+import random
+import time
+
+# Бенчмарку не нужны ни журнал ходов, ни архив записей
+os.environ.pop("BATTLESHIP_STORE", None)
+os.environ.pop("BATTLESHIP_REPLAYS", None)
+
+import protocol
+import server
+from admission import Admission
+from engine import Rules
+
+SEATS = ("player1", "player2")
+
+
+def setup(rules, shots, seed):
+    # Партия в реестре сервера, в которой сделано shots выстрелов
+    rng = random.Random(seed)
+    game, _ = server.service.registry.create(None, rules, claim_all=True)
+    with game.lock:
+        for seat in SEATS:
+            ships = rng.sample(range(rules.cells), len(rules.fleet))
+            game.place_ships(seat, [rules.format_cell(cell) for cell in ships])
+        order = {seat: rng.sample(range(rules.cells), rules.cells) for seat in SEATS}
+        for _ in range(shots):
+            if game.game_over:
+                break
+            seat = game.current_turn
+            game.fire(seat, rules.format_cell(order[seat].pop()))
+    return game
+
+
+def measure(client, game, headers, requests, uncached):
+    # Процессорное время на один запрос, мкс; uncached - сбрасывать кэш
+    # перед каждым запросом, то есть кодировать снимок заново
+    url = f"/status?game_id={game.game_id}"
+    expected = 304 if "If-None-Match" in headers else 200
+    sizes = 0
+    started = time.process_time()
+    for _ in range(requests):
+        if uncached:
+            game.status_cache.clear()
+        response = client.get(url, headers=headers)
+        if response.status_code != expected:
+            raise RuntimeError(f"{url}: {response.status_code}, ожидался {expected}")
+        sizes += len(response.data)
+    return (time.process_time() - started) / requests * 1e6, sizes // requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Процессорное время опроса /status")
+    parser.add_argument("--size", type=int, default=10, help="сторона квадратного поля")
+    parser.add_argument("--shots", type=int, default=60, help="выстрелов в партии")
+    parser.add_argument("--requests", type=int, default=3000, help="запросов на замер")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="вывести итог в JSON")
+    args = parser.parse_args()
+
+    rules = Rules(args.size, args.size)
+    # Опрос идёт с одного адреса и упёрся бы в ограничения допуска
+    server.service.limiter = Admission()
+    game = setup(rules, args.shots, args.seed)
+    client = server.app.test_client()
+
+    rows = []
+    for fmt, accept in (("json", "application/json"), ("msgpack", protocol.CONTENT_TYPE)):
+        headers = {"Accept": accept}
+        etag = client.get(f"/status?game_id={game.game_id}", headers=headers).headers["ETag"]
+        # Прогрев: первые запросы платят за импорт и разбор маршрутов
+        measure(client, game, headers, 100, True)
+        plain, size = measure(client, game, headers, args.requests, True)
+        cached, _ = measure(client, game, headers, args.requests, False)
+        not_modified, _ = measure(client, game, dict(headers, **{"If-None-Match": etag}),
+                                  args.requests, False)
+        rows.append({"format": fmt, "bytes": size, "uncached_us": plain,
+                     "cached_us": cached, "not_modified_us": not_modified})
+
+    if args.json:
+        print(json.dumps({"size": args.size, "version": game.version, "results": rows}, indent=2))
+        return
+
+    print(f"поле {args.size}x{args.size}, версия партии {game.version}, "
+          f"{args.requests} запросов на замер, мкс процессора на запрос")
+    print(f"{'формат':<9}{'тело, Б':>9}{'без кэша':>10}{'кэш':>14}{'304':>14}")
+    for row in rows:
+        plain = row["uncached_us"]
+        print(f"{row['format']:<9}{row['bytes']:>9}{plain:>10.1f}"
+              f"{row['cached_us']:>7.1f} ({1 - row['cached_us'] / plain:>4.0%})"
+              f"{row['not_modified_us']:>7.1f} ({1 - row['not_modified_us'] / plain:>4.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+from functools import lru_cache
+
+GRID_SIZE = 10
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+# Самое большое поле, которое разрешено заказать в правилах партии
+MAX_SIDE = 1000
+# До этого числа клеток поле хранится битовыми масками, на больших
+# полях маски становятся длинными и дешевле хранить множества клеток
+BITBOARD_LIMIT = 64 * 64
+# Таблицы всех положений корабля строятся для полей до стольких клеток;
+# на больших полях они заняли бы слишком много памяти
+PLACEMENT_TABLE_LIMIT = 32 * 32
+
+# Клетка кодируется одним числом row * width + col. Буквенные координаты
+# небольших полей разбираются по таблицам, построенным один раз на размер
+# поля: на поле 10x10 клетка "A1" -> 0, "J10" -> 99
+@lru_cache(maxsize=32)
+def coord_tables(width, height):
+    # Таблицы "A1" <-> номер клетки; буквы есть только у полей до 26 строк
+    cell_to_coord = [f"{l}{n}" for l in LETTERS[:height] for n in range(1, width + 1)]
+    coord_to_cell = {coord: cell for cell, coord in enumerate(cell_to_coord)}
+    return cell_to_coord, coord_to_cell
+
+
+CELL_TO_COORD, COORD_TO_CELL = coord_tables(GRID_SIZE, GRID_SIZE)
+
+
+def parse_coord(coord):
+    if not isinstance(coord, str):
+        return None
+    return COORD_TO_CELL.get(coord)
+
+
+def mask_to_cells(mask):
+    cells = []
+    while mask:
+        low = mask & -mask
+        cells.append(low.bit_length() - 1)
+        mask ^= low
+    return cells
+
+
+def mask_to_coords(mask):
+    return [CELL_TO_COORD[cell] for cell in mask_to_cells(mask)]
+
+
+@lru_cache(maxsize=32)
+def neighbour_masks(width, height):
+    # Маска клетки вместе с соседями (и по углам) для каждой клетки поля:
+    # корабль касается другого, если его соседи пересекаются с занятыми
+    masks = []
+    for row in range(height):
+        for col in range(width):
+            mask = 0
+            for r in range(max(row - 1, 0), min(row + 2, height)):
+                for c in range(max(col - 1, 0), min(col + 2, width)):
+                    mask |= 1 << (r * width + c)
+            masks.append(mask)
+    return masks
+
+
+@lru_cache(maxsize=64)
+def placement_table(width, height, size, touching):
+    # Все положения корабля длины size: (маска палуб, маска запретной зоны,
+    # клетки). Зона - палубы, а без касаний ещё и их соседи; положение
+    # свободно, если его зона не пересекается с уже поставленными палубами
+    around = neighbour_masks(width, height) if not touching else None
+    table = []
+    for vertical in ((False, True) if size > 1 else (False,)):
+        step = width if vertical else 1
+        rows = height - size + 1 if vertical else height
+        cols = width if vertical else width - size + 1
+        for row in range(rows):
+            for col in range(cols):
+                start = row * width + col
+                cells = tuple(range(start, start + size * step, step))
+                ship = 0
+                for cell in cells:
+                    ship |= 1 << cell
+                zone = ship
+                if around is not None:
+                    for cell in cells:
+                        zone |= around[cell]
+                table.append((ship, zone, cells))
+    return table
+
+
+class Board:
+    # Корабли, попадания и промахи хранятся как битовые числа,
+    # бит с номером клетки выставлен, если клетка занята/обстреляна.
+    # ship_at - номер корабля по клетке, ship_left - сколько целых
+    # палуб осталось у каждого корабля, чтобы сразу видеть потопление
+    __slots__ = ("ships", "hits", "misses", "ready", "ship_at", "ship_left")
+
+    def __init__(self):
+        self.ships = 0
+        self.hits = 0
+        self.misses = 0
+        self.ready = False
+        self.ship_at = {}
+        self.ship_left = []
+
+    def place(self, ships):
+        # ships - список кораблей, корабль - список номеров клеток
+        mask = 0
+        self.ship_at = {}
+        self.ship_left = []
+        for index, cells in enumerate(ships):
+            for cell in cells:
+                mask |= 1 << cell
+                self.ship_at[cell] = index
+            self.ship_left.append(len(cells))
+        self.ships = mask
+        self.hits = 0
+        self.misses = 0
+
+    def shoot(self, cell):
+        # None - сюда уже стреляли, 0 - промах, 1 - попадание, 2 - корабль потоплен
+        bit = 1 << cell
+        if (self.hits | self.misses) & bit:
+            return None
+        if self.ships & bit:
+            self.hits |= bit
+            return self.hit_ship(cell)
+        self.misses |= bit
+        return 0
+
+    def hit_ship(self, cell):
+        index = self.ship_at[cell]
+        self.ship_left[index] -= 1
+        return 1 if self.ship_left[index] else 2
+
+    def all_sunk(self):
+        return self.ships & ~self.hits == 0
+
+    def ship_cells(self, cell):
+        # Все клетки корабля, которому принадлежит cell
+        index = self.ship_at[cell]
+        return sorted(c for c, i in self.ship_at.items() if i == index)
+
+    def fleet(self):
+        ships = [[] for _ in self.ship_left]
+        for cell, index in self.ship_at.items():
+            ships[index].append(cell)
+        return [sorted(cells) for cells in ships]
+
+    def hit_cells(self):
+        return mask_to_cells(self.hits)
+
+    def miss_cells(self):
+        return mask_to_cells(self.misses)
+
+    def dump(self):
+        return {
+            "ships": self.fleet(),
+            "hits": self.hit_cells(),
+            "misses": self.miss_cells(),
+            "ready": self.ready
+        }
+
+    @classmethod
+    def load(cls, data):
+        board = cls()
+        if isinstance(data, list):
+            # Старый формат снимка: [корабли, попадания, промахи, готовность]
+            # масками поля 10x10, все корабли однопалубные
+            ships, hits, misses, board.ready = data
+            board.place([[cell] for cell in mask_to_cells(ships)])
+            hits, misses = mask_to_cells(hits), mask_to_cells(misses)
+        else:
+            board.place(data["ships"])
+            hits, misses, board.ready = data["hits"], data["misses"], data["ready"]
+        for cell in hits:
+            board.shoot(cell)
+        for cell in misses:
+            board.shoot(cell)
+        return board
+
+
+class SparseBoard(Board):
+    # Поле для больших размеров: память растёт с числом палуб и выстрелов,
+    # а не с площадью поля. Клетки кораблей - ключи ship_at
+    __slots__ = ("remaining",)
+
+    def __init__(self):
+        super().__init__()
+        self.hits = set()
+        self.misses = set()
+        self.remaining = 0
+
+    def place(self, ships):
+        super().place(ships)
+        self.ships = 0
+        self.hits = set()
+        self.misses = set()
+        self.remaining = len(self.ship_at)
+
+    def shoot(self, cell):
+        if cell in self.hits or cell in self.misses:
+            return None
+        if cell in self.ship_at:
+            self.hits.add(cell)
+            self.remaining -= 1
+            return self.hit_ship(cell)
+        self.misses.add(cell)
+        return 0
+
+    def all_sunk(self):
+        return self.remaining == 0
+
+    def hit_cells(self):
+        return sorted(self.hits)
+
+    def miss_cells(self):
+        return sorted(self.misses)
+
+
+def make_board(width, height):
+    if width * height <= BITBOARD_LIMIT:
+        return Board()
+    return SparseBoard()
@@ -0,0 +1,199 @@
+# Проверка входных данных, на которых сервер раньше падал: каждый случай
+# должен давать обычный ответ (200 или 400/409), а не 500 и не исключение.
+# Не-ASCII цифры в since, seed, move, Last-Event-ID и клетках, оборванный
+# хвост журнала ходов и архива записей, пересекающиеся и касающиеся
+# корабли, неверные коды операций компактного протокола, тело JSON не
+# объектом и плотный флот для /random_fleet.
+#
+#   python check_inputs.py
+import os
+import sys
+import tempfile
+
+# Журнал и архив создаются в проверках во временном каталоге
+os.environ.pop("BATTLESHIP_STORE", None)
+os.environ.pop("BATTLESHIP_REPLAYS", None)
+
+import msgpack
+
+import handlers
+import protocol
+import server
+from admission import Admission
+from engine import GameError
+from replay import ReplayArchive
+from store import FileStore
+
+COMPACT = {"Content-Type": protocol.CONTENT_TYPE}
+FIRE_SHIPS = {
+    "player1": ["A1", "C3", "E5", "G7", "J10"],
+    "player2": ["B2", "D4", "F6", "H8", "I9"],
+}
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(("OK      " if ok else "ОШИБКА  ") + name + (f": {detail}" if detail and not ok else ""))
+    if not ok:
+        failures.append(name)
+
+
+def check_status(name, response, expected):
+    check(name, response.status_code == expected, f"ответ {response.status_code}, ожидался {expected}")
+
+
+def new_game(client, rules=None):
+    game_id = client.post("/games", json={"rules": rules} if rules else {}).get_json()["game_id"]
+    client.post(f"/games/{game_id}/join")
+    return game_id
+
+
+def ready_game(client):
+    game_id = new_game(client)
+    for player, ships in FIRE_SHIPS.items():
+        client.post("/place_ships", json={"game_id": game_id, "player": player, "ships": ships})
+    return game_id
+
+
+def play_to_win(client, game_id):
+    # player1 топит все корабли player2 подряд: попадание оставляет ход за ним
+    for target in FIRE_SHIPS["player2"]:
+        client.post("/fire", json={"game_id": game_id, "player": "player1", "target": target})
+
+
+def check_numbers(client):
+    game_id = ready_game(client)
+    check_status("since=² в /status", client.get(f"/status?game_id={game_id}&since=²"), 200)
+    check("Last-Event-ID: ²", handlers.last_event_id({"Last-Event-ID": "²"}, {}) is None)
+    check_status("seed=² в /random_fleet", client.get("/random_fleet?seed=²"), 400)
+    for target in ("²", "A²", "A1²", "١"):
+        response = client.post("/fire", json={"game_id": game_id, "player": "player1", "target": target})
+        check_status(f"клетка {target!r} в /fire", response, 400)
+
+
+def check_replay_args(client, directory):
+    server.service.replays = archive = ReplayArchive(os.path.join(directory, "replays.bin"))
+    server.service.registry.listeners.append(archive.on_event)
+    try:
+        play_to_win(client, ready_game(client))
+        number = server.service.list_replays({})["replays"][0]["replay"]
+        check_status("move=² в /replay", client.get(f"/replay/{number}?move=²"), 400)
+        check_status("limit=² в /replay", client.get(f"/replay/{number}?limit=²"), 400)
+    finally:
+        server.service.registry.listeners.remove(archive.on_event)
+        server.service.replays = None
+
+
+def check_placement(client):
+    game_id = new_game(client, {"touching": False})
+    cases = [
+        ("пересекающиеся корабли", game_id, ["A1", "A1", "C3", "E5", "G7"]),
+        ("касающиеся корабли", game_id, ["A1", "B2", "E5", "G7", "J10"]),
+    ]
+    # На больших полях проверка идёт без битовых масок
+    big_id = new_game(client, {"width": 40, "height": 40, "touching": False})
+    cases += [
+        ("пересекающиеся корабли 40x40", big_id, [1, 1, 100, 200, 300]),
+        ("касающиеся корабли 40x40", big_id, [1, 41, 100, 200, 300]),
+    ]
+    for name, target_game, ships in cases:
+        response = client.post("/place_ships", json={"game_id": target_game, "player": "player1", "ships": ships})
+        check_status(name, response, 400)
+
+
+def check_compact(client):
+    game_id = ready_game(client)
+    commands = [
+        ("команда [[1]]", [[1]]),
+        ("код операции строкой", ["fire", game_id, 0, 0, None]),
+        ("код операции true", [True, game_id, 0, 0, None]),
+        ("неизвестный код операции", [99, game_id]),
+    ]
+    for name, command in commands:
+        check_status(f"{name} в /fire", client.post("/fire", data=msgpack.packb(command), headers=COMPACT), 400)
+    check_status("не MessagePack в /fire", client.post("/fire", data=b"\xc1", headers=COMPACT), 400)
+    # То же по WebSocket: сообщение [seq, op, ...] даёт GameError, а не исключение
+    messages = [(name, msgpack.packb([1, *command])) for name, command in commands]
+    for name, message in messages + [("не MessagePack", b"\xc1"), ("сообщение без команды", msgpack.packb([1]))]:
+        try:
+            protocol.decode_message(message)
+            check(f"{name} по WebSocket", False, "сообщение принято")
+        except GameError as error:
+            check(f"{name} по WebSocket", error.status == 400, f"ответ {error.status}")
+    check_status("тело JSON - не объект", client.post("/fire", json=[1]), 400)
+
+
+def check_wal_tail(directory):
+    path = os.path.join(directory, "games")
+    store = FileStore(path)
+    store.load()
+    store.append({"op": "create", "game_id": "g1", "player": "player1"})
+    store.append({"op": "join", "game_id": "g1", "player": "player2"})
+    store.sync()
+    store.close()
+    with open(path + ".log", "ab") as f:
+        f.write('3 {"op":"join","game_id":"g'.encode("utf-8"))
+    size = os.path.getsize(path + ".log")
+
+    store = FileStore(path)
+    games = store.load()
+    check("оборванный хвост журнала", [data["game_id"] for data in games] == ["g1"], f"партии {games}")
+    check("хвост журнала обрезан", os.path.getsize(path + ".log") < size)
+    store.append({"op": "restart", "game_id": "g1"})
+    store.sync()
+    store.close()
+    store = FileStore(path)
+    check("журнал дописывается после обрезки", len(store.load()) == 1)
+    store.close()
+
+
+def check_replay_tail(client, directory):
+    path = os.path.join(directory, "tail.bin")
+    archive = ReplayArchive(path)
+    server.service.registry.listeners.append(archive.on_event)
+    try:
+        play_to_win(client, ready_game(client))
+    finally:
+        server.service.registry.listeners.remove(archive.on_event)
+    archive.file.close()
+    with open(path, "rb") as f:
+        record = f.read()
+    with open(path, "ab") as f:
+        f.write(record[:len(record) // 2])
+
+    archive = ReplayArchive(path)
+    check("оборванный хвост архива", len(archive.offsets) == 1 and os.path.getsize(path) == len(record),
+          f"записей {len(archive.offsets)}, размер {os.path.getsize(path)}")
+    try:
+        check("запись перед хвостом читается", archive.get(0).to_json()["moves"] > 0)
+    except GameError as error:
+        check("запись перед хвостом читается", False, str(error))
+    archive.file.close()
+
+
+def check_dense_fleet(client):
+    rules = {"width": 20, "height": 20, "fleet": [1] * 100, "touching": False}
+    game_id = new_game(client, rules)
+    check_status("плотный флот в /random_fleet", client.get(f"/random_fleet?game_id={game_id}"), 200)
+
+
+def main():
+    # Все запросы идут с одного адреса: ограничения допуска не нужны
+    server.service.limiter = Admission()
+    client = server.app.test_client()
+    with tempfile.TemporaryDirectory() as directory:
+        check_numbers(client)
+        check_replay_args(client, directory)
+        check_placement(client)
+        check_compact(client)
+        check_wal_tail(directory)
+        check_replay_tail(client, directory)
+        check_dense_fleet(client)
+    if failures:
+        print(f"ОШИБКА: не прошли {len(failures)} проверок")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
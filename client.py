@@ -1,21 +1,20 @@
 import tkinter as tk
-from tkinter import messagebox, font
+from tkinter import messagebox
+import os
 import string
-import requests
 import time
-from threading import Thread, Event
-from math import sin, cos, radians
+import queue
+from threading import Thread, Event, Lock
+
+from client_core import (
+    DEFAULT_RULES, GRID_SIZE, GameClient, coord_to_cell, new_session, request_errors
+)
 
-SERVER_URL = " " 
-GRID_SIZE = 10
 CELL_SIZE = 50
-SHIP_TYPES = {
-    "ship1": 1,
-    "ship2": 1,
-    "ship3": 1,
-    "ship4": 1,
-    "ship5": 1
-}
+# Поле рисуется в квадрате этого размера, на больших полях клетки мельче
+BOARD_PIXELS = GRID_SIZE * CELL_SIZE
+# Клиент показывает поля с буквенными координатами, то есть до 26 строк
+MAX_GUI_SIDE = 26
 
 # Цветовая схема
 OCEAN_COLOR = "#006994"
@@ -34,35 +33,284 @@ TEXT_COLOR = "#ffffff"
 BG_COLOR = "#1e1e2e"
 BTN_COLOR = "#3b3b4f"
 
-class BattleshipApp:
+# Период опроса билета подбора соперника, мс
+MATCHMAKING_POLL_MS = 1000
+
+def cell_size(rules):
+    return min(CELL_SIZE, BOARD_PIXELS // max(rules["width"], rules["height"]))
+
+class BoardView:
+    # Поле в retained-режиме: сетка и подписи рисуются один раз,
+    # для каждой клетки запоминаются id её элементов на холсте,
+    # а при обновлении перерисовываются только изменившиеся клетки
+    def __init__(self, canvas, width=GRID_SIZE, height=GRID_SIZE, size=CELL_SIZE):
+        self.canvas = canvas
+        self.width = width
+        self.height = height
+        self.size = size
+        self.states = {}
+        self.items = {}
+        self.draw_static()
+
+    def draw_static(self):
+        size = self.size
+        for i in range(self.height+1):
+            self.canvas.create_line(
+                0, i*size, self.width*size, i*size,
+                fill=GRID_COLOR, width=1
+            )
+        for i in range(self.width+1):
+            self.canvas.create_line(
+                i*size, 0, i*size, self.height*size,
+                fill=GRID_COLOR, width=1
+            )
+        for i in range(self.height):
+            self.canvas.create_text(
+                5, i * size + size // 2,
+                text=string.ascii_uppercase[i], anchor="w", fill="white",
+                tags="label"
+            )
+        for i in range(self.width):
+            self.canvas.create_text(
+                i * size + size // 2, 5,
+                text=str(i+1), anchor="n", fill="white", tags="label"
+            )
+
+    def update(self, states):
+        changed = 0
+        for coord in self.states.keys() - states.keys():
+            self.clear_cell(coord)
+            changed += 1
+        for coord, state in states.items():
+            if self.states.get(coord) != state:
+                self.clear_cell(coord)
+                self.draw_cell(coord, state)
+                changed += 1
+        self.states = dict(states)
+        if changed:
+            # Подписи координат остаются поверх кораблей и выстрелов
+            self.canvas.tag_raise("label")
+        return changed
+
+    def clear_cell(self, coord):
+        for item in self.items.pop(coord, ()):
+            self.canvas.delete(item)
+
+    def draw_cell(self, coord, state):
+        ship_color, shot = state
+        row, col = coord_to_cell(coord)
+        size = self.size
+        pad = max(1, size // 10)
+        x1 = col * size
+        y1 = row * size
+        items = []
+
+        if ship_color:
+            items.append(self.canvas.create_rectangle(
+                x1, y1, x1 + size, y1 + size,
+                fill=ship_color, outline="#1e3f1a", width=2
+            ))
+        if shot == "hit":
+            items.append(self.canvas.create_oval(
+                x1 + pad, y1 + pad, x1 + size - pad, y1 + size - pad,
+                fill=HIT_COLOR, outline="orange", width=2
+            ))
+        elif shot == "miss":
+            items.append(self.canvas.create_oval(
+                x1 + pad, y1 + pad, x1 + size - pad, y1 + size - pad,
+                outline=MISS_COLOR, width=2
+            ))
+        self.items[coord] = items
+
+class FrameStats:
+    # Счётчик времени кадра и задержки главного цикла Tk.
+    # Показывается внизу окна, если задана переменная BATTLESHIP_FRAME_STATS
+    HEARTBEAT_MS = 250
+
+    def __init__(self, master):
+        self.master = master
+        self.enabled = bool(os.environ.get("BATTLESHIP_FRAME_STATS"))
+        self.frames = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.total_ms = 0.0
+        self.cells = 0
+        self.loop_lag_ms = 0.0
+        self.label = None
+        self.expected = time.perf_counter()
+        self.master.after(self.HEARTBEAT_MS, self.heartbeat)
+
+    def attach(self):
+        if self.enabled:
+            self.label = tk.Label(
+                self.master, text="", font=("Courier", 9),
+                fg="#888888", bg=BG_COLOR
+            )
+            self.label.pack(side="bottom", anchor="e")
+
+    def record_frame(self, seconds, cells):
+        ms = seconds * 1000
+        self.frames += 1
+        self.last_ms = ms
+        self.max_ms = max(self.max_ms, ms)
+        self.total_ms += ms
+        self.cells += cells
+
+    def heartbeat(self):
+        # Насколько позже запланированного сработал таймер - мера отзывчивости
+        now = time.perf_counter()
+        lag = max(0.0, (now - self.expected) * 1000 - self.HEARTBEAT_MS)
+        self.loop_lag_ms = lag
+        self.expected = now
+        if self.label is not None and self.label.winfo_exists():
+            avg = self.total_ms / self.frames if self.frames else 0.0
+            self.label.config(text=(
+                f"кадров: {self.frames}  кадр: {self.last_ms:.2f} мс "
+                f"(ср. {avg:.2f}, макс {self.max_ms:.2f})  "
+                f"клеток перерисовано: {self.cells}  задержка цикла: {lag:.1f} мс"
+            ))
+        self.master.after(self.HEARTBEAT_MS, self.heartbeat)
+
+class NetworkJob:
+    __slots__ = ("request", "on_success", "on_error", "key", "generation",
+                 "started", "cancelled")
+
+    def __init__(self, request, on_success, on_error, key, generation):
+        self.request = request
+        self.on_success = on_success
+        self.on_error = on_error
+        self.key = key
+        self.generation = generation
+        self.started = False
+        self.cancelled = False
+
+class NetworkWorker:
+    # Сетевые запросы вне главного потока Tk. Пул потоков, у каждого своя
+    # requests.Session с keep-alive; результаты возвращаются в Tk через
+    # очередь, которую главный цикл разбирает по таймеру.
+    #
+    # Запросы с одинаковым key схлопываются: пока запрос ждёт в очереди,
+    # новый заменяет его, а ответы, обогнанные более новым запросом с тем
+    # же key, отбрасываются.
+    DRAIN_MS = 20
+
+    def __init__(self, master, workers=2):
+        self.master = master
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = Lock()
+        self.queued = {}
+        self.generations = {}
+        self.sessions = []
+        self.running = True
+        self.threads = [Thread(target=self.run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+        self.master.after(self.DRAIN_MS, self.drain)
+
+    def submit(self, request, on_success=None, on_error=None, key=None):
+        with self.lock:
+            generation = self.generations.get(key, 0) + 1
+            self.generations[key] = generation
+            job = self.queued.get(key) if key is not None else None
+            if job is not None and not job.started:
+                job.request = request
+                job.on_success = on_success
+                job.on_error = on_error
+                job.generation = generation
+                return
+            job = NetworkJob(request, on_success, on_error, key, generation)
+            if key is not None:
+                self.queued[key] = job
+        self.jobs.put(job)
+
+    def deliver(self, callback, *args):
+        # Передать вызов в поток Tk из любого другого потока
+        self.results.put((None, callback, args))
+
+    def run(self):
+        # requests импортируется здесь, в фоновом потоке, а не при запуске окна
+        session = new_session()
+        errors = request_errors()
+        with self.lock:
+            self.sessions.append(session)
+        while self.running:
+            job = self.jobs.get()
+            if job is None:
+                break
+            with self.lock:
+                job.started = True
+                if self.queued.get(job.key) is job:
+                    del self.queued[job.key]
+                request = job.request
+            if job.cancelled:
+                continue
+            try:
+                self.results.put((job, job.on_success, (request(session),)))
+            except errors as error:
+                self.results.put((job, job.on_error, (error,)))
+        session.close()
+
+    def drain(self):
+        if not self.running:
+            return
+        while True:
+            try:
+                job, callback, args = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                if job.cancelled:
+                    continue
+                if job.key is not None and job.generation != self.generations.get(job.key):
+                    # Устаревший ответ: после него уже отправлен новый запрос
+                    continue
+            if callback is not None:
+                callback(*args)
+        self.master.after(self.DRAIN_MS, self.drain)
+
+    def close(self):
+        self.running = False
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job.cancelled = True
+        for _ in self.threads:
+            self.jobs.put(None)
+        # Закрытие сессий обрывает соединения запросов, которые уже в пути
+        with self.lock:
+            for session in self.sessions:
+                session.close()
+
+class BattleshipApp(GameClient):
+    # Окно Tk поверх GameClient (client_core.py): состояние партии и сервер
+    # там, здесь - поля, кнопки и расстановка кораблей мышью
     def __init__(self, master):
+        GameClient.__init__(self)
         self.master = master
         self.setup_window()
         self.init_game_state()
         self.init_ships()
         self.setup_widgets()
+        self.net = NetworkWorker(self.master)
+        self.frame_stats = FrameStats(self.master)
         self.create_menu()
         self.start_polling_thread()
 
     def setup_window(self):
-        self.master.title("Морской Бой - 5 кораблей")
+        self.master.title("Морской Бой")
         self.master.geometry("1100x800")
         self.master.resizable(False, False)
         self.master.configure(bg=BG_COLOR)
         self.master.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def init_game_state(self):
-        self.player = None
+        GameClient.init_game_state(self)
         self.ships = []
-        self.hits_on_me = []
-        self.misses_on_me = []
-        self.my_hits = []
-        self.my_misses = []
-        self.turn = None
-        self.game_over = False
-        self.placing_ships = True
-        self.opponent_ready = False
-        self.running = True
+        self.fire_pending = False
         self.poll_event = Event()
         self.selected_ship = None
         self.ship_orientation = "horizontal"
@@ -70,10 +318,12 @@ class BattleshipApp:
         self.drag_start_pos = None
 
     def init_ships(self):
+        # Флот берётся из правил партии, большие корабли ставятся первыми
         self.ships = []
-        for ship_type, size in SHIP_TYPES.items():
+        fleet = sorted(self.rules["fleet"], reverse=True)
+        for number, size in enumerate(fleet, 1):
             self.ships.append({
-                "type": ship_type,
+                "type": f"ship{number}",
                 "size": size,
                 "coords": [],
                 "hits": []
@@ -91,8 +341,11 @@ class BattleshipApp:
         )
         self.my_canvas = None
         self.enemy_canvas = None
+        self.my_view = None
+        self.enemy_view = None
         self.start_button = None
         self.rotate_button = None
+        self.random_button = None
 
     def create_menu(self):
         self.clear_screen()
@@ -105,48 +358,187 @@ class BattleshipApp:
         ).pack(pady=20)
 
         tk.Label(
-            self.master, text="Выберите игрока:", 
+            self.master, text="Код игры:", 
             font=("Arial", 14), 
             fg=TEXT_COLOR, bg=BG_COLOR
         ).pack(pady=10)
 
+        self.game_id_entry = tk.Entry(
+            self.master, font=("Arial", 14), width=20, justify="center"
+        )
+        self.game_id_entry.pack(pady=5)
+
         btn_frame = tk.Frame(self.master, bg=BG_COLOR)
         btn_frame.pack(pady=10)
 
         tk.Button(
-            btn_frame, text="Player 1", 
-            command=lambda: self.set_player("player1"), 
+            btn_frame, text="Создать игру", 
+            command=self.create_game, 
             width=15, height=2, bg=BTN_COLOR,
             fg=TEXT_COLOR, font=("Arial", 12)
         ).grid(row=0, column=0, padx=10)
 
         tk.Button(
-            btn_frame, text="Player 2", 
-            command=lambda: self.set_player("player2"), 
+            btn_frame, text="Присоединиться", 
+            command=self.join_game, 
             width=15, height=2, bg=BTN_COLOR,
             fg=TEXT_COLOR, font=("Arial", 12)
         ).grid(row=0, column=1, padx=10)
 
-    def set_player(self, player):
-        self.player = player
-        self.ask_restart()
+        # Подбор соперника: сервер сам создаст партию и выдаст место
+        tk.Label(
+            self.master, text="Имя игрока:", 
+            font=("Arial", 14), 
+            fg=TEXT_COLOR, bg=BG_COLOR
+        ).pack(pady=10)
 
-    def ask_restart(self):
-        if messagebox.askyesno("Рестарт", "Начать новую игру?"):
-            try:
-                response = requests.post(f"{SERVER_URL}/restart", timeout=3)
-                if response.status_code == 200:
-                    requests.post(
-                        f"{SERVER_URL}/reset_ready", 
-                        json={"player": self.player},
-                        timeout=3
-                    )
-            except requests.exceptions.RequestException:
-                messagebox.showerror("Ошибка", "Не удалось подключиться к серверу.")
+        self.name_entry = tk.Entry(
+            self.master, font=("Arial", 14), width=20, justify="center"
+        )
+        self.name_entry.pack(pady=5)
+
+        search_frame = tk.Frame(self.master, bg=BG_COLOR)
+        search_frame.pack(pady=10)
+
+        tk.Button(
+            search_frame, text="Найти соперника", 
+            command=self.find_opponent, 
+            width=15, height=2, bg=BTN_COLOR,
+            fg=TEXT_COLOR, font=("Arial", 12)
+        ).grid(row=0, column=0, padx=10)
+
+        tk.Button(
+            search_frame, text="Отменить поиск", 
+            command=self.cancel_search, 
+            width=15, height=2, bg=BTN_COLOR,
+            fg=TEXT_COLOR, font=("Arial", 12)
+        ).grid(row=0, column=1, padx=10)
+
+    def find_opponent(self):
+        name = self.name_entry.get().strip()
+        if not name:
+            messagebox.showwarning("Ошибка", "Введите имя игрока!")
+            return
+        if self.ticket:
+            return
+
+        self.net.submit(
+            lambda session: self.api.enqueue(session, name),
+            on_success=self.on_ticket,
+            on_error=self.show_server_unavailable
+        )
+
+    def on_ticket(self, response):
+        if "error" in response:
+            self.ticket = None
+            messagebox.showerror("Ошибка", response["error"])
+            return
+
+        if response["status"] == "matched":
+            self.ticket = None
+            if not self.set_rules(response):
                 return
+            self.enter_game(response)
+            self.draw_fields()
+            return
+
+        self.ticket = response["ticket"]
+        self.status_label.config(
+            text=f"Поиск соперника (рейтинг {response['rating']})... "
+                 f"{response['wait_seconds']:.0f} с"
+        )
+        self.master.after(MATCHMAKING_POLL_MS, self.poll_ticket)
+
+    def poll_ticket(self):
+        ticket = self.ticket
+        if not ticket:
+            return
+
+        def on_success(response):
+            # Поиск могли отменить, пока запрос был в пути
+            if self.ticket == ticket:
+                self.on_ticket(response)
+
+        self.net.submit(
+            lambda session: self.api.poll_ticket(session, ticket),
+            on_success=on_success,
+            on_error=lambda error: self.master.after(MATCHMAKING_POLL_MS, self.poll_ticket),
+            key="matchmaking"
+        )
+
+    def cancel_search(self):
+        ticket, self.ticket = self.ticket, None
+        if not ticket:
+            return
+        self.status_label.config(text="Поиск отменён")
+        self.net.submit(lambda session: self.api.cancel_ticket(session, ticket))
+
+    def create_game(self):
+        self.net.submit(
+            self.api.create_game,
+            on_success=self.on_game_created,
+            on_error=self.show_server_unavailable
+        )
+
+    def on_game_created(self, response):
+        if "error" in response:
+            messagebox.showerror("Ошибка", response["error"])
+            return
+
+        if not self.set_rules(response):
+            return
+        self.enter_game(response)
         self.draw_fields()
 
+    def join_game(self):
+        game_id = self.game_id_entry.get().strip()
+        if not game_id:
+            messagebox.showwarning("Ошибка", "Введите код игры!")
+            return
+
+        self.net.submit(
+            lambda session: self.api.join_game(session, game_id),
+            on_success=self.on_game_joined,
+            on_error=self.show_server_unavailable
+        )
+
+    def on_game_joined(self, response):
+        if "error" in response:
+            messagebox.showerror("Ошибка", response["error"])
+            return
+
+        if not self.set_rules(response):
+            return
+        self.enter_game(response)
+        self.ask_restart()
+
+    def set_rules(self, response):
+        rules = response.get("rules", DEFAULT_RULES)
+        if max(rules["width"], rules["height"]) > MAX_GUI_SIDE:
+            messagebox.showerror(
+                "Ошибка", f"Клиент показывает поля не больше {MAX_GUI_SIDE}x{MAX_GUI_SIDE}"
+            )
+            return False
+        self.rules = rules
+        return True
+
+    def show_server_unavailable(self, error=None):
+        messagebox.showerror("Ошибка", "Не удалось подключиться к серверу.")
+
+    def ask_restart(self):
+        if not messagebox.askyesno("Рестарт", "Начать новую игру?"):
+            self.draw_fields()
+            return
+
+        game_id, player = self.game_id, self.player
+        self.net.submit(
+            lambda session: self.api.restart(session, game_id, player),
+            on_success=lambda result: self.draw_fields(),
+            on_error=self.show_server_unavailable
+        )
+
     def draw_fields(self):
+        self.master.title(f"Морской Бой - игра {self.game_id}")
         self.clear_screen()
         self.init_ships()
         self.status_label.pack(pady=10)
@@ -173,12 +565,15 @@ class BattleshipApp:
         ).pack()
 
         self.my_canvas = tk.Canvas(
-            player_frame, width=CELL_SIZE*GRID_SIZE, 
-            height=CELL_SIZE*GRID_SIZE, bg=OCEAN_COLOR,
+            player_frame, width=cell_size(self.rules)*self.rules["width"], 
+            height=cell_size(self.rules)*self.rules["height"], bg=OCEAN_COLOR,
             highlightthickness=0
         )
         self.my_canvas.pack(pady=10)
         self.my_canvas.bind("<Button-1>", self.on_my_canvas_click)
+        self.my_view = BoardView(
+            self.my_canvas, self.rules["width"], self.rules["height"], cell_size(self.rules)
+        )
 
     def create_enemy_board(self, parent):
         enemy_frame = tk.Frame(parent, bg=BG_COLOR)
@@ -191,12 +586,15 @@ class BattleshipApp:
         ).pack()
 
         self.enemy_canvas = tk.Canvas(
-            enemy_frame, width=CELL_SIZE*GRID_SIZE, 
-            height=CELL_SIZE*GRID_SIZE, bg=OCEAN_COLOR,
+            enemy_frame, width=cell_size(self.rules)*self.rules["width"], 
+            height=cell_size(self.rules)*self.rules["height"], bg=OCEAN_COLOR,
             highlightthickness=0
         )
         self.enemy_canvas.pack(pady=10)
         self.enemy_canvas.bind("<Button-1>", self.on_enemy_canvas_click)
+        self.enemy_view = BoardView(
+            self.enemy_canvas, self.rules["width"], self.rules["height"], cell_size(self.rules)
+        )
 
     def create_control_buttons(self):
         btn_frame = tk.Frame(self.master, bg=BG_COLOR)
@@ -211,235 +609,269 @@ class BattleshipApp:
             )
             self.start_button.pack()
 
-    def draw_ship(self, canvas, ship):
-        ship_type = ship["type"]
-        coord = ship["coords"][0] if ship["coords"] else None
-        
-        if coord:
-            row = string.ascii_uppercase.index(coord[0])
-            col = int(coord[1:]) - 1
-            
-            x1 = col * CELL_SIZE
-            y1 = row * CELL_SIZE
-            x2 = x1 + CELL_SIZE
-            y2 = y1 + CELL_SIZE
-            
-            fill_color = SHIP_COLORS.get(ship_type, "#4a6741")
-            if coord in ship.get("hits", []):
-                fill_color = HIT_COLOR
-                
-            canvas.create_rectangle(
-                x1, y1, x2, y2,
-                fill=fill_color, outline="#1e3f1a",
-                width=2, tags="ship"
+            self.random_button = tk.Button(
+                btn_frame, text="Расставить случайно",
+                command=self.random_placement, width=25,
+                height=1, bg=BTN_COLOR, fg=TEXT_COLOR,
+                font=("Arial", 10)
             )
+            self.random_button.pack(pady=5)
+
+            # Поворот нужен только кораблям длиннее одной клетки
+            if max(self.rules["fleet"]) > 1:
+                self.rotate_button = tk.Button(
+                    btn_frame, text="Повернуть: горизонтально",
+                    command=self.rotate_ship, width=25,
+                    height=1, bg=BTN_COLOR, fg=TEXT_COLOR,
+                    font=("Arial", 10)
+                )
+                self.rotate_button.pack(pady=5)
+
+    def rotate_ship(self):
+        if self.ship_orientation == "horizontal":
+            self.ship_orientation = "vertical"
+            text = "Повернуть: вертикально"
+        else:
+            self.ship_orientation = "horizontal"
+            text = "Повернуть: горизонтально"
+        if self.rotate_button:
+            self.rotate_button.config(text=text)
 
     def draw_grids(self):
-        if not self.my_canvas or not self.enemy_canvas:
+        if not self.my_view or not self.enemy_view:
             return
-            
-        self.my_canvas.delete("all")
-        self.enemy_canvas.delete("all")
-        
-        # Рисуем сетку
-        for i in range(GRID_SIZE+1):
-            self.my_canvas.create_line(
-                0, i*CELL_SIZE, GRID_SIZE*CELL_SIZE, i*CELL_SIZE,
-                fill=GRID_COLOR, width=1
-            )
-            self.my_canvas.create_line(
-                i*CELL_SIZE, 0, i*CELL_SIZE, GRID_SIZE*CELL_SIZE,
-                fill=GRID_COLOR, width=1
-            )
-            self.enemy_canvas.create_line(
-                0, i*CELL_SIZE, GRID_SIZE*CELL_SIZE, i*CELL_SIZE,
-                fill=GRID_COLOR, width=1
-            )
-            self.enemy_canvas.create_line(
-                i*CELL_SIZE, 0, i*CELL_SIZE, GRID_SIZE*CELL_SIZE,
-                fill=GRID_COLOR, width=1
-            )
-        
-        # Рисуем корабли
-        for ship in self.ships:
-            self.draw_ship(self.my_canvas, ship)
-        
-        # Рисуем выстрелы
-        self.draw_shots(self.my_canvas, is_player=True)
-        self.draw_shots(self.enemy_canvas, is_player=False)
-        
-        # Подписи координат
-        self.add_coordinate_labels()
 
-    def draw_shots(self, canvas, is_player):
-        shots = self.hits_on_me + self.misses_on_me if is_player else self.my_hits + self.my_misses
-        hits = self.hits_on_me if is_player else self.my_hits
-        
-        for coord in shots:
-            row = string.ascii_uppercase.index(coord[0])
-            col = int(coord[1:]) - 1
-            x1 = col * CELL_SIZE + 5
-            y1 = row * CELL_SIZE + 5
-            x2 = (col+1) * CELL_SIZE - 5
-            y2 = (row+1) * CELL_SIZE - 5
-            
-            if coord in hits:
-                canvas.create_oval(
-                    x1, y1, x2, y2,
-                    fill=HIT_COLOR, outline="orange", width=2
-                )
-            else:
-                canvas.create_oval(x1, y1, x2, y2, outline=MISS_COLOR, width=2)
-
-    def add_coordinate_labels(self):
-        for i in range(GRID_SIZE):
-            self.my_canvas.create_text(
-                5, i * CELL_SIZE + CELL_SIZE // 2,
-                text=string.ascii_uppercase[i], anchor="w", fill="white"
-            )
-            self.enemy_canvas.create_text(
-                5, i * CELL_SIZE + CELL_SIZE // 2,
-                text=string.ascii_uppercase[i], anchor="w", fill="white"
-            )
-            self.my_canvas.create_text(
-                i * CELL_SIZE + CELL_SIZE // 2, 5,
-                text=str(i+1), anchor="n", fill="white"
-            )
-            self.enemy_canvas.create_text(
-                i * CELL_SIZE + CELL_SIZE // 2, 5,
-                text=str(i+1), anchor="n", fill="white"
-            )
+        started = time.perf_counter()
+        changed = self.my_view.update(self.my_cell_states())
+        changed += self.enemy_view.update(self.enemy_cell_states())
+        self.frame_stats.record_frame(time.perf_counter() - started, changed)
+
+    def my_cell_states(self):
+        # Состояние клетки: (цвет корабля или None, "hit"/"miss"/None)
+        states = {}
+        for ship in self.ships:
+            for coord in ship["coords"]:
+                color = SHIP_COLORS.get(ship["type"], "#4a6741")
+                if coord in ship.get("hits", []):
+                    color = HIT_COLOR
+                states[coord] = (color, None)
+        for coord in self.hits_on_me:
+            states[coord] = (states.get(coord, (None, None))[0], "hit")
+        for coord in self.misses_on_me:
+            states[coord] = (states.get(coord, (None, None))[0], "miss")
+        return states
+
+    def enemy_cell_states(self):
+        states = {coord: (None, "hit") for coord in self.my_hits}
+        for coord in self.my_misses:
+            states[coord] = (None, "miss")
+        return states
+
+    def event_cell(self, event):
+        size = cell_size(self.rules)
+        row, col = event.y // size, event.x // size
+        if 0 <= row < self.rules["height"] and 0 <= col < self.rules["width"]:
+            return row, col
+        return None
 
     def on_my_canvas_click(self, event):
         if not self.placing_ships:
             return
             
-        col = event.x // CELL_SIZE
-        row = event.y // CELL_SIZE
-        
-        if 0 <= row < GRID_SIZE and 0 <= col < GRID_SIZE:
-            coord = f"{string.ascii_uppercase[row]}{col+1}"
-            self.place_ship(coord)
+        cell = self.event_cell(event)
+        if cell:
+            self.place_ship(*cell)
 
-    def place_ship(self, coord):
-        # Находим первый корабль без координат
+    def place_ship(self, row, col):
+        # Находим первый корабль без координат и ставим его от клетки
+        # вправо или вниз, в зависимости от выбранной ориентации
         for ship in self.ships:
             if not ship["coords"]:
-                # Проверяем, что клетка свободна
-                for other_ship in self.ships:
-                    if coord in other_ship["coords"]:
+                dr, dc = (0, 1) if self.ship_orientation == "horizontal" else (1, 0)
+                cells = [(row + dr * i, col + dc * i) for i in range(ship["size"])]
+                if cells[-1][0] >= self.rules["height"] or cells[-1][1] >= self.rules["width"]:
+                    messagebox.showwarning("Ошибка", "Корабль не помещается на поле!")
+                    return
+
+                # Проверяем, что клетки свободны, а если правила запрещают
+                # касания, - что свободны и соседние клетки
+                occupied = {
+                    coord_to_cell(coord)
+                    for other_ship in self.ships for coord in other_ship["coords"]
+                }
+                reach = 0 if self.rules["touching"] else 1
+                for r, c in cells:
+                    if any((r + i, c + j) in occupied
+                           for i in range(-reach, reach + 1)
+                           for j in range(-reach, reach + 1)):
                         messagebox.showwarning("Ошибка", "Клетка уже занята!")
                         return
                 
-                ship["coords"] = [coord]
+                ship["coords"] = [f"{string.ascii_uppercase[r]}{c+1}" for r, c in cells]
                 self.draw_grids()
                 self.check_ships_placed()
                 return
         
         messagebox.showinfo("Информация", "Все корабли уже размещены")
 
+    def random_placement(self):
+        # Расстановку по правилам партии делает сервер (/random_fleet)
+        game_id = self.game_id
+        self.net.submit(
+            lambda session: self.api.random_fleet(session, game_id),
+            on_success=self.on_random_fleet,
+            on_error=lambda error: messagebox.showerror(
+                "Ошибка", "Не удалось получить расстановку с сервера"
+            )
+        )
+
+    def on_random_fleet(self, response):
+        if "error" in response:
+            messagebox.showerror("Ошибка", response["error"])
+            return
+        if not self.placing_ships:
+            return
+        # Корабли экрана расстановки отсортированы по длине, от больших
+        ships = sorted(response["ships"], key=len, reverse=True)
+        for ship, coords in zip(self.ships, ships):
+            ship["coords"] = coords
+        self.draw_grids()
+        self.check_ships_placed()
+
     def on_enemy_canvas_click(self, event):
         if self.placing_ships or self.game_over or self.turn != self.player:
             return
             
-        col = event.x // CELL_SIZE
-        row = event.y // CELL_SIZE
-        
-        if 0 <= row < GRID_SIZE and 0 <= col < GRID_SIZE:
-            coord = f"{string.ascii_uppercase[row]}{col+1}"
-            self.fire_shot(coord)
+        cell = self.event_cell(event)
+        if cell:
+            row, col = cell
+            self.fire_shot(f"{string.ascii_uppercase[row]}{col+1}")
 
     def fire_shot(self, coord):
-        try:
-            response = requests.post(
-                f"{SERVER_URL}/fire",
-                json={"player": self.player, "target": coord},
-                timeout=3
-            ).json()
-            
-            if "error" in response:
-                messagebox.showerror("Ошибка", response["error"])
-            else:
-                if response.get("game_over"):
-                    self.game_over = True
-                    winner = response.get("winner")
-                    if winner == self.player:
-                        messagebox.showinfo("Победа!", "Вы выиграли!")
-                    else:
-                        messagebox.showinfo("Поражение", "Вы проиграли.")
-        except requests.exceptions.RequestException:
-            messagebox.showerror("Ошибка", "Не удалось отправить выстрел.")
-        
-        self.update_status()
+        # Пока выстрел в пути, новые клики по полю противника игнорируются
+        if self.fire_pending:
+            return
+        self.fire_pending = True
+        payload = {
+            "game_id": self.game_id,
+            "player": self.player,
+            "target": coord,
+            "since": self.version
+        }
+        self.net.submit(
+            lambda session: self.api.fire(session, payload),
+            on_success=lambda response: self.on_fire_result(payload["game_id"], response),
+            on_error=self.on_fire_failed
+        )
+
+    def on_fire_result(self, game_id, response):
+        self.fire_pending = False
+        if game_id != self.game_id:
+            return
+
+        if "error" in response:
+            messagebox.showerror("Ошибка", response["error"])
+        else:
+            # Сервер вернул изменения доски, отдельный /status не нужен
+            if "delta" in response:
+                self.apply_delta(response["delta"])
+            if response.get("game_over"):
+                self.game_over = True
+                winner = response.get("winner")
+                if winner == self.player:
+                    messagebox.showinfo("Победа!", "Вы выиграли!")
+                else:
+                    messagebox.showinfo("Поражение", "Вы проиграли.")
+
+    def on_fire_failed(self, error):
+        self.fire_pending = False
+        messagebox.showerror("Ошибка", "Не удалось отправить выстрел.")
 
     def start_battle(self):
         placed_ships = [ship for ship in self.ships if ship["coords"]]
-        if len(placed_ships) != 5:
-            messagebox.showwarning("Ошибка", "Разместите ровно 5 кораблей!")
+        if len(placed_ships) != len(self.ships):
+            messagebox.showwarning("Ошибка", f"Разместите все {len(self.ships)} кораблей!")
             return
             
-        try:
-            ship_coords = []
-            for ship in self.ships:
-                ship_coords.extend(ship["coords"])
-                
-            response = requests.post(
-                f"{SERVER_URL}/place_ships",
-                json={"player": self.player, "ships": ship_coords},
-                timeout=3
-            ).json()
-            
-            if "error" in response:
-                messagebox.showerror("Ошибка", response["error"])
-            else:
-                self.placing_ships = False
-                if self.start_button:
-                    self.start_button.destroy()
-                messagebox.showinfo("Успех", "Корабли размещены! Ожидайте начала игры.")
-                
-        except requests.exceptions.RequestException:
-            messagebox.showerror("Ошибка", "Не удалось отправить корабли на сервер")
+        # Каждый корабль - список его клеток
+        ship_coords = [ship["coords"] for ship in self.ships]
+        payload = {
+            "game_id": self.game_id,
+            "player": self.player,
+            "ships": ship_coords
+        }
+
+        self.net.submit(
+            lambda session: self.api.place_ships(session, payload),
+            on_success=self.on_ships_placed,
+            on_error=lambda error: messagebox.showerror(
+                "Ошибка", "Не удалось отправить корабли на сервер"
+            )
+        )
+
+    def on_ships_placed(self, response):
+        if "error" in response:
+            messagebox.showerror("Ошибка", response["error"])
+        else:
+            self.placing_ships = False
+            if self.start_button:
+                self.start_button.destroy()
+            if self.rotate_button:
+                self.rotate_button.destroy()
+            if self.random_button:
+                self.random_button.destroy()
+            messagebox.showinfo("Успех", "Корабли размещены! Ожидайте начала игры.")
 
     def check_ships_placed(self):
         placed_ships = [ship for ship in self.ships if ship["coords"]]
         if self.start_button:
-            self.start_button.config(state=tk.NORMAL if len(placed_ships) == 5 else tk.DISABLED)
-            self.status_label.config(text=f"Размещено кораблей: {len(placed_ships)}/5")
+            total = len(self.ships)
+            self.start_button.config(state=tk.NORMAL if len(placed_ships) == total else tk.DISABLED)
+            self.status_label.config(text=f"Размещено кораблей: {len(placed_ships)}/{total}")
 
     def update_status(self):
-        try:
-            response = requests.get(f"{SERVER_URL}/status", timeout=3).json()
-            
-            self.turn = response.get("current_turn", self.player)
-            self.game_over = response.get("game_over", False)
-            
-            self.hits_on_me = response.get(f"{self.player}_hits", [])
-            self.misses_on_me = response.get(f"{self.player}_misses", [])
-            
-            opponent = "player2" if self.player == "player1" else "player1"
-            self.my_hits = response.get(f"{opponent}_hits", [])
-            self.my_misses = response.get(f"{opponent}_misses", [])
-            
-            self.opponent_ready = response.get(
-                "player2_ready" if self.player == "player1" else "player1_ready", 
-                False
-            )
-            
-            status_text = self.get_status_text(response)
-            self.status_label.config(text=status_text)
-            
-            self.draw_grids()
-            
-        except requests.exceptions.RequestException:
-            self.status_label.config(text="Ошибка соединения с сервером")
+        if not self.game_id:
+            return
+
+        game_id = self.game_id
+
+        def fetch(session):
+            # Версию берём в момент отправки: запрос мог долго ждать в очереди
+            return self.api.status(session, game_id, self.version, self.status_etag)
+
+        # Повторные опросы схлопываются: в очереди живёт только последний
+        self.net.submit(
+            fetch,
+            on_success=lambda response: self.on_status(game_id, response),
+            on_error=lambda error: self.show_connection_error(),
+            key="status"
+        )
 
-    def get_status_text(self, response):
+    def on_status(self, game_id, response):
+        # None - партия не изменилась с прошлого опроса
+        if response is None:
+            return
+        etag, response = response
+        if game_id == self.game_id and "error" not in response:
+            self.status_etag = etag
+            self.apply_delta(response)
+
+    def show_connection_error(self):
+        self.status_label.config(text="Ошибка соединения с сервером")
+
+    def refresh_view(self):
+        self.status_label.config(text=self.get_status_text())
+        self.draw_grids()
+
+    def on_change(self):
+        self.refresh_view()
+
+    def get_status_text(self):
         if self.game_over:
-            winner = response.get("winner")
-            return "Вы выиграли!" if winner == self.player else "Вы проиграли."
+            return "Вы выиграли!" if self.winner == self.player else "Вы проиграли."
         elif self.placing_ships:
             placed = len([ship for ship in self.ships if ship["coords"]])
-            return f"Размещено кораблей: {placed}/5"
+            return f"Размещено кораблей: {placed}/{len(self.ships)}"
         else:
             return "Ваш ход!" if self.turn == self.player else "Ход противника..."
 
@@ -449,23 +881,24 @@ class BattleshipApp:
         self.poll_thread.start()
 
     def poll_game_status(self):
-        while self.running:
-            try:
-                time.sleep(1)
-                if not self.running:
-                    break
-                    
-                self.master.after(0, self.update_status)
-            except:
-                continue
+        # События передаются в поток Tk через очередь сетевого обработчика
+        self.listen(
+            on_event=lambda game_id, event: self.net.deliver(self.apply_event, game_id, event),
+            on_error=lambda: self.net.deliver(self.show_connection_error)
+        )
 
     def clear_screen(self):
         for widget in self.master.winfo_children():
             widget.destroy()
         self.setup_widgets()
+        self.frame_stats.attach()
 
     def on_close(self):
+        # Отменяем запросы в очереди и обрываем соединения, чтобы
+        # фоновые потоки не ждали таймаутов
         self.running = False
+        self.net.close()
+        self.close()
         self.master.destroy()
 
 if __name__ == "__main__":
@@ -0,0 +1,241 @@
+# Терминальный клиент морского боя без окна: тот же client_core.py, что
+# и у client.py, но поля печатаются текстом, а выстрелы вводятся с клавиатуры
+# или делаются сами (--auto) - для ботов и CI, где нет дисплея.
+#
+#   python client_cli.py --server http://127.0.0.1:5000                # создать партию
+#   python client_cli.py --server http://127.0.0.1:5000 --game ID      # войти в партию
+#   python client_cli.py --server http://127.0.0.1:5000 --match alice  # подбор соперника
+#   python client_cli.py --server ... --game ID --auto --quiet         # бот
+#
+# Корабли расставляет сервер (/random_fleet) или задаёт --ships: корабли
+# через ";", клетки корабля через ",", например "A1,A2,A3;C5;E7,F7".
+import argparse
+import random
+import sys
+import time
+
+from board import LETTERS
+from client_core import (
+    RETRY_MAX, RETRY_MIN, SERVER_URL, THROTTLED_RETRIES, GameClient, cell_to_coord, coord_to_cell,
+    letter_coords, new_session, parse_coord
+)
+
+MATCHMAKING_POLL = 1.0
+
+
+class TerminalClient(GameClient):
+    def __init__(self, server_url, ships=None, auto=False, quiet=False, seed=None):
+        GameClient.__init__(self, server_url)
+        self.session = new_session()
+        self.fixed_ships = ships
+        self.ships = []
+        self.auto = auto
+        self.quiet = quiet
+        self.rng = random.Random(seed)
+        self.shown = None
+
+    def say(self, text):
+        print(text, flush=True)
+
+    def check(self, response):
+        if "error" in response:
+            raise SystemExit(f"Ошибка: {response['error']}")
+        return response
+
+    def create(self):
+        self.enter_game(self.check(self.api.create_game(self.session)))
+        self.say(f"Создана игра {self.game_id}, вы {self.player}; код для соперника: {self.game_id}")
+
+    def join(self, game_id):
+        self.enter_game(self.check(self.api.join_game(self.session, game_id)))
+        self.say(f"Игра {self.game_id}, вы {self.player}")
+
+    def match(self, name):
+        response = self.check(self.api.enqueue(self.session, name))
+        try:
+            while response["status"] != "matched":
+                if not self.quiet:
+                    self.say(f"Поиск соперника (рейтинг {response['rating']})... "
+                             f"{response['wait_seconds']:.0f} с")
+                time.sleep(MATCHMAKING_POLL)
+                response = self.check(self.api.poll_ticket(self.session, response["ticket"]))
+        except KeyboardInterrupt:
+            self.api.cancel_ticket(self.session, response["ticket"])
+            raise
+        self.enter_game(response)
+        self.say(f"Соперник {response['opponent']}, игра {self.game_id}, вы {self.player}")
+
+    def place(self):
+        self.ships = self.fixed_ships
+        if not self.ships:
+            # Случайную расстановку делает сервер; seed берётся из --seed,
+            # чтобы повторный запуск расставлял корабли так же
+            fleet = self.api.random_fleet(self.session, self.game_id, self.rng.getrandbits(32))
+            self.ships = self.check(fleet)["ships"]
+        self.check(self.api.place_ships(self.session, {
+            "game_id": self.game_id, "player": self.player, "ships": self.ships
+        }))
+        self.placing_ships = False
+        self.say("Корабли размещены, ждём соперника")
+
+    def row_labels(self):
+        # Буквы строк или, на полях с числовыми клетками, номер первой клетки строки
+        width, height = self.rules["width"], self.rules["height"]
+        if letter_coords(self.rules):
+            return [f"{LETTERS[r]:>2}" for r in range(height)]
+        side = len(str((height - 1) * width))
+        return [f"{r * width:>{side}}" for r in range(height)]
+
+    def grid(self, ships, hits, misses):
+        width, height = self.rules["width"], self.rules["height"]
+        rows = [["."] * width for _ in range(height)]
+        for coord in ships:
+            row, col = coord_to_cell(coord, self.rules)
+            rows[row][col] = "O"
+        for marks, symbol in ((misses, "*"), (hits, "X")):
+            for coord in marks:
+                row, col = coord_to_cell(coord, self.rules)
+                rows[row][col] = symbol
+        return [f"{label} " + " ".join(row) for label, row in zip(self.row_labels(), rows)]
+
+    def show(self):
+        # Столбцы: с единицы, как в "A1", или смещение от номера строки
+        first = 1 if letter_coords(self.rules) else 0
+        margin = " " * (len(self.row_labels()[0]) + 1)
+        header = margin + " ".join(str(col + first)[-1] for col in range(self.rules["width"]))
+        mine = self.grid([c for ship in self.ships for c in ship], self.hits_on_me, self.misses_on_me)
+        enemy = self.grid([], self.my_hits, self.my_misses)
+        gap = " " * 6
+        lines = [f"{'Ваши корабли':<{len(header)}}{gap}Противник", header + gap + header]
+        lines += [left + gap + right for left, right in zip(mine, enemy)]
+        self.say("\n".join(lines))
+
+    def status_text(self):
+        if self.game_over:
+            return "Вы выиграли!" if self.winner == self.player else "Вы проиграли."
+        if not self.opponent_ready:
+            return "Соперник ещё расставляет корабли..."
+        return "Ваш ход!" if self.turn == self.player else "Ход противника..."
+
+    def on_change(self):
+        # Печатаем, только когда изменилось что-то видимое
+        state = (len(self.my_hits) + len(self.my_misses), len(self.hits_on_me) + len(self.misses_on_me),
+                 self.turn, self.opponent_ready, self.game_over)
+        if state == self.shown:
+            return
+        self.shown = state
+        if not self.quiet:
+            self.show()
+        self.say(self.status_text())
+
+    def next_target(self):
+        shot = set(self.my_hits) | set(self.my_misses)
+        if self.auto:
+            free = [cell_to_coord(r, c, self.rules)
+                    for r in range(self.rules["height"]) for c in range(self.rules["width"])
+                    if cell_to_coord(r, c, self.rules) not in shot]
+            return self.rng.choice(free)
+        while True:
+            try:
+                example = "B7" if letter_coords(self.rules) else "57"
+                text = input(f"Ваш выстрел (например {example}, q - выход): ")
+            except EOFError:
+                raise SystemExit(0)
+            if text.strip().lower() == "q":
+                raise SystemExit(0)
+            coord = parse_coord(text, self.rules)
+            if coord is None:
+                self.say("Нет такой клетки")
+            elif coord in shot:
+                self.say("Сюда уже стреляли")
+            else:
+                return coord
+
+    def fire(self):
+        # True - выстрел принят; ответ с ошибкой состояние не меняет
+        target = self.next_target()
+        response = self.api.fire(self.session, {
+            "game_id": self.game_id, "player": self.player,
+            "target": target, "since": self.version
+        })
+        if "error" in response:
+            self.say(f"Ошибка: {response['error']}")
+            return False
+        self.say(f"{target}: {response['result']}")
+        if "delta" in response:
+            self.apply_delta(response["delta"])
+        return True
+
+    def refresh(self):
+        reply = self.api.status(self.session, self.game_id)
+        if reply is not None:
+            self.apply_status(reply[1])
+
+    def on_event(self, game_id, event):
+        self.apply_event(game_id, event)
+        if event.get("type") == "restart":
+            # Поля очищены - расставляемся заново
+            self.placing_ships = True
+            self.place()
+        failures = 0
+        while self.my_turn() and self.running:
+            if self.fire():
+                failures = 0
+                continue
+            # Ошибка (кончились повторы после 429, ход уже ушёл): сверяемся
+            # с /status после паузы, а не стреляем снова вслепую
+            failures += 1
+            if failures > THROTTLED_RETRIES:
+                raise SystemExit("Сервер не принимает выстрелы")
+            time.sleep(min(RETRY_MIN * 2 ** (failures - 1), RETRY_MAX))
+            self.refresh()
+        if self.game_over:
+            self.running = False
+
+    def play(self):
+        if self.placing_ships:
+            self.place()
+        self.listen(self.on_event, lambda: self.say("Нет связи с сервером, переподключаемся..."))
+        self.session.close()
+        return self.winner
+
+
+def parse_ships(text):
+    return [[coord.strip().upper() for coord in ship.split(",") if coord.strip()]
+            for ship in text.split(";") if ship.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Морской бой в терминале")
+    parser.add_argument("--server", default=SERVER_URL.strip() or None,
+                        help="адрес сервера (или переменная BATTLESHIP_SERVER)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--game", help="код игры, в которую войти")
+    mode.add_argument("--match", metavar="NAME", help="найти соперника под этим именем")
+    parser.add_argument("--ships", help='расстановка, например "A1,A2;C5"; по умолчанию случайная')
+    parser.add_argument("--auto", action="store_true", help="стрелять самому, без ввода")
+    parser.add_argument("--quiet", action="store_true", help="не печатать поля")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    if not args.server:
+        parser.error("укажите --server или BATTLESHIP_SERVER")
+
+    client = TerminalClient(args.server, parse_ships(args.ships) if args.ships else None,
+                            args.auto, args.quiet, args.seed)
+    try:
+        if args.match:
+            client.match(args.match)
+        elif args.game:
+            client.join(args.game)
+        else:
+            client.create()
+        winner = client.play()
+    except KeyboardInterrupt:
+        client.close()
+        sys.exit(130)
+    # Код выхода для скриптов: 0 - победа, 1 - поражение
+    sys.exit(0 if winner == client.player else 1)
+
+
+if __name__ == "__main__":
+    main()
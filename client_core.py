@@ -0,0 +1,337 @@
+# Клиент без GUI: запросы к серверу и состояние партии глазами игрока.
+# На нём построены окно Tk (client.py) и терминальный клиент (client_cli.py).
+#
+# Модуль загружается быстро: requests импортируется при первом запросе,
+# а не при импорте, tkinter и numpy здесь не нужны вовсе (см. bench_import.py).
+import json
+import os
+import string
+import time
+
+SERVER_URL = os.environ.get("BATTLESHIP_SERVER", " ")
+GRID_SIZE = 10
+# Правила партии, если сервер их не прислал: 10x10, пять однопалубных
+DEFAULT_RULES = {"width": GRID_SIZE, "height": GRID_SIZE, "fleet": [1] * 5, "touching": True}
+# Сервер шлёт keep-alive каждые 15 секунд, дольше тишины быть не должно
+EVENTS_READ_TIMEOUT = 30
+# Пауза перед переподключением к /events, с: удваивается после каждой
+# неудачи до RETRY_MAX и сбрасывается после удачного подключения
+RETRY_MIN = 1
+RETRY_MAX = 30
+# Сколько раз повторить запрос, на который сервер ответил 429/503
+# с Retry-After (см. admission.py на сервере)
+THROTTLED_RETRIES = 3
+SEATS = ("player1", "player2")
+
+
+def new_session():
+    import requests
+
+    return requests.Session()
+
+
+def request_errors():
+    # Ошибки сети и разбора ответа; requests импортируется только здесь
+    import requests
+
+    return requests.exceptions.RequestException, ValueError
+
+
+def retry_delay(response, backoff):
+    # Сервер мог прислать Retry-After (429/503) - ждём не меньше него.
+    # engine импортируется здесь, а не при загрузке модуля, как и requests
+    from engine import parse_uint
+
+    value = parse_uint(response.headers.get("Retry-After")) if response is not None else None
+    return backoff if value is None else max(value, backoff)
+
+
+def read_events(response):
+    # Разбор потока text/event-stream: событие заканчивается пустой строкой
+    data = []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield json.loads("\n".join(data))
+                data = []
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+
+def letter_coords(rules):
+    # Как engine.Rules.letters: на полях выше 26 строк сервер присылает
+    # клетки числами row * width + col, а не "A1"
+    return rules is None or rules["height"] <= len(string.ascii_uppercase)
+
+
+def coord_to_cell(coord, rules=None):
+    # Клетка из ответа сервера -> (строка, столбец)
+    if isinstance(coord, int):
+        return divmod(coord, rules["width"])
+    return string.ascii_uppercase.index(coord[0]), int(coord[1:]) - 1
+
+
+def cell_to_coord(row, col, rules=None):
+    if not letter_coords(rules):
+        return row * rules["width"] + col
+    return f"{string.ascii_uppercase[row]}{col + 1}"
+
+
+def parse_coord(text, rules):
+    # "b7" -> "B7", на больших полях "1234" -> 1234; None, если это не клетка поля
+    from engine import parse_uint
+
+    text = text.strip().upper()
+    if not letter_coords(rules):
+        cell = parse_uint(text)
+        return cell if cell is not None and cell < rules["width"] * rules["height"] else None
+    if len(text) < 2 or text[0] not in string.ascii_uppercase or parse_uint(text[1:]) is None:
+        return None
+    row, col = coord_to_cell(text)
+    if row >= rules["height"] or not 0 <= col < rules["width"]:
+        return None
+    return cell_to_coord(row, col)
+
+
+class ServerAPI:
+    # Запросы к серверу. Каждый метод получает requests.Session: окно Tk
+    # держит по сессии на сетевой поток, терминальный клиент - одну
+    def __init__(self, server_url=None):
+        self.server_url = SERVER_URL if server_url is None else server_url.rstrip("/")
+
+    def url(self, path):
+        return f"{self.server_url}{path}"
+
+    def call(self, session, method, path, **kwargs):
+        # Запрос с таймаутом; если сервер просит подождать, ждём
+        # Retry-After, удваивая паузу, и повторяем
+        backoff = RETRY_MIN
+        for attempt in range(THROTTLED_RETRIES + 1):
+            response = session.request(method, self.url(path), timeout=3, **kwargs)
+            throttled = response.status_code in (429, 503) and "Retry-After" in response.headers
+            if not throttled or attempt == THROTTLED_RETRIES:
+                break
+            time.sleep(retry_delay(response, backoff))
+            backoff = min(backoff * 2, RETRY_MAX)
+        return response
+
+    def create_game(self, session):
+        return self.call(session, "POST", "/games").json()
+
+    def join_game(self, session, game_id):
+        return self.call(session, "POST", f"/games/{game_id}/join").json()
+
+    def enqueue(self, session, name):
+        return self.call(session, "POST", "/matchmaking/enqueue", json={"name": name}).json()
+
+    def poll_ticket(self, session, ticket):
+        return self.call(session, "GET", "/matchmaking/poll", params={"ticket": ticket}).json()
+
+    def cancel_ticket(self, session, ticket):
+        return self.call(session, "POST", "/matchmaking/cancel", json={"ticket": ticket}).json()
+
+    def place_ships(self, session, payload):
+        return self.call(session, "POST", "/place_ships", json=payload).json()
+
+    def random_fleet(self, session, game_id=None, seed=None):
+        # Случайная расстановка по правилам партии, готовая для place_ships
+        params = {}
+        if game_id:
+            params["game_id"] = game_id
+        if seed is not None:
+            params["seed"] = seed
+        return self.call(session, "GET", "/random_fleet", params=params).json()
+
+    def fire(self, session, payload):
+        return self.call(session, "POST", "/fire", json=payload).json()
+
+    def status(self, session, game_id, since=None, etag=None):
+        # None - партия не изменилась с ответа, который дал etag (304);
+        # иначе (ETag, ответ)
+        params = {"game_id": game_id}
+        if since:
+            params["since"] = since
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        response = self.call(session, "GET", "/status", params=params, headers=headers)
+        if response.status_code == 304:
+            return None
+        return response.headers.get("ETag"), response.json()
+
+    def restart(self, session, game_id, player):
+        response = self.call(session, "POST", "/restart", json={"game_id": game_id})
+        if response.status_code == 200:
+            self.call(session, "POST", "/reset_ready", json={"game_id": game_id, "player": player})
+
+    def events(self, session, game_id, version=0):
+        # Поток /events с версии version; ответ надо закрыть (with)
+        headers = {"Last-Event-ID": str(version)} if version else {}
+        return session.get(
+            self.url("/events"),
+            params={"game_id": game_id},
+            headers=headers,
+            stream=True,
+            timeout=(3, EVENTS_READ_TIMEOUT)
+        )
+
+
+class GameState:
+    # Партия глазами игрока: чьи выстрелы куда попали, чей ход, кто победил.
+    # Обновляется из ответов /status и событий /events; после каждого
+    # изменения вызывается on_change, которую переопределяет интерфейс
+    def init_game_state(self):
+        self.player = None
+        self.game_id = None
+        self.ticket = None
+        self.rules = DEFAULT_RULES
+        self.hits_on_me = []
+        self.misses_on_me = []
+        self.my_hits = []
+        self.my_misses = []
+        self.turn = None
+        self.version = 0
+        # ETag последнего ответа /status: пока партия не менялась,
+        # сервер отвечает на повторный опрос 304 без тела
+        self.status_etag = None
+        self.winner = None
+        self.game_over = False
+        self.placing_ships = True
+        self.opponent_ready = False
+
+    def enter_game(self, response):
+        # Ответ на создание партии, вход в неё или найденный соперник
+        self.rules = response.get("rules", DEFAULT_RULES)
+        self.game_id = response["game_id"]
+        self.version = 0
+        self.status_etag = None
+        self.player = response["player"]
+
+    @property
+    def opponent(self):
+        return "player2" if self.player == "player1" else "player1"
+
+    def on_change(self):
+        pass
+
+    def apply_delta(self, response):
+        if "events" in response:
+            # Сервер прислал только изменения после нашей версии
+            for event in response["events"]:
+                self.merge_event(event)
+            self.on_change()
+        else:
+            self.apply_status(response)
+
+    def apply_status(self, response):
+        self.version = response.get("version", 0)
+        self.turn = response.get("current_turn", self.player)
+        self.game_over = response.get("game_over", False)
+        self.winner = response.get("winner")
+
+        self.hits_on_me = response.get(f"{self.player}_hits", [])
+        self.misses_on_me = response.get(f"{self.player}_misses", [])
+
+        opponent = self.opponent
+        self.my_hits = response.get(f"{opponent}_hits", [])
+        self.my_misses = response.get(f"{opponent}_misses", [])
+
+        self.opponent_ready = response.get(f"{opponent}_ready", False)
+        self.on_change()
+
+    def apply_event(self, game_id, event):
+        # Событие могло прийти от предыдущей партии
+        if game_id != self.game_id:
+            return
+
+        if event.get("type") == "snapshot":
+            self.apply_status(event)
+        else:
+            self.merge_event(event)
+            self.on_change()
+
+    def merge_event(self, event):
+        if event["version"] <= self.version:
+            return
+        self.version = event["version"]
+
+        event_type = event["type"]
+        if event_type == "shot":
+            mine = event["player"] == self.player
+            if event["hit"]:
+                (self.my_hits if mine else self.hits_on_me).append(event["target"])
+            else:
+                (self.my_misses if mine else self.misses_on_me).append(event["target"])
+        elif event_type == "turn":
+            self.turn = event["turn"]
+        elif event_type == "ready":
+            if event["player"] != self.player:
+                self.opponent_ready = event["ready"]
+        elif event_type == "game_over":
+            self.game_over = True
+            self.winner = event["winner"]
+        elif event_type == "restart":
+            self.turn = "player1"
+            self.game_over = False
+            self.winner = None
+            self.opponent_ready = False
+            self.hits_on_me, self.misses_on_me = [], []
+            self.my_hits, self.my_misses = [], []
+
+    def my_turn(self):
+        return (not self.game_over and not self.placing_ships and self.opponent_ready
+                and self.turn == self.player)
+
+
+class GameClient(GameState):
+    # Состояние партии плюс сервер: ServerAPI и слежение за /events
+    def __init__(self, server_url=None):
+        self.api = ServerAPI(server_url)
+        self.running = True
+        self.events_response = None
+        self.init_game_state()
+
+    def listen(self, on_event, on_error=None):
+        # Вместо опроса /status слушаем поток событий /events, при обрыве
+        # соединения переподключаемся с последней версии. on_event(game_id,
+        # event) вызывается в этом потоке; цикл идёт, пока running
+        errors = request_errors()
+        session = new_session()
+        backoff = RETRY_MIN
+        while self.running:
+            game_id = self.game_id
+            if not game_id:
+                time.sleep(0.5)
+                continue
+
+            try:
+                with self.api.events(session, game_id, self.version) as response:
+                    self.events_response = response
+                    if response.status_code != 200:
+                        time.sleep(retry_delay(response, backoff))
+                        backoff = min(backoff * 2, RETRY_MAX)
+                        continue
+                    backoff = RETRY_MIN
+                    for event in read_events(response):
+                        if not self.running or game_id != self.game_id:
+                            break
+                        on_event(game_id, event)
+            except errors + (AttributeError,):
+                # AttributeError/ValueError - поток закрыт из close
+                if self.running:
+                    if on_error is not None:
+                        on_error()
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, RETRY_MAX)
+            finally:
+                self.events_response = None
+        session.close()
+
+    def close(self):
+        # Обрываем поток /events, чтобы listen не ждал таймаута
+        self.running = False
+        response = self.events_response
+        if response is not None:
+            response.close()
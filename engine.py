@@ -0,0 +1,446 @@
+# Правила игры без HTTP, замков, журнала событий и хранилища:
+# проверка координат и расстановки, попадание/промах, переход хода и победа.
+# Game (game.py) добавляет к этому всё, что нужно серверу, а симулятор
+# (simulate.py) гоняет Match напрямую.
+import random
+
+from board import (
+    BITBOARD_LIMIT, GRID_SIZE, LETTERS, MAX_SIDE, PLACEMENT_TABLE_LIMIT, coord_tables, make_board,
+    mask_to_cells, neighbour_masks, placement_table
+)
+
+SEATS = ("player1", "player2")
+# Флот по умолчанию: пять однопалубных кораблей
+DEFAULT_FLEET = (1, 1, 1, 1, 1)
+# Пределы флота, чтобы расстановка и память партии оставались ограниченными
+MAX_SHIPS = 100
+MAX_FLEET_CELLS = 10000
+ORIENTATIONS = ("horizontal", "vertical")
+# Случайная расстановка: сколько случайных положений пробовать для корабля,
+# прежде чем искать среди всех свободных, и сколько раз начинать заново
+RANDOM_TRIES = 32
+FLEET_ATTEMPTS = 100
+# Если случайные попытки кончились - перебор с возвратом, не больше
+# стольких проверенных положений
+FLEET_SEARCH_STEPS = 200000
+
+# Исходы выстрела
+MISS = 0
+HIT = 1
+WIN = 2
+REPEAT = 3
+GAME_OVER = 4
+# Попадание, потопившее корабль. Наружу (/fire, компактный протокол) уходит
+# как HIT с текстом "Попал!", а потопленный корабль сообщает поле sunk
+SUNK = 5
+
+RESULT_TEXT = {
+    MISS: "Мимо!",
+    HIT: "Попал!",
+    WIN: "Все корабли противника уничтожены. Победа!",
+    REPEAT: "Уже стреляли сюда!",
+    GAME_OVER: "Игра окончена!",
+}
+
+
+class GameError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def opponent_of(player):
+    return "player2" if player == "player1" else "player1"
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_uint(value):
+    # Неотрицательное целое из строки запроса или заголовка; None - не оно.
+    # isdigit() пропускает "²" и прочие цифры Юникода, которые не берёт int(),
+    # а слишком длинную строку int() не берёт сам
+    if isinstance(value, str) and value.isascii() and value.isdecimal():
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return None
+
+
+class Rules:
+    # Правила партии: размер поля, длины кораблей флота и можно ли
+    # кораблям касаться друг друга (в том числе углами).
+    # Клетка - число row * width + col; на полях до 26 строк принимаются
+    # и буквенные координаты "A1", и в ответах клетки пишутся так же
+    __slots__ = ("width", "height", "fleet", "touching", "cells", "letters",
+                 "cell_to_coord", "coord_to_cell")
+
+    def __init__(self, width=GRID_SIZE, height=GRID_SIZE, fleet=DEFAULT_FLEET, touching=True):
+        self.width = width
+        self.height = height
+        self.fleet = tuple(fleet)
+        self.touching = touching
+        self.cells = width * height
+        self.letters = height <= len(LETTERS)
+        self.cell_to_coord = self.coord_to_cell = None
+        if self.letters and self.cells <= BITBOARD_LIMIT:
+            self.cell_to_coord, self.coord_to_cell = coord_tables(width, height)
+
+    @classmethod
+    def from_json(cls, data):
+        if data is None:
+            return DEFAULT_RULES
+        if not isinstance(data, dict):
+            raise GameError("Правила должны быть объектом")
+        width = data.get("width", GRID_SIZE)
+        height = data.get("height", GRID_SIZE)
+        fleet = data.get("fleet", DEFAULT_FLEET)
+        touching = data.get("touching", True)
+
+        if not (is_int(width) and is_int(height) and 1 <= width <= MAX_SIDE and 1 <= height <= MAX_SIDE):
+            raise GameError(f"Размер поля должен быть от 1 до {MAX_SIDE}")
+        if (not isinstance(fleet, (list, tuple)) or not 1 <= len(fleet) <= MAX_SHIPS
+                or not all(is_int(size) and 1 <= size <= max(width, height) for size in fleet)):
+            raise GameError(f"Флот - от 1 до {MAX_SHIPS} кораблей длиной не больше стороны поля")
+        if sum(fleet) > min(MAX_FLEET_CELLS, width * height // 2):
+            raise GameError("Флот не помещается на поле")
+        if not isinstance(touching, bool):
+            raise GameError("touching должен быть true или false")
+        return cls(width, height, fleet, touching)
+
+    def to_json(self):
+        return {
+            "width": self.width,
+            "height": self.height,
+            "fleet": list(self.fleet),
+            "touching": self.touching
+        }
+
+    def parse_cell(self, value):
+        # Номер клетки (число или строка из цифр) или "A1"; None - неверная координата
+        if is_int(value):
+            return value if 0 <= value < self.cells else None
+        if not isinstance(value, str):
+            return None
+        if self.coord_to_cell is not None and value in self.coord_to_cell:
+            return self.coord_to_cell[value]
+        number = parse_uint(value)
+        if number is not None:
+            return self.parse_cell(number)
+        if self.letters and len(value) > 1 and value[1] != "0":
+            row = LETTERS.find(value[0])
+            col = parse_uint(value[1:])
+            if col is not None and 0 <= row < self.height and col <= self.width:
+                return row * self.width + col - 1
+        return None
+
+    def format_cell(self, cell):
+        if self.cell_to_coord is not None:
+            return self.cell_to_coord[cell]
+        if self.letters:
+            row, col = divmod(cell, self.width)
+            return f"{LETTERS[row]}{col + 1}"
+        return cell
+
+    def format_cells(self, cells):
+        if self.cell_to_coord is not None:
+            table = self.cell_to_coord
+            return [table[cell] for cell in cells]
+        if self.letters:
+            return [self.format_cell(cell) for cell in cells]
+        return cells
+
+    def parse_ship(self, ship):
+        # Корабль: одна координата (однопалубный), список его клеток
+        # или {"cell": начало, "size": длина, "orientation": "horizontal"|"vertical"}
+        if isinstance(ship, dict) and "cells" not in ship:
+            start = self.parse_cell(ship.get("cell"))
+            if start is None:
+                raise GameError(f"Неверная координата: {ship.get('cell')}")
+            size = ship.get("size", 1)
+            orientation = ship.get("orientation", "horizontal")
+            if not is_int(size) or size < 1:
+                raise GameError(f"Неверная длина корабля: {size}")
+            if orientation not in ORIENTATIONS:
+                raise GameError(f"Неверная ориентация: {orientation}")
+            row, col = divmod(start, self.width)
+            if orientation == "horizontal":
+                if col + size > self.width:
+                    raise GameError("Корабль выходит за границу поля")
+                return list(range(start, start + size))
+            if row + size > self.height:
+                raise GameError("Корабль выходит за границу поля")
+            return list(range(start, start + size * self.width, self.width))
+
+        coords = ship["cells"] if isinstance(ship, dict) else ship
+        if not isinstance(coords, list):
+            coords = [coords]
+        if not coords or len(coords) > max(self.width, self.height):
+            raise GameError("Неверная длина корабля")
+        cells = []
+        for coord in coords:
+            cell = self.parse_cell(coord)
+            if cell is None:
+                raise GameError(f"Неверная координата: {coord}")
+            cells.append(cell)
+        cells.sort()
+        if len(cells) > 1:
+            # Палубы идут подряд по строке (шаг 1) или по столбцу (шаг width);
+            # на поле шириной в клетку шаг 1 - это столбец
+            step = cells[1] - cells[0]
+            same_row = self.width == 1 or cells[0] // self.width == cells[-1] // self.width
+            if (step not in (1, self.width) or (step == 1 and not same_row)
+                    or any(b - a != step for a, b in zip(cells, cells[1:]))):
+                raise GameError("Клетки корабля должны идти подряд по прямой")
+        return cells
+
+    def parse_fleet(self, ships):
+        if not isinstance(ships, list):
+            raise GameError("Ожидается список кораблей")
+        # Проверка количества кораблей
+        if len(ships) != len(self.fleet):
+            raise GameError(f"Должно быть ровно {len(self.fleet)} кораблей")
+
+        parsed = [self.parse_ship(ship) for ship in ships]
+        if sorted(map(len, parsed)) != sorted(self.fleet):
+            raise GameError(f"Состав флота не соответствует правилам: {list(self.fleet)}")
+
+        if self.cells <= PLACEMENT_TABLE_LIMIT:
+            self.check_masks(parsed)
+            return parsed
+
+        # Номер корабля по клетке: пересечения видны сразу, а касания
+        # проверяются по соседям каждой палубы, без обхода всего поля
+        occupied = {}
+        for index, cells in enumerate(parsed):
+            for cell in cells:
+                if cell in occupied:
+                    raise GameError(f"Корабли пересекаются в клетке {self.format_cell(cell)}")
+                occupied[cell] = index
+        if not self.touching:
+            self.check_touching(occupied)
+        return parsed
+
+    def check_touching(self, occupied):
+        width, height = self.width, self.height
+        for cell, index in occupied.items():
+            row, col = divmod(cell, width)
+            for r in range(max(row - 1, 0), min(row + 2, height)):
+                for c in range(max(col - 1, 0), min(col + 2, width)):
+                    other = occupied.get(r * width + c, index)
+                    if other != index:
+                        raise GameError(f"Корабли касаются в клетке {self.format_cell(cell)}")
+
+    def check_masks(self, parsed):
+        # Небольшое поле - битовые маски: пересечение - общий бит палуб
+        # с занятыми клетками, касание - общий бит занятых клеток с соседями
+        # палуб (таблица соседей строится один раз на размер поля)
+        around = None if self.touching else neighbour_masks(self.width, self.height)
+        occupied = 0
+        for cells in parsed:
+            ship = 0
+            for cell in cells:
+                ship |= 1 << cell
+            overlap = ship & occupied
+            if overlap:
+                raise GameError(f"Корабли пересекаются в клетке {self.format_cell(mask_to_cells(overlap)[0])}")
+            if around is not None:
+                for cell in cells:
+                    if around[cell] & occupied:
+                        raise GameError(f"Корабли касаются в клетке {self.format_cell(cell)}")
+            occupied |= ship
+
+    def random_fleet(self, rng=None):
+        # Случайная расстановка по правилам: список кораблей, корабль -
+        # список номеров клеток. Большие корабли ставятся первыми; если
+        # очередной не встал, расстановка начинается заново. Плотные флоты,
+        # которые помещаются едва-едва, случайно не встают - для них
+        # перебор по порядку клеток
+        rng = rng or random.Random()
+        sizes = sorted(self.fleet, reverse=True)
+        place = self.place_from_tables if self.cells <= PLACEMENT_TABLE_LIMIT else self.place_by_sampling
+        for _ in range(FLEET_ATTEMPTS):
+            ships = place(sizes, rng)
+            if ships is not None:
+                return ships
+        ships = self.place_by_search(sizes)
+        if ships is not None:
+            return ships
+        raise GameError("Не удалось расставить флот по правилам партии", 409)
+
+    def place_from_tables(self, sizes, rng):
+        # Положения берутся из готовой таблицы (board.placement_table), проверка
+        # положения - одно пересечение масок
+        occupied = 0
+        ships = []
+        for size in sizes:
+            table = placement_table(self.width, self.height, size, self.touching)
+            for _ in range(RANDOM_TRIES):
+                ship, zone, cells = table[rng.randrange(len(table))]
+                if not zone & occupied:
+                    break
+            else:
+                # Поле уже тесное - выбираем среди всех свободных положений
+                free = [entry for entry in table if not entry[1] & occupied]
+                if not free:
+                    return None
+                ship, zone, cells = rng.choice(free)
+            occupied |= ship
+            ships.append(list(cells))
+        return ships
+
+    def place_by_sampling(self, sizes, rng):
+        # Большое поле без таблиц: случайные положения проверяются по
+        # множеству закрытых клеток - палуб, а без касаний и их соседей
+        width, height = self.width, self.height
+        blocked = set()
+        ships = []
+        for size in sizes:
+            orientations = [vertical for vertical in (False, True)
+                            if size <= (height if vertical else width)]
+            for _ in range(RANDOM_TRIES):
+                vertical = rng.choice(orientations)
+                step = width if vertical else 1
+                row = rng.randrange(height - size + 1 if vertical else height)
+                col = rng.randrange(width if vertical else width - size + 1)
+                start = row * width + col
+                cells = list(range(start, start + size * step, step))
+                if not any(cell in blocked for cell in cells):
+                    break
+            else:
+                return None
+            for cell in cells:
+                if self.touching:
+                    blocked.add(cell)
+                    continue
+                row, col = divmod(cell, width)
+                for r in range(max(row - 1, 0), min(row + 2, height)):
+                    for c in range(max(col - 1, 0), min(col + 2, width)):
+                        blocked.add(r * width + c)
+            ships.append(cells)
+        return ships
+
+    def place_by_search(self, sizes):
+        # Перебор с возвратом: положения (клетка, горизонтально/вертикально)
+        # по порядку клеток. Одинаковые корабли ставятся только по
+        # возрастанию положения, чтобы не перебирать их перестановки.
+        # blocked - сколько поставленных кораблей закрывают клетку
+        width, height = self.width, self.height
+        blocked = bytearray(self.cells)
+        ships = []
+        steps = [FLEET_SEARCH_STEPS]
+
+        def zone(cells):
+            if self.touching:
+                return cells
+            area = set()
+            for cell in cells:
+                row, col = divmod(cell, width)
+                for r in range(max(row - 1, 0), min(row + 2, height)):
+                    for c in range(max(col - 1, 0), min(col + 2, width)):
+                        area.add(r * width + c)
+            return area
+
+        def place(index, first):
+            if index == len(sizes):
+                return True
+            size = sizes[index]
+            for position in range(first, 2 * self.cells):
+                steps[0] -= 1
+                if steps[0] < 0:
+                    return False
+                cell, vertical = divmod(position, 2)
+                row, col = divmod(cell, width)
+                if vertical:
+                    if size == 1 or row + size > height:
+                        continue
+                    step = width
+                elif col + size > width:
+                    continue
+                else:
+                    step = 1
+                cells = range(cell, cell + size * step, step)
+                if any(blocked[cell] for cell in cells):
+                    continue
+                area = zone(cells)
+                for cell in area:
+                    blocked[cell] += 1
+                ships.append(list(cells))
+                same = index + 1 < len(sizes) and sizes[index + 1] == size
+                if place(index + 1, position + 1 if same else 0):
+                    return True
+                ships.pop()
+                for cell in area:
+                    blocked[cell] -= 1
+            return False
+
+        return ships if place(0, 0) else None
+
+
+DEFAULT_RULES = Rules()
+
+
+class Match:
+    def __init__(self, rules=None):
+        self.rules = rules or DEFAULT_RULES
+        self.reset()
+
+    def reset(self):
+        self.players = {seat: make_board(self.rules.width, self.rules.height) for seat in SEATS}
+        self.current_turn = "player1"
+        self.game_over = False
+        self.winner = None
+
+    def check_player(self, player):
+        if not isinstance(player, str) or player not in self.players:
+            raise GameError("Неверный игрок")
+
+    def both_ready(self):
+        return self.players["player1"].ready and self.players["player2"].ready
+
+    def place(self, player, ships):
+        self.check_player(player)
+
+        # Количество, форма и положение кораблей по правилам партии
+        cells = self.rules.parse_fleet(ships)
+
+        board = self.players[player]
+        board.place(cells)
+        board.ready = True
+
+        # Первым ходит player1
+        if self.both_ready():
+            self.current_turn = "player1"
+        return board
+
+    def shoot(self, player, target):
+        if self.game_over:
+            return GAME_OVER
+
+        self.check_player(player)
+        if player != self.current_turn:
+            raise GameError("Сейчас не ваш ход!")
+
+        # Проверка валидности координаты
+        cell = self.rules.parse_cell(target)
+        if cell is None:
+            raise GameError("Неверная координата")
+
+        opponent = opponent_of(player)
+        enemy = self.players[opponent]
+        hit = enemy.shoot(cell)
+        if hit is None:
+            return REPEAT
+        if not hit:
+            self.current_turn = opponent
+            return MISS
+
+        # Проверяем, остались ли корабли у противника
+        if enemy.all_sunk():
+            self.game_over = True
+            self.winner = player
+            return WIN
+        return SUNK if hit == 2 else HIT
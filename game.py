@@ -0,0 +1,495 @@
+# Модель конкурентности:
+#  - каждая партия (Game) меняется только под своим замком game.lock,
+#    поэтому проверка хода, проверка повторного выстрела и запись выстрела
+#    выполняются атомарно, а разные партии идут параллельно;
+#  - GameRegistry.lock защищает только словарь партий и держится
+#    на время операций со словарём; под ним никогда не берётся game.lock,
+#    а под game.lock никогда не берётся registry.lock;
+#  - поля, которые читаются без замка (seats, closed, last_active),
+#    только целиком перезаписываются, их частичное состояние не видно.
+import json
+import threading
+from abc import ABC, abstractmethod
+import time
+import uuid
+import weakref
+from collections import OrderedDict, deque
+
+from engine import (
+    SEATS, HIT, MISS, WIN, REPEAT, GAME_OVER, SUNK, RESULT_TEXT, GameError, Match, Rules,
+    opponent_of, parse_uint
+)
+
+# Сколько секунд игра может простаивать, прежде чем её удалят
+IDLE_TIMEOUT = 30 * 60
+# Жёсткий предел числа одновременных игр в процессе
+MAX_GAMES = 10000
+# Сколько последних событий партии хранится для /events
+EVENT_LOG_SIZE = 256
+# Предел числа команд в одном запросе /batch
+MAX_BATCH = 1000
+# Предел числа зрителей /spectate одной партии
+MAX_SPECTATORS = 20000
+# На сколько событий зритель может отстать, прежде чем его отключат
+SPECTATOR_MAX_LAG = 128
+
+KEEPALIVE_FRAME = b": keep-alive\n\n"
+# Без id: переподключившийся зритель продолжит с последнего полученного события
+DROPPED_FRAME = b'event: dropped\ndata: {"type": "dropped"}\n\n'
+
+
+def sse_frame(event):
+    return f"id: {event['version']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+def new_game_id():
+    return uuid.uuid4().hex[:12]
+
+
+def parse_since(value):
+    # Версия из JSON (число) или из строки запроса; None - версия не указана
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value >= 0 else None
+    return parse_uint(value)
+
+
+class Game(Match):
+    # Партия на сервере: правила из Match плюс замок, места игроков,
+    # журнал событий для /events и запись ходов в хранилище
+    def __init__(self, game_id, lock_factory=threading.Condition, event_log_size=None, rules=None):
+        self.game_id = game_id
+        # Все изменения состояния партии выполняются под этим замком,
+        # разные партии друг друга не блокируют. Это Condition, чтобы
+        # подписчики /events просыпались при каждом новом событии.
+        # Асинхронный сервер передаёт сюда asyncio.Condition
+        self.lock = lock_factory()
+        self.seats = frozenset()
+        self.version = 0
+        if event_log_size is None:
+            event_log_size = EVENT_LOG_SIZE
+        self.events = deque(maxlen=event_log_size)
+        # Кадры SSE тех же событий: событие кодируется один раз, при первом
+        # чтении, и эти же байты получают все подписчики /events и /spectate
+        self.frames = deque(maxlen=event_log_size)
+        self.snapshot_cache = None
+        # Готовые байты ответа /status по формату: формат -> (версия, байты).
+        # Любое изменение партии увеличивает version, так что устаревшие
+        # байты просто не совпадут по версии и будут закодированы заново
+        self.status_cache = {}
+        self.spectators = 0
+        # Партии из подбора соперника: функция, которая обновит рейтинги
+        # после победы (см. matchmaking.py)
+        self.on_finish = None
+        # Слушатели всех событий партии, общие для реестра (см. metrics.py);
+        # вызываются под self.lock и не должны брать чужие замки партий
+        self.listeners = ()
+        self.closed = False
+        # Хранилище, в которое пишутся принятые ходы (см. store.py)
+        self.store = None
+        self.created_at = time.time()
+        # Начало текущей партии: создание или последний рестарт
+        self.started_at = self.created_at
+        self.last_active = time.monotonic()
+        Match.__init__(self, rules)
+
+    def emit(self, event_type, **data):
+        # Вызывается под self.lock
+        self.version += 1
+        event = {"version": self.version, "type": event_type}
+        event.update(data)
+        self.events.append(event)
+        self.frames.append(None)
+        for listener in self.listeners:
+            listener(self, event)
+        self.lock.notify_all()
+
+    def record(self, op, **data):
+        # Вызывается под self.lock, чтобы порядок записей совпадал с порядком ходов
+        if self.store is not None:
+            data["op"] = op
+            data["game_id"] = self.game_id
+            self.store.append(data)
+
+    def events_since(self, version):
+        # None - нужные события уже вытеснены из журнала
+        if version == self.version:
+            return []
+        if version > self.version or not self.events or self.events[0]["version"] > version + 1:
+            return None
+        return [event for event in self.events if event["version"] > version]
+
+    def frames_since(self, version):
+        # Как events_since, но закодированные кадры; вызывается под self.lock
+        count = self.version - version
+        if count == 0:
+            return []
+        if count < 0 or count > len(self.events):
+            return None
+        frames, events = self.frames, self.events
+        start = len(frames) - count
+        for i in range(start, len(frames)):
+            if frames[i] is None:
+                frames[i] = sse_frame(events[i])
+        return [frames[i] for i in range(start, len(frames))]
+
+    def snapshot_frame(self):
+        # Полный снимок для нового или отставшего подписчика,
+        # кодируется один раз на версию партии
+        if self.snapshot_cache is None or self.snapshot_cache[0] != self.version:
+            snapshot = self.status()
+            snapshot["type"] = "snapshot"
+            self.snapshot_cache = (self.version, sse_frame(snapshot))
+        return self.snapshot_cache[1]
+
+    def status_bytes(self, fmt, encode):
+        # Снимок status(), закодированный encode, один раз на версию партии;
+        # вызывается под self.lock
+        cached = self.status_cache.get(fmt)
+        if cached is None or cached[0] != self.version:
+            cached = (self.version, encode(self.status()))
+            self.status_cache[fmt] = cached
+        return cached[1]
+
+    def status_etag(self, fmt):
+        # Ответ /status однозначно задан партией, её версией и форматом
+        return f"{self.game_id}-{self.version}-{fmt}"
+
+    def add_spectator(self):
+        if self.spectators >= MAX_SPECTATORS:
+            raise GameError("Слишком много зрителей", 503)
+        self.spectators += 1
+
+    def remove_spectator(self):
+        self.spectators -= 1
+
+    def wait_for_change(self, version, timeout):
+        # Вызывается под self.lock, только для threading.Condition
+        return self.lock.wait_for(
+            lambda: self.version > version or self.closed, timeout
+        )
+
+    def claim_seat(self, player=None):
+        if player is None:
+            free = [seat for seat in SEATS if seat not in self.seats]
+            if not free:
+                raise GameError("Игра уже заполнена", 409)
+            player = free[0]
+        self.check_player(player)
+        if player in self.seats:
+            raise GameError("Место уже занято", 409)
+        self.seats = self.seats | {player}
+        return player
+
+    def join(self, player=None):
+        player = self.claim_seat(player)
+        self.emit("join", player=player)
+        self.record("join", player=player)
+        return player
+
+    def place_ships(self, player, ships):
+        board = self.place(player, ships)
+        self.emit("ready", player=player, ready=True)
+        self.record("place", player=player, ships=ships)
+
+        both_ready = self.both_ready()
+        if both_ready:
+            self.emit("turn", turn=self.current_turn)
+
+        return {
+            "status": "Корабли расставлены!",
+            "ready": board.ready,
+            "both_ready": both_ready
+        }
+
+    def fire(self, player, target):
+        outcome = self.shoot(player, target)
+        if outcome == GAME_OVER:
+            return {"result": RESULT_TEXT[outcome], "winner": self.winner}
+        if outcome == REPEAT:
+            return {"result": RESULT_TEXT[outcome]}
+
+        # В журнал и события клетка попадает в каноническом виде
+        cell = self.rules.parse_cell(target)
+        target = self.rules.format_cell(cell)
+        sunk = None
+        if outcome in (SUNK, WIN):
+            sunk = self.rules.format_cells(self.players[opponent_of(player)].ship_cells(cell))
+        self.emit("shot", player=player, target=target, hit=outcome != MISS, sunk=sunk)
+        self.record("fire", player=player, target=target)
+        if outcome == WIN:
+            self.emit("game_over", winner=player)
+            # После партии расстановка больше не секрет
+            self.emit("reveal", ships=self.fleets())
+            if self.on_finish is not None:
+                self.on_finish(self)
+        elif outcome == MISS:
+            self.emit("turn", turn=self.current_turn)
+
+        return {
+            "result": RESULT_TEXT[HIT if outcome == SUNK else outcome],
+            "sunk": sunk,
+            "turn": self.current_turn,
+            "game_over": self.game_over,
+            "winner": self.winner,
+            "version": self.version
+        }
+
+    def status(self):
+        format_cells = self.rules.format_cells
+        player1, player2 = self.players["player1"], self.players["player2"]
+        status = {
+            "game_id": self.game_id,
+            "version": self.version,
+            "rules": self.rules.to_json(),
+            "current_turn": self.current_turn,
+            "game_over": self.game_over,
+            "winner": self.winner,
+            "player1_ready": player1.ready,
+            "player2_ready": player2.ready,
+            "player1_hits": format_cells(player1.hit_cells()),
+            "player1_misses": format_cells(player1.miss_cells()),
+            "player2_hits": format_cells(player2.hit_cells()),
+            "player2_misses": format_cells(player2.miss_cells())
+        }
+        if self.game_over:
+            status["ships"] = self.fleets()
+        return status
+
+    def fleets(self):
+        return {
+            seat: [self.rules.format_cells(cells) for cells in board.fleet()]
+            for seat, board in self.players.items()
+        }
+
+    def delta(self, since):
+        # Изменения после версии since; если клиент отстал больше,
+        # чем хранит журнал, отдаём полный снимок
+        events = self.events_since(since)
+        if events is None:
+            return self.status()
+        return {
+            "game_id": self.game_id,
+            "version": self.version,
+            "since": since,
+            "events": events
+        }
+
+    def execute(self, command):
+        # Одна команда /batch; вызывается под self.lock
+        op = command.get("op")
+        since = parse_since(command.get("since"))
+        if op == "place":
+            return self.place_ships(command.get("player"), command.get("ships", []))
+        if op == "fire":
+            result = self.fire(command.get("player"), command.get("target"))
+            if since is not None:
+                result["delta"] = self.delta(since)
+            return result
+        if op == "status":
+            return self.status() if since is None else self.delta(since)
+        raise GameError(f"Неизвестная команда: {op}")
+
+    def summary(self):
+        return {
+            "game_id": self.game_id,
+            "seats": sorted(self.seats),
+            "open": len(self.seats) < len(SEATS),
+            "game_over": self.game_over,
+            "spectators": self.spectators,
+            "rules": self.rules.to_json()
+        }
+
+    def restart(self):
+        self.reset()
+        self.started_at = time.time()
+        self.emit("restart")
+        self.record("restart")
+
+    def reset_ready(self, player):
+        if player in self.players:
+            self.players[player].ready = False
+            self.emit("ready", player=player, ready=False)
+            self.record("reset_ready", player=player)
+
+    def dump(self):
+        return {
+            "game_id": self.game_id,
+            "seats": sorted(self.seats),
+            "version": self.version,
+            "created_at": self.created_at,
+            "rules": self.rules.to_json(),
+            "current_turn": self.current_turn,
+            "game_over": self.game_over,
+            "winner": self.winner,
+            "players": {seat: board.dump() for seat, board in self.players.items()}
+        }
+
+    @classmethod
+    def from_dump(cls, data, lock_factory=threading.Condition, event_log_size=None):
+        # Снимки, записанные до появления правил, - партии 10x10 по умолчанию
+        rules = Rules.from_json(data.get("rules"))
+        game = cls(data["game_id"], lock_factory, event_log_size, rules)
+        game.seats = frozenset(data["seats"])
+        game.version = data["version"]
+        game.created_at = data["created_at"]
+        game.started_at = game.created_at
+        game.current_turn = data["current_turn"]
+        game.game_over = data["game_over"]
+        game.winner = data["winner"]
+        game.players = {
+            seat: type(game.players[seat]).load(board) for seat, board in data["players"].items()
+        }
+        return game
+
+
+class RoundListener(ABC):
+    # Основа слушателей, которым нужен раунд целиком (replay.ReplayArchive,
+    # analytics.Analytics). Выстрелы копятся с создания или рестарта партии,
+    # по game_over раунд уходит в finish_round. Партия, поднятая из
+    # хранилища посреди раунда, видна слушателю не целиком и пропускается.
+    # Подкласс без shot_entry или finish_round не создаётся (TypeError)
+    def __init__(self):
+        # Незаконченные раунды: партия -> записи shot_entry
+        self.pending = weakref.WeakKeyDictionary()
+
+    def on_event(self, game, event):
+        # Слушатель событий партии (Game.listeners), вызывается под game.lock
+        kind = event["type"]
+        if kind == "restart":
+            self.pending[game] = []
+        elif kind == "shot":
+            self.pending.setdefault(game, []).append(self.shot_entry(game, event))
+        elif kind == "game_over":
+            shots = self.pending.pop(game, [])
+            made = sum(len(board.hit_cells()) + len(board.miss_cells())
+                       for board in game.players.values())
+            if made == len(shots):
+                self.finish_round(game, shots)
+
+    @abstractmethod
+    def shot_entry(self, game, event):
+        # Запись одного выстрела раунда из события shot
+        ...
+
+    @abstractmethod
+    def finish_round(self, game, shots):
+        # Раунд выигран: shots - записи shot_entry по порядку
+        ...
+
+
+class GameRegistry:
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, max_games=MAX_GAMES,
+                 lock_factory=threading.Condition, store=None, owns=None):
+        self.idle_timeout = idle_timeout
+        self.max_games = max_games
+        self.lock_factory = lock_factory
+        self.store = store
+        # Какие идентификаторы может выдавать этот процесс; при шардировании
+        # только те, что кольцо отдаёт ему (см. sharding.py)
+        self.owns = owns
+        # Порядок ключей = порядок последнего обращения, в начале самые старые
+        self.games = OrderedDict()
+        self.lock = threading.Lock()
+        # Слушатели событий всех партий реестра: fn(game, event)
+        self.listeners = []
+
+    def create(self, player=None, rules=None, claim_all=False, game_id=None):
+        # Создатель занимает место до того, как партия станет видна другим,
+        # иначе между созданием и входом его место мог бы занять чужой join.
+        # claim_all занимает сразу оба места - для партий из подбора соперника.
+        # game_id - предложенный идентификатор (подбор соперника выбирает его
+        # до того, как узнает шард); чужой шарду или занятый заменяется новым
+        if not self.valid_game_id(game_id):
+            game_id = self.new_game_id()
+        game = Game(game_id, self.lock_factory, rules=rules)
+        game.listeners = self.listeners
+        player = game.claim_seat(player)
+        if claim_all:
+            game.seats = frozenset(SEATS)
+        with self.lock:
+            self._evict_idle(time.monotonic())
+            if len(self.games) >= self.max_games:
+                raise GameError("Сервер перегружен, попробуйте позже", 503)
+            while game_id in self.games:
+                game_id = self.new_game_id()
+            game.game_id = game_id
+            game.store = self.store
+            self.games[game_id] = game
+            if self.store is not None:
+                self.store.append({
+                    "op": "create", "game_id": game_id, "player": player,
+                    "seats": sorted(game.seats), "rules": game.rules.to_json()
+                })
+            return game, player
+
+    def new_game_id(self):
+        # При N шардах в среднем N попыток, каждая - один uuid4 и хеш
+        while True:
+            game_id = new_game_id()
+            if self.owns is None or self.owns(game_id):
+                return game_id
+
+    def valid_game_id(self, game_id):
+        return (isinstance(game_id, str) and 0 < len(game_id) <= 32 and game_id.isascii() and game_id.isalnum()
+                and (self.owns is None or self.owns(game_id)))
+
+    def restore(self):
+        # Поднимаем партии, сохранённые в хранилище до перезапуска
+        if self.store is None:
+            return 0
+        games = [Game.from_dump(data, self.lock_factory) for data in self.store.load()]
+        now = time.monotonic()
+        with self.lock:
+            for game in games:
+                game.store = self.store
+                game.listeners = self.listeners
+                game.last_active = now
+                self.games[game.game_id] = game
+        return len(games)
+
+    def sync(self):
+        # Ждём, пока принятые ходы дойдут до диска; вызывается без замков
+        if self.store is not None:
+            self.store.sync()
+
+    def get(self, game_id):
+        now = time.monotonic()
+        with self.lock:
+            self._evict_idle(now)
+            game = self.games.get(game_id) if isinstance(game_id, str) else None
+            if game is None:
+                raise GameError("Игра не найдена", 404)
+            game.last_active = now
+            self.games.move_to_end(game_id)
+            return game
+
+    def list(self):
+        with self.lock:
+            self._evict_idle(time.monotonic())
+            games = list(self.games.values())
+        return [game.summary() for game in games]
+
+    def evict_idle(self):
+        with self.lock:
+            return self._evict_idle(time.monotonic())
+
+    def _evict_idle(self, now):
+        # Игры упорядочены по времени обращения, поэтому достаточно
+        # снимать просроченные с начала словаря
+        evicted = 0
+        while self.games:
+            game_id, game = next(iter(self.games.items()))
+            if now - game.last_active < self.idle_timeout:
+                break
+            del self.games[game_id]
+            # Открытые потоки /events завершатся на ближайшем keep-alive
+            game.closed = True
+            if self.store is not None:
+                self.store.append({"op": "evict", "game_id": game_id})
+            evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self.games)
@@ -0,0 +1,350 @@
+# Обработка запросов без привязки к веб-фреймворку: разбор тела и
+# аргументов, допуск (admission.py), ответы /status с ETag, пакет команд
+# /batch, превращение GameError в ответ. server.py (Flask) и
+# server_async.py (Quart) - тонкие обёртки над этим модулем: они достают
+# из запроса тело и заголовки, берут замок партии так, как принято в их
+# модели (threading.Condition или asyncio.Condition), ждут записи на диск
+# (registry.sync) и превращают Reply в ответ своего фреймворка.
+# Функции "под game.lock" сами замок не берут, его держит обёртка.
+import json
+import random
+import threading
+
+import profiler
+import protocol
+import replay
+
+from admission import RateLimited, open_admission
+from analytics import Analytics
+from engine import DEFAULT_RULES, GameError, Rules, parse_uint
+from game import GameRegistry, MAX_BATCH, KEEPALIVE_FRAME, DROPPED_FRAME, parse_since
+from matchmaking import open_matchmaker, start_rated_game
+from metrics import METRICS_CONTENT_TYPE, Metrics
+from sharding import MATCHMAKING_KEY, WrongShard, check_owner, check_shard_key, open_directory
+from store import open_store
+
+JSON_CONTENT_TYPE = "application/json"
+# Период отправки keep-alive в потоке /events, секунды
+EVENTS_KEEPALIVE = 15
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class Reply:
+    # Готовый ответ: тело, код и заголовки; обёртка делает из него Response
+    __slots__ = ("body", "status", "headers")
+
+    def __init__(self, body, status=200, headers=None):
+        self.body = body
+        self.status = status
+        self.headers = headers if headers is not None else {}
+
+
+def json_bytes(result):
+    # Те же байты, что отдаёт jsonify Flask и Quart
+    return (json.dumps(result, separators=(",", ":"), sort_keys=True) + "\n").encode()
+
+
+def json_reply(result, status=200):
+    return Reply(json_bytes(result), status, {"Content-Type": JSON_CONTENT_TYPE})
+
+
+def is_json(mimetype):
+    return mimetype == JSON_CONTENT_TYPE or (
+        mimetype.startswith("application/") and mimetype.endswith("+json")
+    )
+
+
+def decode_body(mimetype, body):
+    # Тело запроса -> словарь: команда компактного протокола или объект JSON.
+    # Пустое или неразборчивое тело другого типа - пустой словарь,
+    # как у get_json(silent=True). Массив или число вместо объекта - 400:
+    # обработчики читают тело через data.get
+    if mimetype == protocol.CONTENT_TYPE:
+        return protocol.decode_request(body)
+    if not body or not is_json(mimetype):
+        return {}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return {}
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise GameError("Тело запроса должно быть объектом JSON")
+    return data
+
+
+def encode_reply(op, result, rules, compact):
+    # JSON или компактный протокол - по заголовку Accept (protocol.wants_compact)
+    if compact:
+        reply = Reply(protocol.encode(op, result, rules), headers={"Content-Type": protocol.CONTENT_TYPE})
+    else:
+        reply = json_reply(result)
+    reply.headers["Vary"] = "Accept"
+    return reply
+
+
+def error_reply(error, compact, full_path):
+    # Ответ на GameError и его подклассы; full_path - путь со строкой запроса
+    if isinstance(error, WrongShard):
+        # 307 сохраняет метод и тело: requests и браузеры повторят запрос у владельца
+        return Reply(b"", 307, {"Location": error.url + full_path.rstrip("?")})
+    if compact:
+        reply = Reply(protocol.encode_error(error), error.status, {"Content-Type": protocol.CONTENT_TYPE})
+    else:
+        reply = json_reply({"error": error.message}, error.status)
+    if isinstance(error, RateLimited):
+        reply.headers["Retry-After"] = str(error.retry_after)
+    return reply
+
+
+def error_result(error):
+    # Ошибка одной команды /batch, остальные команды выполняются
+    return {"error": error.message, "status": error.status}
+
+
+def etag_matches(header, etag):
+    # If-None-Match: "*" или метки через запятую, слабые (W/"...") сравниваются как сильные
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
+
+
+def status_reply(game, args, compact, if_none_match):
+    # Ответ /status под game.lock. Полный снимок кодируется один раз на
+    # версию партии (Game.status_bytes), а опрос с If-None-Match, пока
+    # партия не менялась, получает 304 без тела
+    since = parse_since(args.get("since"))
+    fmt = "msgpack" if compact else "json"
+    etag = game.status_etag(fmt)
+    if etag_matches(if_none_match, etag):
+        reply = Reply(b"", 304)
+    elif since is None:
+        if compact:
+            body = game.status_bytes(fmt, lambda result: protocol.encode("status", result, game.rules))
+            reply = Reply(body, headers={"Content-Type": protocol.CONTENT_TYPE})
+        else:
+            reply = Reply(game.status_bytes(fmt, json_bytes), headers={"Content-Type": JSON_CONTENT_TYPE})
+    else:
+        reply = encode_reply("status", game.delta(since), game.rules, compact)
+    reply.headers["ETag"] = f'"{etag}"'
+    reply.headers["Vary"] = "Accept"
+    # Кэши по пути обязаны переспрашивать сервер, ответ меняется каждым ходом
+    reply.headers["Cache-Control"] = "no-cache"
+    return reply
+
+
+def join(game, data):
+    # Под game.lock
+    player = game.join(data.get("player"))
+    return {"game_id": game.game_id, "player": player, "rules": game.rules.to_json()}
+
+
+def place_ships(game, data):
+    # Под game.lock
+    return game.place_ships(data.get("player"), data.get("ships", []))
+
+
+def fire(game, data):
+    # Под game.lock. Клиент может сразу получить изменения доски
+    # и не ходить в /status
+    result = game.fire(data.get("player"), data.get("target"))
+    since = parse_since(data.get("since"))
+    if since is not None:
+        result["delta"] = game.delta(since)
+    return result
+
+
+def restart(game):
+    # Под game.lock
+    game.restart()
+    return {"status": "Игра перезапущена!"}
+
+
+def reset_ready(game, data):
+    # Под game.lock
+    game.reset_ready(data.get("player"))
+    return {"status": "Готовность сброшена"}
+
+
+def batch_commands(data):
+    # Упорядоченный список команд place/fire/status для одной или
+    # нескольких партий за один запрос; ошибка одной команды
+    # не прерывает остальные
+    commands = data.get("commands")
+    if not isinstance(commands, list):
+        raise GameError("Ожидается список команд")
+    if len(commands) > MAX_BATCH:
+        raise GameError(f"Не больше {MAX_BATCH} команд за запрос")
+    return commands
+
+
+def last_event_id(headers, args):
+    return parse_uint(headers.get("Last-Event-ID") or args.get("since"))
+
+
+def next_chunk(game, version, max_lag=None):
+    # Очередная порция потока /events под game.lock, когда ожидание новых
+    # событий уже закончилось: (байты, новая версия, отключить ли подписчика).
+    # Кадры берутся из общего буфера партии: каждое событие кодируется
+    # один раз, сколько бы подписчиков его ни читали. Если задан max_lag,
+    # отставший на большее число событий подписчик отключается
+    if max_lag is not None and version is not None and game.version - version > max_lag:
+        return DROPPED_FRAME, version, True
+    frames = None if version is None else game.frames_since(version)
+    if frames is None:
+        # Клиент только подключился или сильно отстал
+        frames = [game.snapshot_frame()]
+    return (b"".join(frames) if frames else KEEPALIVE_FRAME), game.version, False
+
+
+def profile(args):
+    # Только при BATTLESHIP_PROFILER=1, см. profiler.py; занимает вызвавший
+    # поток на seconds секунд
+    seconds, interval, idle = profiler.parse_args(args)
+    samples, stacks = profiler.sample(seconds, interval, idle)
+    return Reply(profiler.render(samples, stacks), headers={"Content-Type": "text/plain; charset=utf-8"})
+
+
+class Service:
+    # Состояние процесса сервера, общее для всех маршрутов.
+    # lock_factory - замок партий, см. Game.lock
+    def __init__(self, lock_factory=threading.Condition):
+        # Шарды и владельцы партий; без BATTLESHIP_SHARDS - один процесс (см. sharding.py)
+        self.directory = open_directory()
+        self.limiter = open_admission()
+        # Все партии процесса, ключ - идентификатор игры
+        self.registry = GameRegistry(lock_factory=lock_factory, store=open_store(), owns=self.directory.owns)
+        self.registry.restore()
+        # Очередь подбора соперника и рейтинги игроков; на шарде без очереди -
+        # перенаправление к ней (см. matchmaking.py)
+        self.matchmaker = open_matchmaker(self.registry, self.directory)
+        # Счётчики и гистограммы для /metrics; выстрелы и концы партий
+        # приходят из событий всех партий реестра
+        self.metrics = Metrics()
+        self.registry.listeners.append(self.metrics.on_event)
+        # Архив сыгранных партий для /replay (BATTLESHIP_REPLAYS, см. replay.py)
+        self.replays = replay.open_archive()
+        if self.replays is not None:
+            self.registry.listeners.append(self.replays.on_event)
+        # Сводная статистика сыгранных партий для /stats (см. analytics.py)
+        self.analytics = Analytics()
+        self.registry.listeners.append(self.analytics.on_event)
+
+    def admit(self, ip, data):
+        # Ведра жетонов и предел одновременных запросов, см. admission.py.
+        # data - аргументы GET или тело POST. После допуска обязателен
+        # limiter.release(), когда запрос закончен
+        cost = 1
+        commands = data.get("commands")
+        if isinstance(commands, list):
+            cost = max(1, len(commands))
+        player = None
+        game_id, seat = data.get("game_id"), data.get("player")
+        if isinstance(game_id, str) and isinstance(seat, str):
+            player = (game_id, seat)
+        self.limiter.admit(ip, player, cost)
+
+    def find_game(self, game_id):
+        # Партия другого шарда: клиент получит 307 на адрес владельца
+        if isinstance(game_id, str):
+            check_owner(self.directory, game_id)
+        return self.registry.get(game_id)
+
+    def get_game(self, game_id):
+        # game_id из строки запроса или из тела
+        if not game_id:
+            raise GameError("Не указан идентификатор игры")
+        return self.find_game(game_id)
+
+    def command_game(self, command):
+        # Партия команды /batch или /ws
+        if not isinstance(command, dict):
+            raise GameError("Команда должна быть объектом")
+        return self.find_game(command.get("game_id"))
+
+    def create_game(self, data):
+        # Правила партии (размер поля, флот, касания) задаёт создатель
+        rules = Rules.from_json(data.get("rules"))
+        game, player = self.registry.create(data.get("player"), rules)
+        return {"game_id": game.game_id, "player": player, "rules": rules.to_json()}
+
+    def list_games(self):
+        return {"games": self.registry.list()}
+
+    def shards(self):
+        # Кольцо шардов: по нему клиент сам находит владельца партии (sharding.HashRing)
+        return self.directory.to_json()
+
+    def random_fleet(self, args):
+        # Случайная расстановка по правилам партии game_id (без него - по
+        # правилам по умолчанию) в том виде, в каком её принимает /place_ships;
+        # seed даёт одну и ту же расстановку
+        game_id = args.get("game_id")
+        rules = self.find_game(game_id).rules if game_id else DEFAULT_RULES
+        seed = args.get("seed")
+        rng = None
+        if seed is not None:
+            seed = parse_uint(seed)
+            if seed is None:
+                raise GameError("seed должен быть неотрицательным целым числом")
+            rng = random.Random(seed)
+        ships = rules.random_fleet(rng)
+        return {"ships": [rules.format_cells(cells) for cells in ships], "rules": rules.to_json()}
+
+    def enqueue(self, data):
+        return self.matchmaker.enqueue(data.get("name"))
+
+    def poll(self, args):
+        return self.matchmaker.poll(args.get("ticket"))
+
+    def cancel(self, data):
+        return self.matchmaker.cancel(data.get("ticket"))
+
+    def matchmaking_metrics(self):
+        return self.matchmaker.metrics()
+
+    def start_match(self, data, key):
+        # Внутренний запрос очереди с другого шарда: партия подбора
+        # с предложенным game_id, если он принадлежит этому шарду
+        check_shard_key(self.directory, key)
+        game = start_rated_game(self.registry, data.get("game_id"), self.matchmaker.report)
+        return {"game_id": game.game_id, "rules": game.rules.to_json()}
+
+    def report_result(self, data, key):
+        # Внутренний запрос шарда, на котором выиграна партия подбора
+        check_shard_key(self.directory, key)
+        check_owner(self.directory, MATCHMAKING_KEY)
+        self.matchmaker.report(data.get("game_id"), data.get("winner"))
+        return {"status": "ok"}
+
+    def archive(self):
+        if self.replays is None:
+            raise GameError("Запись партий выключена (BATTLESHIP_REPLAYS)", 404)
+        return self.replays
+
+    def list_replays(self, args):
+        return {"replays": self.archive().list(args.get("game_id"))}
+
+    def replay(self, number, args):
+        # Запись партии с хода move: положение на этом ходе и следующие
+        # выстрелы. Первая перемотка проигрывает всю партию
+        move, limit = replay.parse_args(args)
+        return self.archive().get(number).to_json(move, limit)
+
+    def render_metrics(self):
+        body = self.metrics.render(len(self.registry), self.limiter.to_json())
+        return Reply(body, headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+    def stats(self):
+        # Готовые байты: агрегаты обновляются в конце партий, не здесь
+        return Reply(self.analytics.render(), headers={"Content-Type": JSON_CONTENT_TYPE})
+
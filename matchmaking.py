@@ -0,0 +1,344 @@
+# Подбор соперника: игрок встаёт в очередь по имени, сервер сам создаёт
+# партию, как только найдётся соперник с близким рейтингом.
+#
+# Очередь разбита на корзины по рейтингу шириной BUCKET_WIDTH. Новый билет
+# сразу сравнивается с ожидающими в своей и соседних корзинах, поэтому
+# в одной корзине никогда не ждут двое и поиск стоит O(MAX_SPREAD), сколько
+# бы игроков ни ждало. Чем дольше игрок ждёт, тем шире допустимая разница.
+#
+# Очередь живёт в одном процессе: на единственном сервере или на шарде -
+# владельце MATCHMAKING_KEY (Matchmaker). На остальных шардах её место
+# занимает RemoteMatchmaker: клиенты получают 307 на шард очереди, а победы
+# в сыгранных здесь партиях подбора отправляются туда же. Саму партию
+# очередь создаёт на владельце свежего идентификатора, так что партии из
+# подбора расходятся по всему кольцу; выбирает реализацию open_matchmaker.
+#
+# Замки: Matchmaker.lock держится только на время работы с очередью;
+# партия создаётся после его освобождения. Рейтинги обновляются из
+# Game.fire под game.lock и берут только свой замок Ratings.lock.
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from engine import SEATS, GameError
+from game import new_game_id
+from sharding import MATCHMAKING_KEY, LocalDirectory, WrongShard, call_shard
+
+# Начальный рейтинг и коэффициент K формулы Эло
+INITIAL_RATING = 1500
+ELO_K = 32
+# Ширина корзины рейтинга
+BUCKET_WIDTH = 100
+# Раз в сколько секунд ожидания допустимая разница растёт на одну корзину
+WIDEN_EVERY = 5
+# Больше скольких корзин разница не растёт
+MAX_SPREAD = 10
+# Билет без опроса дольше этого времени считается брошенным
+TICKET_TIMEOUT = 30
+# Сколько последних времён ожидания хранится для метрик
+WAIT_SAMPLES = 1000
+# Сколько партий подбора помнить до победы; брошенные вытесняются
+MAX_RATED_GAMES = 100000
+
+WAITING = "waiting"
+# Соперник выбран, партия создаётся; клиенту это всё ещё ожидание
+PAIRING = "pairing"
+MATCHED = "matched"
+
+
+def expected_score(rating, opponent):
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+class Ratings:
+    def __init__(self):
+        self.ratings = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            return self.ratings.get(name, INITIAL_RATING)
+
+    def record(self, winner, loser):
+        with self.lock:
+            rw = self.ratings.get(winner, INITIAL_RATING)
+            rl = self.ratings.get(loser, INITIAL_RATING)
+            delta = ELO_K * (1 - expected_score(rw, rl))
+            self.ratings[winner] = rw + delta
+            self.ratings[loser] = rl - delta
+
+
+class Ticket:
+    __slots__ = ("ticket_id", "name", "rating", "bucket", "enqueued_at", "last_seen",
+                 "state", "game_id", "player", "opponent", "rules")
+
+    def __init__(self, name, rating, now):
+        self.ticket_id = uuid.uuid4().hex
+        self.name = name
+        self.rating = rating
+        self.bucket = int(rating // BUCKET_WIDTH)
+        self.enqueued_at = now
+        self.last_seen = now
+        self.state = WAITING
+        self.game_id = None
+        self.player = None
+        self.opponent = None
+        self.rules = None
+
+    def spread(self, now):
+        return min(MAX_SPREAD, int((now - self.enqueued_at) // WIDEN_EVERY))
+
+    def to_json(self, now):
+        result = {
+            "ticket": self.ticket_id,
+            "status": MATCHED if self.state == MATCHED else WAITING,
+            "name": self.name,
+            "rating": round(self.rating)
+        }
+        if self.state != MATCHED:
+            result["wait_seconds"] = round(now - self.enqueued_at, 1)
+        else:
+            result.update(game_id=self.game_id, player=self.player,
+                          opponent=self.opponent, rules=self.rules)
+        return result
+
+
+def start_rated_game(registry, game_id, report):
+    # Партия подбора в реестре этого процесса. Оба места заняты до того,
+    # как партия станет видна, чужой join в неё не попадёт; после победы
+    # report(game_id, победитель) обновит рейтинги
+    game, _ = registry.create("player1", claim_all=True, game_id=game_id)
+    game.on_finish = lambda game: report(game.game_id, game.winner)
+    return game
+
+
+class Matchmaker:
+    # Очередь в этом процессе; directory - куда класть партии (sharding.py)
+    def __init__(self, registry, directory=None, ratings=None):
+        self.registry = registry
+        self.directory = directory or LocalDirectory()
+        self.ratings = ratings or Ratings()
+        # Корзина -> билет, который в ней ждёт (не больше одного)
+        self.buckets = {}
+        # Все живые билеты в порядке последнего опроса, в начале самые старые
+        self.tickets = OrderedDict()
+        self.waiting_names = {}
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        # Партии подбора, ждущие победы: game_id -> (имя player1, имя player2)
+        self.rated = OrderedDict()
+        self.counters = {"enqueued": 0, "matched": 0, "cancelled": 0, "expired": 0, "start_failed": 0}
+        self.lock = threading.Lock()
+
+    def enqueue(self, name):
+        if not isinstance(name, str) or not name.strip():
+            raise GameError("Не указано имя игрока")
+        name = name.strip()
+        rating = self.ratings.get(name)
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            if name in self.waiting_names:
+                raise GameError("Игрок уже в очереди", 409)
+            ticket = Ticket(name, rating, now)
+            self.tickets[ticket.ticket_id] = ticket
+            self.counters["enqueued"] += 1
+            opponent = self._find_opponent(ticket, now)
+            if opponent is None:
+                self._requeue(ticket)
+            else:
+                ticket.state = PAIRING
+        if opponent is not None:
+            self._start_game(opponent, ticket, now)
+        return ticket.to_json(now)
+
+    def poll(self, ticket_id):
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            ticket = self.tickets.get(ticket_id) if isinstance(ticket_id, str) else None
+            if ticket is None:
+                raise GameError("Билет не найден", 404)
+            ticket.last_seen = now
+            self.tickets.move_to_end(ticket_id)
+            opponent = None
+            if ticket.state == WAITING:
+                # За время ожидания допустимая разница рейтингов могла вырасти
+                opponent = self._find_opponent(ticket, now)
+                if opponent is not None:
+                    self._unqueue(ticket)
+                    ticket.state = PAIRING
+        if opponent is not None:
+            self._start_game(opponent, ticket, now)
+        return ticket.to_json(now)
+
+    def cancel(self, ticket_id):
+        with self.lock:
+            ticket = self.tickets.get(ticket_id) if isinstance(ticket_id, str) else None
+            if ticket is None:
+                raise GameError("Билет не найден", 404)
+            if ticket.state != WAITING:
+                raise GameError("Соперник уже найден", 409)
+            self._unqueue(ticket)
+            del self.tickets[ticket_id]
+            self.counters["cancelled"] += 1
+        return {"ticket": ticket_id, "status": "cancelled"}
+
+    def metrics(self):
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            waiting = list(self.waiting_names.values())
+            waits = sorted(self.waits)
+            counters = dict(self.counters)
+        buckets = {}
+        for ticket in waiting:
+            low = ticket.bucket * BUCKET_WIDTH
+            key = f"{low}-{low + BUCKET_WIDTH - 1}"
+            buckets[key] = buckets.get(key, 0) + 1
+        return {
+            "waiting": len(waiting),
+            "buckets": buckets,
+            "oldest_wait_seconds": round(max((now - t.enqueued_at for t in waiting), default=0), 1),
+            "wait_seconds": {
+                "samples": len(waits),
+                "p50": percentile(waits, 50),
+                "p90": percentile(waits, 90),
+                "p99": percentile(waits, 99),
+                "max": round(waits[-1], 3) if waits else 0
+            },
+            **counters
+        }
+
+    def _find_opponent(self, ticket, now):
+        # Вызывается под self.lock. Ближайшие корзины проверяются первыми;
+        # пара годится, если разница укладывается в окно хотя бы одного из двух
+        spread = ticket.spread(now)
+        for distance in range(MAX_SPREAD + 1):
+            for bucket in {ticket.bucket - distance, ticket.bucket + distance}:
+                candidate = self.buckets.get(bucket)
+                if candidate is None or candidate is ticket:
+                    continue
+                if distance <= max(spread, candidate.spread(now)):
+                    self._unqueue(candidate)
+                    candidate.state = PAIRING
+                    return candidate
+        return None
+
+    def _requeue(self, ticket):
+        # Корзина может быть занята, если партию создать не удалось;
+        # тогда билет ищет соперника только при своих опросах
+        ticket.state = WAITING
+        self.buckets.setdefault(ticket.bucket, ticket)
+        self.waiting_names[ticket.name] = ticket
+
+    def _unqueue(self, ticket):
+        if self.buckets.get(ticket.bucket) is ticket:
+            del self.buckets[ticket.bucket]
+        self.waiting_names.pop(ticket.name, None)
+
+    def _start_game(self, first, second, now):
+        # Без замка очереди: create берёт замок реестра, а партия на другом
+        # шарде - это запрос к нему. Если партию создать не удалось (реестр
+        # полон, шард недоступен), оба билета снова ждут, и вызвавший
+        # получает свой билет со статусом waiting - иначе клиент счёл бы
+        # билет потерянным, а тот висел бы до TICKET_TIMEOUT
+        try:
+            game_id, rules = self.create_game()
+        except GameError:
+            with self.lock:
+                self._requeue(first)
+                self._requeue(second)
+                self.counters["start_failed"] += 1
+            return
+        with self.lock:
+            self.rated[game_id] = (first.name, second.name)
+            while len(self.rated) > MAX_RATED_GAMES:
+                self.rated.popitem(last=False)
+            for ticket, player, opponent in ((first, "player1", second), (second, "player2", first)):
+                ticket.state = MATCHED
+                ticket.game_id = game_id
+                ticket.player = player
+                ticket.opponent = opponent.name
+                ticket.rules = rules
+                self.waits.append(now - ticket.enqueued_at)
+            self.counters["matched"] += 1
+
+    def create_game(self):
+        # Партия достаётся владельцу свежего идентификатора, а не шарду
+        # очереди: (game_id, правила)
+        game_id = new_game_id()
+        owner = self.directory.owner(game_id)
+        if owner is None:
+            game = start_rated_game(self.registry, game_id, self.report)
+            return game.game_id, game.rules.to_json()
+        result = call_shard(owner, "/matchmaking/games", {"game_id": game_id}, self.directory.key)
+        return result["game_id"], result["rules"]
+
+    def report(self, game_id, winner):
+        # Победа в партии подбора: из Game.fire под game.lock или с другого
+        # шарда (/matchmaking/result). Каждая партия учитывается один раз
+        with self.lock:
+            names = self.rated.pop(game_id, None) if isinstance(game_id, str) else None
+        if names is None or winner not in SEATS:
+            return
+        first, second = names
+        if winner == "player1":
+            self.ratings.record(first, second)
+        else:
+            self.ratings.record(second, first)
+
+    def _expire(self, now):
+        # Вызывается под self.lock; билеты упорядочены по последнему опросу
+        while self.tickets:
+            ticket_id, ticket = next(iter(self.tickets.items()))
+            if now - ticket.last_seen < TICKET_TIMEOUT:
+                break
+            del self.tickets[ticket_id]
+            if ticket.state == WAITING:
+                self._unqueue(ticket)
+                self.counters["expired"] += 1
+
+
+class RemoteMatchmaker:
+    # Очередь на другом шарде (url): её маршруты отвечают 307 туда,
+    # а победы в партиях подбора этого шарда отправляются ей
+    def __init__(self, url, key=None):
+        self.url = url
+        self.key = key
+
+    def enqueue(self, name):
+        raise WrongShard(self.url)
+
+    def poll(self, ticket_id):
+        raise WrongShard(self.url)
+
+    def cancel(self, ticket_id):
+        raise WrongShard(self.url)
+
+    def metrics(self):
+        raise WrongShard(self.url)
+
+    def report(self, game_id, winner):
+        # Вызывается под game.lock, поэтому запрос уходит из отдельного потока
+        threading.Thread(target=self.send_report, args=(game_id, winner), daemon=True).start()
+
+    def send_report(self, game_id, winner):
+        try:
+            call_shard(self.url, "/matchmaking/result", {"game_id": game_id, "winner": winner}, self.key)
+        except GameError:
+            # Шард очереди недоступен: рейтинги этой партии не изменятся
+            pass
+
+
+def open_matchmaker(registry, directory):
+    owner = directory.owner(MATCHMAKING_KEY)
+    if owner is None:
+        return Matchmaker(registry, directory)
+    return RemoteMatchmaker(owner, directory.key)
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 3)
@@ -0,0 +1,160 @@
+# Метрики сервера в текстовом формате Prometheus (GET /metrics):
+# запросы и задержки по маршрутам, размеры JSON, активные партии,
+# выстрелы и длительность партий. Без внешних зависимостей.
+#
+# Счётчики меняются из обработчиков запросов и из Game.emit (под game.lock),
+# поэтому у Metrics свой замок, под которым не берутся никакие другие.
+import threading
+import time
+from collections import deque
+
+# Границы корзин гистограмм, как принято в Prometheus: "не больше le"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+DURATION_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+# Тип ответа /metrics: текстовый формат Prometheus
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# За сколько последних секунд считается battleship_shots_per_second
+SHOTS_WINDOW = 10
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # Храним число значений в каждой корзине, накопительные суммы
+        # считаются только при выводе
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels=""):
+        lines = []
+        total = 0
+        sep = "," if labels else ""
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {total}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+def label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (маршрут, метод, код ответа) -> число запросов
+        self.requests = {}
+        # маршрут -> гистограмма
+        self.latency = {}
+        self.request_size = {}
+        self.response_size = {}
+        self.shots = 0
+        # Выстрелы по секундам за последние SHOTS_WINDOW секунд: [секунда, число]
+        self.shot_seconds = deque()
+        self.games_finished = 0
+        self.durations = Histogram(DURATION_BUCKETS)
+
+    def observe_request(self, route, method, status, seconds, request_bytes, response_bytes):
+        with self.lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if route not in self.latency:
+                self.latency[route] = Histogram(LATENCY_BUCKETS)
+                self.request_size[route] = Histogram(SIZE_BUCKETS)
+                self.response_size[route] = Histogram(SIZE_BUCKETS)
+            self.latency[route].observe(seconds)
+            if request_bytes is not None:
+                self.request_size[route].observe(request_bytes)
+            if response_bytes is not None:
+                self.response_size[route].observe(response_bytes)
+
+    def on_event(self, game, event):
+        # Слушатель событий партии (Game.listeners), вызывается под game.lock
+        kind = event["type"]
+        if kind == "shot":
+            second = int(time.monotonic())
+            with self.lock:
+                self.shots += 1
+                if self.shot_seconds and self.shot_seconds[-1][0] == second:
+                    self.shot_seconds[-1][1] += 1
+                else:
+                    self.shot_seconds.append([second, 1])
+                    while self.shot_seconds[0][0] <= second - SHOTS_WINDOW:
+                        self.shot_seconds.popleft()
+        elif kind == "game_over":
+            duration = time.time() - game.started_at
+            with self.lock:
+                self.games_finished += 1
+                self.durations.observe(duration)
+
+    def shots_per_second(self, now):
+        recent = sum(count for second, count in self.shot_seconds if second > now - SHOTS_WINDOW)
+        return recent / SHOTS_WINDOW
+
+    def render(self, active_games, admission=None):
+        # admission - Admission.to_json() (см. admission.py)
+        now = int(time.monotonic())
+        with self.lock:
+            lines = [
+                "# HELP battleship_requests_total Обработанные HTTP-запросы.",
+                "# TYPE battleship_requests_total counter",
+            ]
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'battleship_requests_total{{route="{label(route)}",method="{method}",'
+                    f'status="{status}"}} {count}'
+                )
+            for name, title, histograms in (
+                ("battleship_request_duration_seconds", "Время обработки запроса.", self.latency),
+                ("battleship_request_size_bytes", "Размер тела запроса.", self.request_size),
+                ("battleship_response_size_bytes", "Размер тела ответа.", self.response_size),
+            ):
+                lines.append(f"# HELP {name} {title}")
+                lines.append(f"# TYPE {name} histogram")
+                for route, histogram in sorted(histograms.items()):
+                    lines.extend(histogram.render(name, f'route="{label(route)}"'))
+
+            lines += [
+                "# HELP battleship_active_games Партии в памяти процесса.",
+                "# TYPE battleship_active_games gauge",
+                f"battleship_active_games {active_games}",
+                "# HELP battleship_shots_total Принятые выстрелы.",
+                "# TYPE battleship_shots_total counter",
+                f"battleship_shots_total {self.shots}",
+                f"# HELP battleship_shots_per_second Выстрелы в секунду за последние {SHOTS_WINDOW} с.",
+                "# TYPE battleship_shots_per_second gauge",
+                f"battleship_shots_per_second {self.shots_per_second(now):.3f}",
+                "# HELP battleship_games_finished_total Завершённые партии.",
+                "# TYPE battleship_games_finished_total counter",
+                f"battleship_games_finished_total {self.games_finished}",
+                "# HELP battleship_game_duration_seconds Длительность партии от создания или рестарта до победы.",
+                "# TYPE battleship_game_duration_seconds histogram",
+            ]
+            lines.extend(self.durations.render("battleship_game_duration_seconds"))
+        if admission is not None:
+            lines += [
+                "# HELP battleship_requests_in_flight Ограничиваемые запросы в обработке.",
+                "# TYPE battleship_requests_in_flight gauge",
+                f"battleship_requests_in_flight {admission['in_flight']}",
+                "# HELP battleship_requests_rejected_total Запросы, отклонённые допуском.",
+                "# TYPE battleship_requests_rejected_total counter",
+            ]
+            for reason, count in sorted(admission["rejected"].items()):
+                lines.append(f'battleship_requests_rejected_total{{reason="{reason}"}} {count}')
+        return "\n".join(lines) + "\n"
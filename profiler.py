@@ -0,0 +1,89 @@
+# Сэмплирующий профайлер для работающего сервера: каждые interval секунд
+# снимает стеки всех потоков (sys._current_frames) и считает одинаковые.
+# Ответ - свёрнутые стеки "функция;функция;... число", их читают
+# flamegraph.pl и speedscope.
+#
+# Выключен по умолчанию. С BATTLESHIP_PROFILER=1 запрос
+# GET /debug/profile?seconds=10 профилирует сервер без перезапуска;
+# потоки, которые просто ждут (сокет, замок, select), не показываются,
+# если не передать idle=1.
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from engine import GameError
+
+ENABLED = os.environ.get("BATTLESHIP_PROFILER", "") not in ("", "0")
+DEFAULT_SECONDS = 5
+MAX_SECONDS = 60
+DEFAULT_INTERVAL = 0.005
+MIN_INTERVAL = 0.001
+# Сколько самых частых стеков выводить
+MAX_STACKS = 200
+# Функции, на которых поток стоит в ожидании, а не работает
+IDLE_FUNCTIONS = frozenset({
+    "wait", "select", "poll", "accept", "readinto", "recv_into", "_worker",
+    "_wait_for_tstate_lock", "serve_forever"
+})
+
+# Профилей не больше одного одновременно: сэмплер сам нагружает процесс
+_busy = threading.Lock()
+
+
+def frame_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+def parse_args(args):
+    # Параметры запроса /debug/profile: seconds, interval, idle
+    if not ENABLED:
+        raise GameError("Профайлер выключен (BATTLESHIP_PROFILER=1)", 404)
+    try:
+        seconds = float(args.get("seconds", DEFAULT_SECONDS))
+        interval = float(args.get("interval", DEFAULT_INTERVAL))
+    except ValueError:
+        raise GameError("seconds и interval должны быть числами")
+    if not 0 < seconds <= MAX_SECONDS:
+        raise GameError(f"seconds должно быть от 0 до {MAX_SECONDS}")
+    if not MIN_INTERVAL <= interval <= seconds:
+        raise GameError(f"interval должен быть от {MIN_INTERVAL} до seconds")
+    return seconds, interval, args.get("idle") == "1"
+
+
+def sample(seconds, interval, idle=False):
+    # Блокирует вызывающий поток на seconds; асинхронный сервер
+    # вызывает его через asyncio.to_thread
+    if not _busy.acquire(blocking=False):
+        raise GameError("Профилирование уже идёт", 409)
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if not idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                    continue
+                stacks[frame_stack(frame)] += 1
+            samples += 1
+            time.sleep(interval)
+    finally:
+        _busy.release()
+    return samples, stacks
+
+
+def render(samples, stacks):
+    lines = [f"# samples: {samples}, stacks: {len(stacks)}"]
+    for stack, count in stacks.most_common(MAX_STACKS):
+        lines.append(f"{stack} {count}")
+    return "\n".join(lines) + "\n"
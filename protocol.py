@@ -0,0 +1,217 @@
+# Компактный протокол рядом с JSON: MessagePack, числовые коды исходов
+# (engine.MISS ... engine.GAME_OVER), места игроков 0/1 и номера клеток
+# row * width + col вместо строк "Попал!" и "A10".
+#
+# По HTTP выбирается заголовками: тело запроса с Content-Type CONTENT_TYPE
+# разбирается как команда, ответ кодируется так же, если Accept предпочитает
+# CONTENT_TYPE. Через WebSocket /ws (server_async.py) ходят те же массивы
+# в конверте [seq, ...], ответ - [seq, тело].
+#
+# Все сообщения - массивы с фиксированным порядком полей:
+#   команды   [PLACE, game_id, seat, ships]
+#             [FIRE, game_id, seat, cell, since]
+#             [STATUS, game_id, since]
+#             [SUBSCRIBE, game_id, since]          только WebSocket
+#   place     [ready, both_ready]
+#   fire      [code, turn, game_over, winner, version, sunk, delta]
+#   снимок    [SNAPSHOT, version, [width, height, fleet, touching], turn,
+#              game_over, winner, [ready1, ready2],
+#              [hits1, misses1, hits2, misses2], ships]
+#   изменения [DELTA, version, since, events]
+#   событие   [version, EVENT_TYPES.index(type), поля в порядке EVENT_FIELDS]
+# Ошибка - единственный словарь: {"error": текст, "status": код}; у отказа
+# допуска (429, 503) ещё "retry_after" - через сколько секунд повторить.
+import msgpack
+
+from engine import RESULT_TEXT, SEATS, GameError, is_int
+
+CONTENT_TYPE = "application/x-msgpack"
+
+# Команды
+PLACE = 0
+FIRE = 1
+STATUS = 2
+SUBSCRIBE = 3
+OPS = {PLACE: "place", FIRE: "fire", STATUS: "status", SUBSCRIBE: "subscribe"}
+
+# Вид ответа на STATUS
+SNAPSHOT = 0
+DELTA = 1
+
+RESULT_CODES = {text: code for code, text in RESULT_TEXT.items()}
+EVENT_TYPES = ("join", "ready", "turn", "shot", "game_over", "reveal", "restart")
+# Поля событий после версии и типа; места и клетки переводятся в числа
+EVENT_FIELDS = {
+    "join": ("player",),
+    "ready": ("player", "ready"),
+    "turn": ("turn",),
+    "shot": ("player", "target", "hit", "sunk"),
+    "game_over": ("winner",),
+    "reveal": ("ships",),
+    "restart": (),
+}
+SEAT_FIELDS = frozenset({"player", "turn", "winner"})
+
+
+def wants_compact(accept):
+    # accept - разобранный Accept (request.accept_mimetypes); при */*
+    # и без заголовка остаётся JSON
+    return accept.best_match(("application/json", CONTENT_TYPE)) == CONTENT_TYPE
+
+
+def seat_index(seat):
+    return None if seat is None else SEATS.index(seat)
+
+
+def seat_name(index):
+    # Неверный номер места превращается в None, его отвергнет Match.check_player
+    if isinstance(index, int) and not isinstance(index, bool) and 0 <= index < len(SEATS):
+        return SEATS[index]
+    return None
+
+
+def unpack(data):
+    try:
+        return msgpack.unpackb(data)
+    except (ValueError, TypeError):
+        raise GameError("Неверное сообщение MessagePack")
+
+
+def pack(obj):
+    return msgpack.packb(obj)
+
+
+def decode_command(message):
+    # Массив команды -> словарь в формате команд /batch (Game.execute).
+    # Код операции проверяется до поиска в OPS: список или словарь на его
+    # месте не хэшируется, и клиент должен получить 400, а не 500
+    if not isinstance(message, list) or not message or not is_int(message[0]) or message[0] not in OPS:
+        raise GameError("Неверная команда")
+    op = message[0]
+    args = message[1:]
+    command = {"op": OPS[op], "game_id": args[0] if args else None}
+    if op == PLACE:
+        if len(args) != 3:
+            raise GameError("Команда place: [0, game_id, seat, ships]")
+        command.update(player=seat_name(args[1]), ships=args[2])
+    elif op == FIRE:
+        if len(args) != 4:
+            raise GameError("Команда fire: [1, game_id, seat, cell, since]")
+        command.update(player=seat_name(args[1]), target=args[2], since=args[3])
+    else:
+        if len(args) != 2:
+            raise GameError("Команда: [op, game_id, since]")
+        command["since"] = args[1]
+    return command
+
+
+def decode_request(data):
+    # Тело HTTP-запроса
+    return decode_command(unpack(data))
+
+
+def decode_message(data):
+    # Сообщение WebSocket: [seq, op, ...] -> (seq, команда)
+    message = unpack(data)
+    if not isinstance(message, list) or not message:
+        raise GameError("Неверное сообщение")
+    return message[0], decode_command(message[1:])
+
+
+def compact_cells(cells, rules):
+    # Клетки из ответов Game уже в каноническом виде: на больших полях это
+    # числа, на малых - строки из таблицы coord_to_cell
+    if cells is None or not rules.letters:
+        return cells
+    if rules.coord_to_cell is not None:
+        table = rules.coord_to_cell
+        return [table[cell] for cell in cells]
+    parse = rules.parse_cell
+    return [parse(cell) for cell in cells]
+
+
+def compact_fleets(ships, rules):
+    if ships is None:
+        return None
+    return [[compact_cells(cells, rules) for cells in ships[seat]] for seat in SEATS]
+
+
+def compact_event(event, rules):
+    kind = event["type"]
+    compact = [event["version"], EVENT_TYPES.index(kind)]
+    for field in EVENT_FIELDS[kind]:
+        value = event[field]
+        if field in SEAT_FIELDS:
+            value = seat_index(value)
+        elif field == "target":
+            value = rules.parse_cell(value)
+        elif field == "sunk":
+            value = compact_cells(value, rules)
+        elif field == "ships":
+            value = compact_fleets(value, rules)
+        compact.append(value)
+    return compact
+
+
+def compact_status(result, rules):
+    # Ответ на STATUS: полный снимок (Game.status) или изменения (Game.delta)
+    if "events" in result:
+        return [DELTA, result["version"], result["since"],
+                [compact_event(event, rules) for event in result["events"]]]
+    shape = result["rules"]
+    return [
+        SNAPSHOT,
+        result["version"],
+        [shape["width"], shape["height"], shape["fleet"], shape["touching"]],
+        seat_index(result["current_turn"]),
+        result["game_over"],
+        seat_index(result["winner"]),
+        [result["player1_ready"], result["player2_ready"]],
+        [compact_cells(result[f"{seat}_{kind}"], rules)
+         for seat in SEATS for kind in ("hits", "misses")],
+        compact_fleets(result.get("ships"), rules),
+    ]
+
+
+def compact_fire(result, rules):
+    # Ответы на повтор и на выстрел после конца партии содержат не все поля
+    delta = result.get("delta")
+    return [
+        RESULT_CODES[result["result"]],
+        seat_index(result.get("turn")),
+        result.get("game_over", "winner" in result),
+        seat_index(result.get("winner")),
+        result.get("version"),
+        compact_cells(result.get("sunk"), rules),
+        None if delta is None else compact_status(delta, rules),
+    ]
+
+
+def compact_place(result, rules):
+    return [result["ready"], result["both_ready"]]
+
+
+COMPACT = {"place": compact_place, "fire": compact_fire, "status": compact_status}
+
+
+def compact_error(error):
+    result = {"error": error.message, "status": error.status}
+    # admission.RateLimited: по WebSocket заголовка Retry-After нет
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        result["retry_after"] = retry_after
+    return result
+
+
+def encode(op, result, rules):
+    return pack(COMPACT[op](result, rules))
+
+
+def encode_reply(seq, op, result, rules):
+    return pack([seq, COMPACT[op](result, rules)])
+
+
+def encode_error(error, seq=None):
+    if seq is None:
+        return pack(compact_error(error))
+    return pack([seq, compact_error(error)])
@@ -0,0 +1,301 @@
+# Запись сыгранных партий и их просмотр с любого хода.
+#
+# Когда партия выиграна, её раунд (от создания или рестарта до победы)
+# дописывается в архив одной записью: заголовок, расстановки обоих игроков,
+# затем выстрелы с временем. Архив только растёт, формат фиксированный,
+# поэтому его можно читать через mmap, не загружая целиком (см. replay_stats.py).
+#
+# Запись в архиве:
+#   заголовок HEADER: магия, длина записи, game_id, ширина, высота, число
+#             кораблей у игрока, победитель, touching, начало раунда (unix),
+#             число выстрелов
+#   для каждого игрока: длины кораблей uint16[ships], клетки uint32[сумма длин]
+#   выстрелы SHOT[shots]: мс от начала раунда, клетка, место 0/1, код исхода
+#
+# Выбор архива - переменная окружения BATTLESHIP_REPLAYS (путь к файлу);
+# не задана - партии не записываются.
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from engine import HIT, MISS, RESULT_TEXT, SEATS, SUNK, WIN, GameError, Match, Rules, parse_uint
+from board import make_board
+from game import RoundListener
+
+MAGIC = b"BSR1"
+HEADER = struct.Struct("<4sI12sHHHBBdI")
+SHOT = struct.Struct("<IIBB")
+# Между контрольными точками не больше стольких выстрелов, а всего точек
+# не больше MAX_CHECKPOINTS: перемотка повторяет на движке не больше
+# max(CHECKPOINT_EVERY, shots / MAX_CHECKPOINTS) выстрелов
+CHECKPOINT_EVERY = 128
+MAX_CHECKPOINTS = 64
+# Сколько разобранных записей держать в памяти
+REPLAY_CACHE = 32
+# Сколько выстрелов отдавать за один запрос /replay
+MAX_REPLAY_SHOTS = 1000
+
+
+def shot_outcome(game, event):
+    # Код исхода по событию shot; победный выстрел - последний в раунде
+    if not event["hit"]:
+        return MISS
+    if game.game_over and game.winner == event["player"]:
+        return WIN
+    return SUNK if event["sunk"] else HIT
+
+
+def encode_record(game_id, rules, winner, started_at, fleets, shots):
+    # fleets - по игроку список кораблей (списков клеток);
+    # shots - список (мс, клетка, место, исход)
+    ships = len(fleets[0])
+    body = bytearray()
+    for fleet in fleets:
+        body += array("H", [len(cells) for cells in fleet]).tobytes()
+        body += array("I", [cell for cells in fleet for cell in cells]).tobytes()
+    for shot in shots:
+        body += SHOT.pack(*shot)
+    header = HEADER.pack(
+        MAGIC, HEADER.size + len(body), game_id.encode()[:12].ljust(12), rules.width,
+        rules.height, ships, SEATS.index(winner), rules.touching, started_at, len(shots)
+    )
+    return header + body
+
+
+def iter_records(buffer, offset=0):
+    # (смещение, заголовок) каждой целой записи; читает только заголовки.
+    # Недописанная запись в конце архива (сбой при записи) пропускается
+    size = len(buffer)
+    while offset + HEADER.size <= size:
+        header = HEADER.unpack_from(buffer, offset)
+        length = header[1]
+        if header[0] != MAGIC or length < HEADER.size or offset + length > size:
+            break
+        yield offset, header
+        offset += length
+
+
+class Replay:
+    # Одна запись архива и движок перемотки: состояние на ходе N
+    # восстанавливается из ближайшей контрольной точки и догоняется
+    # выстрелами через Match.shoot
+    def __init__(self, number, buffer, offset):
+        (_, length, game_id, width, height, ships, winner, touching,
+         self.started_at, self.moves) = HEADER.unpack_from(buffer, offset)
+        self.number = number
+        self.game_id = game_id.rstrip(b"\0 ").decode()
+        self.winner = SEATS[winner]
+        position = offset + HEADER.size
+        self.fleets = []
+        for _ in SEATS:
+            lengths = array("H", buffer[position:position + 2 * ships])
+            position += 2 * ships
+            cells = array("I", buffer[position:position + 4 * sum(lengths)])
+            position += 4 * sum(lengths)
+            fleet, start = [], 0
+            for size in lengths:
+                fleet.append(list(cells[start:start + size]))
+                start += size
+            self.fleets.append(fleet)
+        # Флот по правилам - длины кораблей первого игрока
+        self.rules = Rules(width, height, [len(cells) for cells in self.fleets[0]], bool(touching))
+        self.shots = [SHOT.unpack_from(buffer, position + i * SHOT.size) for i in range(self.moves)]
+        self.every = max(CHECKPOINT_EVERY, -(-self.moves // MAX_CHECKPOINTS))
+        self.checkpoints = None
+        self.lock = threading.Lock()
+
+    def new_match(self):
+        match = Match(self.rules)
+        for seat, fleet in zip(SEATS, self.fleets):
+            match.place(seat, fleet)
+        return match
+
+    def build_checkpoints(self):
+        # Один проход по всей партии; заодно проверяется, что движок
+        # даёт те же исходы, что записаны
+        match = self.new_match()
+        checkpoints = [self.checkpoint(match)]
+        for move, (_, cell, seat, outcome) in enumerate(self.shots, 1):
+            if match.shoot(SEATS[seat], cell) != outcome:
+                raise GameError("Запись партии повреждена", 500)
+            if move % self.every == 0:
+                checkpoints.append(self.checkpoint(match))
+        return checkpoints
+
+    @staticmethod
+    def checkpoint(match):
+        return (match.current_turn, match.game_over, match.winner,
+                {seat: board.dump() for seat, board in match.players.items()})
+
+    def match_at(self, move):
+        with self.lock:
+            if self.checkpoints is None:
+                self.checkpoints = self.build_checkpoints()
+        turn, game_over, winner, boards = self.checkpoints[move // self.every]
+        match = Match(self.rules)
+        match.current_turn, match.game_over, match.winner = turn, game_over, winner
+        match.players = {
+            seat: type(make_board(self.rules.width, self.rules.height)).load(data)
+            for seat, data in boards.items()
+        }
+        for _, cell, seat, _ in self.shots[move - move % self.every:move]:
+            match.shoot(SEATS[seat], cell)
+        return match
+
+    def state(self, move):
+        # Положение после move выстрелов в формате Game.status
+        match = self.match_at(move)
+        format_cells = self.rules.format_cells
+        state = {
+            "move": move,
+            "current_turn": match.current_turn,
+            "game_over": match.game_over,
+            "winner": match.winner
+        }
+        for seat, board in match.players.items():
+            state[f"{seat}_hits"] = format_cells(board.hit_cells())
+            state[f"{seat}_misses"] = format_cells(board.miss_cells())
+        return state
+
+    def to_json(self, move=0, limit=100):
+        if not 0 <= move <= self.moves:
+            raise GameError(f"Ход должен быть от 0 до {self.moves}")
+        limit = max(0, min(limit, MAX_REPLAY_SHOTS))
+        format_cell = self.rules.format_cell
+        return {
+            "replay": self.number,
+            "game_id": self.game_id,
+            "rules": self.rules.to_json(),
+            "started_at": self.started_at,
+            "moves": self.moves,
+            "winner": self.winner,
+            "ships": {
+                seat: [self.rules.format_cells(cells) for cells in fleet]
+                for seat, fleet in zip(SEATS, self.fleets)
+            },
+            "state": self.state(move),
+            # Выстрелы после move: номер хода, время от начала раунда, исход
+            # тем же текстом, что в ответе /fire, и потопленный корабль
+            "shots": [
+                {"move": number, "t": ms / 1000, "player": SEATS[seat],
+                 "target": format_cell(cell), "result": RESULT_TEXT[HIT if outcome == SUNK else outcome],
+                 "sunk": self.sunk_ship(seat, cell) if outcome in (SUNK, WIN) else None}
+                for number, (ms, cell, seat, outcome)
+                in enumerate(self.shots[move:move + limit], move + 1)
+            ]
+        }
+
+    def sunk_ship(self, seat, cell):
+        # Корабль соперника стрелявшего, в который попал выстрел
+        for cells in self.fleets[1 - seat]:
+            if cell in cells:
+                return self.rules.format_cells(cells)
+        return None
+
+
+def parse_args(args):
+    # Параметры запроса /replay: move - с какого хода, limit - сколько выстрелов
+    values = []
+    for name, default in (("move", 0), ("limit", 100)):
+        value = parse_uint(args.get(name, str(default)))
+        if value is None:
+            raise GameError(f"{name} должен быть неотрицательным целым")
+        values.append(value)
+    return values
+
+
+class ReplayArchive(RoundListener):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.lock = threading.Lock()
+        self.offsets = []
+        self.end = 0
+        self.map = None
+        self.cache = OrderedDict()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab+") as f:
+            f.seek(0)
+            data = f.read()
+            for offset, header in iter_records(data):
+                self.offsets.append(offset)
+                self.end = offset + header[1]
+            if self.end < len(data):
+                # Хвост недописанной записи мешал бы следующим
+                f.truncate(self.end)
+        self.file = open(path, "ab")
+
+    def shot_entry(self, game, event):
+        # Выстрел раунда: (мс от начала, клетка, место, исход)
+        ms = max(0, int((time.time() - game.started_at) * 1000))
+        return (ms, game.rules.parse_cell(event["target"]),
+                SEATS.index(event["player"]), shot_outcome(game, event))
+
+    def finish_round(self, game, shots):
+        self.append(game, shots)
+
+    def append(self, game, shots):
+        fleets = [game.players[seat].fleet() for seat in SEATS]
+        record = encode_record(game.game_id, game.rules, game.winner, game.started_at,
+                               fleets, shots)
+        with self.lock:
+            self.file.write(record)
+            self.file.flush()
+            self.offsets.append(self.end)
+            self.end += len(record)
+            return len(self.offsets) - 1
+
+    def _buffer(self, end):
+        # Отображение файла в память, пересоздаётся, когда архив вырос
+        if self.map is None or len(self.map) < end:
+            if self.map is not None:
+                self.map.close()
+            with open(self.path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def get(self, number):
+        with self.lock:
+            if not 0 <= number < len(self.offsets):
+                raise GameError("Запись не найдена", 404)
+            replay = self.cache.get(number)
+            if replay is None:
+                end = self.offsets[number + 1] if number + 1 < len(self.offsets) else self.end
+                replay = Replay(number, self._buffer(end), self.offsets[number])
+                self.cache[number] = replay
+                while len(self.cache) > REPLAY_CACHE:
+                    self.cache.popitem(last=False)
+            self.cache.move_to_end(number)
+            return replay
+
+    def list(self, game_id=None, limit=100):
+        # Последние записи, новые первыми
+        with self.lock:
+            buffer = self._buffer(self.end) if self.offsets else b""
+            found = []
+            for number in range(len(self.offsets) - 1, -1, -1):
+                header = HEADER.unpack_from(buffer, self.offsets[number])
+                record_id = header[2].rstrip(b"\0 ").decode()
+                if game_id is None or record_id == game_id:
+                    found.append({
+                        "replay": number,
+                        "game_id": record_id,
+                        "rules": {"width": header[3], "height": header[4]},
+                        "winner": SEATS[header[6]],
+                        "started_at": header[8],
+                        "moves": header[9]
+                    })
+                    if len(found) >= limit:
+                        break
+        return found
+
+
+def open_archive(path=None):
+    if path is None:
+        path = os.environ.get("BATTLESHIP_REPLAYS", "")
+    return ReplayArchive(path) if path else None
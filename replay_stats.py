@@ -0,0 +1,157 @@
+# Сводная статистика по архиву записей партий (replay.py): доля попаданий,
+# длина партий, победы по местам и тепловые карты выстрелов, попаданий
+# и расстановки кораблей. Архив читается через mmap, записи разбираются
+# numpy-представлениями без копирования, карты копятся np.bincount пачками.
+#
+#   python replay_stats.py data/replays.bin
+#   python replay_stats.py data/replays.bin --size 1000 --npz heat.npz
+import argparse
+import json
+import mmap
+import sys
+
+import numpy as np
+
+from engine import MISS
+from replay import HEADER, SHOT, iter_records
+
+SHOT_DTYPE = np.dtype([("ms", "<u4"), ("cell", "<u4"), ("seat", "u1"), ("outcome", "u1")])
+assert SHOT_DTYPE.itemsize == SHOT.size
+# Сколько записей копить перед очередным bincount
+BATCH = 4096
+
+
+class Stats:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        cells = width * height
+        self.shots = np.zeros(cells, dtype=np.int64)
+        self.hits = np.zeros(cells, dtype=np.int64)
+        self.ships = np.zeros(cells, dtype=np.int64)
+        self.games = 0
+        self.skipped = 0
+        self.wins = [0, 0]
+        self.lengths = []
+        self.durations = []
+        self.pending_shots = []
+        self.pending_ships = []
+
+    def add(self, buffer, offset, header):
+        _, _, _, width, height, ships, winner, _, _, count = header
+        if (width, height) != (self.width, self.height):
+            self.skipped += 1
+            return
+        position = offset + HEADER.size
+        for _ in range(2):
+            lengths = np.frombuffer(buffer, dtype="<u2", count=ships, offset=position)
+            position += 2 * ships
+            total = int(lengths.sum())
+            self.pending_ships.append(np.frombuffer(buffer, dtype="<u4", count=total, offset=position))
+            position += 4 * total
+        shots = np.frombuffer(buffer, dtype=SHOT_DTYPE, count=count, offset=position)
+        self.pending_shots.append(shots)
+        self.games += 1
+        self.wins[winner] += 1
+        self.lengths.append(count)
+        self.durations.append(shots["ms"][-1] / 1000 if count else 0.0)
+        if len(self.pending_shots) >= BATCH:
+            self.flush()
+
+    def flush(self):
+        cells = self.width * self.height
+        if self.pending_shots:
+            shots = np.concatenate(self.pending_shots)
+            self.shots += np.bincount(shots["cell"], minlength=cells)
+            self.hits += np.bincount(shots["cell"][shots["outcome"] != MISS], minlength=cells)
+        if self.pending_ships:
+            self.ships += np.bincount(np.concatenate(self.pending_ships), minlength=cells)
+        self.pending_shots = []
+        self.pending_ships = []
+
+    def summary(self):
+        shots = int(self.shots.sum())
+        hits = int(self.hits.sum())
+        lengths = np.array(self.lengths or [0])
+        durations = np.array(self.durations or [0.0])
+        return {
+            "board": f"{self.width}x{self.height}",
+            "games": self.games,
+            "other_boards": self.skipped,
+            "shots": shots,
+            "hit_rate": hits / shots if shots else 0.0,
+            "wins": {"player1": self.wins[0], "player2": self.wins[1]},
+            "shots_per_game": {"mean": float(lengths.mean()), "p50": float(np.percentile(lengths, 50)),
+                               "p90": float(np.percentile(lengths, 90))},
+            "duration_seconds": {"mean": float(durations.mean()),
+                                 "p90": float(np.percentile(durations, 90))},
+        }
+
+    def heatmap(self, counts, total):
+        # Доля от total по клеткам, в процентах, строками поля
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.where(total > 0, counts / np.maximum(total, 1) * 100, 0.0)
+        return rate.reshape(self.height, self.width)
+
+
+def print_grid(title, grid):
+    print(title)
+    height, width = grid.shape
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    print("    " + " ".join(f"{col + 1:>5}" for col in range(width)))
+    for row in range(height):
+        label = letters[row] if height <= len(letters) else str(row)
+        print(f"{label:>4}" + " ".join(f"{value:5.1f}" for value in grid[row]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Статистика по архиву записей партий")
+    parser.add_argument("archive", help="файл архива (BATTLESHIP_REPLAYS)")
+    parser.add_argument("--size", type=int, default=10, help="сторона квадратного поля")
+    parser.add_argument("--width", type=int, help="ширина поля, если не квадратное")
+    parser.add_argument("--height", type=int, help="высота поля, если не квадратное")
+    parser.add_argument("--npz", help="сохранить карты shots/hits/ships в .npz")
+    parser.add_argument("--json", action="store_true", help="вывести итог в JSON")
+    args = parser.parse_args()
+
+    width = args.width or args.size
+    height = args.height or args.size
+    stats = Stats(width, height)
+    with open(args.archive, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Пустой файл не отображается в память
+            buffer = b""
+        for offset, header in iter_records(buffer):
+            stats.add(buffer, offset, header)
+        stats.flush()
+        # Представления numpy держат mmap, пока они живы
+        stats.pending_shots = stats.pending_ships = None
+
+    summary = stats.summary()
+    if args.npz:
+        np.savez_compressed(args.npz, shots=stats.shots.reshape(height, width),
+                            hits=stats.hits.reshape(height, width),
+                            ships=stats.ships.reshape(height, width))
+    if args.json:
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+        return
+    if not stats.games:
+        print(f"В архиве нет партий на поле {width}x{height}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"поле {summary['board']}: партий {summary['games']} "
+          f"(на других полях {summary['other_boards']}), выстрелов {summary['shots']}, "
+          f"попаданий {summary['hit_rate']:.1%}")
+    print(f"победы: player1 {stats.wins[0]}, player2 {stats.wins[1]}; "
+          f"выстрелов за партию в среднем {summary['shots_per_game']['mean']:.1f}, "
+          f"p90 {summary['shots_per_game']['p90']:.0f}; "
+          f"длительность в среднем {summary['duration_seconds']['mean']:.1f} с")
+    if width <= 26:
+        print_grid("Доля попаданий по клеткам, %", stats.heatmap(stats.hits, stats.shots))
+        print_grid("Корабли по клеткам, % партий", stats.heatmap(stats.ships, np.full_like(stats.ships, 2 * stats.games)))
+
+
+if __name__ == "__main__":
+    main()
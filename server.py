@@ -1,137 +1,238 @@
-from flask import Flask, request, jsonify
+import time
+
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 
+import handlers
+import protocol
+
+from admission import LIMITED_ROUTES
+from engine import GameError
+from game import SPECTATOR_MAX_LAG
+from handlers import EVENTS_KEEPALIVE, SSE_HEADERS
+from sharding import SHARD_KEY_HEADER
+
 app = Flask(__name__)
 CORS(app)  # Разрешаем кросс-доменные запросы
 
-# Инициализация игры
-players = {
-    "player1": {"ships": [], "hits": [], "misses": [], "ready": False},
-    "player2": {"ships": [], "hits": [], "misses": [], "ready": False}
-}
-current_turn = "player1"
-game_over = False
-winner = None
-
-def init_game():
-    global players, current_turn, game_over, winner
-    players = {
-        "player1": {"ships": [], "hits": [], "misses": [], "ready": False},
-        "player2": {"ships": [], "hits": [], "misses": [], "ready": False}
-    }
-    current_turn = "player1"
-    game_over = False
-    winner = None
+# Партии, подбор соперника, допуск, метрики и архив; обработка запросов
+# общая с server_async.py, здесь только маршруты Flask (см. handlers.py)
+service = handlers.Service()
+
+def request_data():
+    # Тело (JSON или компактный протокол) разбирается один раз на запрос
+    if "data" not in g:
+        g.data = handlers.decode_body(request.mimetype, request.get_data())
+    return g.data
+
+def compact():
+    return protocol.wants_compact(request.accept_mimetypes)
+
+def respond(reply):
+    return Response(reply.body, reply.status, reply.headers)
+
+def get_game():
+    return service.get_game(request.args.get("game_id") or request_data().get("game_id"))
+
+@app.errorhandler(GameError)
+def handle_game_error(error):
+    return respond(handlers.error_reply(error, compact(), request.full_path))
+
+@app.route("/shards", methods=["GET"])
+def shards():
+    return jsonify(service.shards())
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.before_request
+def admit_request():
+    rule = request.url_rule
+    if rule is not None and rule.rule in LIMITED_ROUTES:
+        service.admit(request.remote_addr, request.args if request.method == "GET" else request_data())
+        g.admitted = True
+
+@app.teardown_request
+def release_request(error=None):
+    if g.pop("admitted", False):
+        service.limiter.release()
+
+@app.after_request
+def observe_request(response):
+    # Маршрут берётся из шаблона (/games/<game_id>/join), а не из пути,
+    # чтобы число рядов метрик не росло с числом партий. У потоков SSE
+    # длина ответа неизвестна, учитывается только время до первого байта
+    rule = request.url_rule
+    service.metrics.observe_request(
+        rule.rule if rule is not None else "other", request.method, response.status_code,
+        time.perf_counter() - g.get("started", time.perf_counter()),
+        request.content_length, response.content_length
+    )
+    return response
+
+@app.route("/games", methods=["POST"])
+def create_game():
+    result = service.create_game(request_data())
+    service.registry.sync()
+    return jsonify(result)
+
+@app.route("/games", methods=["GET"])
+def list_games():
+    return jsonify(service.list_games())
+
+@app.route("/games/<game_id>/join", methods=["POST"])
+def join_game(game_id):
+    game = service.find_game(game_id)
+    with game.lock:
+        result = handlers.join(game, request_data())
+    service.registry.sync()
+    return jsonify(result)
+
+@app.route("/matchmaking/enqueue", methods=["POST"])
+def matchmaking_enqueue():
+    result = service.enqueue(request_data())
+    service.registry.sync()
+    return jsonify(result)
+
+@app.route("/matchmaking/poll", methods=["GET"])
+def matchmaking_poll():
+    result = service.poll(request.args)
+    service.registry.sync()
+    return jsonify(result)
+
+@app.route("/matchmaking/cancel", methods=["POST"])
+def matchmaking_cancel():
+    return jsonify(service.cancel(request_data()))
+
+@app.route("/matchmaking/metrics", methods=["GET"])
+def matchmaking_metrics():
+    return jsonify(service.matchmaking_metrics())
+
+@app.route("/matchmaking/games", methods=["POST"])
+def matchmaking_games():
+    # Только между шардами: очередь создаёт партию на владельце её game_id
+    result = service.start_match(request_data(), request.headers.get(SHARD_KEY_HEADER))
+    service.registry.sync()
+    return jsonify(result)
+
+@app.route("/matchmaking/result", methods=["POST"])
+def matchmaking_result():
+    # Только между шардами: победа в партии подбора для рейтингов очереди
+    return jsonify(service.report_result(request_data(), request.headers.get(SHARD_KEY_HEADER)))
 
 @app.route("/place_ships", methods=["POST"])
 def place_ships():
-    global current_turn, game_over
-    
-    data = request.json
-    player = data.get("player")
-    ships = data.get("ships", [])
-    
-    if player not in players:
-        return jsonify({"error": "Неверный игрок"}), 400
-    
-    # Проверка количества кораблей
-    if len(ships) != 5:
-        return jsonify({"error": "Должно быть ровно 5 кораблей"}), 400
-    
-    # Проверка валидности координат
-    valid_coords = [f"{l}{n}" for l in "ABCDEFGHIJ" for n in range(1, 11)]
-    for coord in ships:
-        if coord not in valid_coords:
-            return jsonify({"error": f"Неверная координата: {coord}"}), 400
-    
-    players[player]["ships"] = ships
-    players[player]["ready"] = True
-    
-    # Проверяем, готовы ли оба игрока
-    if players["player1"]["ready"] and players["player2"]["ready"]:
-        current_turn = "player1"  # Первым ходит player1
-    
-    return jsonify({
-        "status": "Корабли расставлены!",
-        "ready": players[player]["ready"],
-        "both_ready": players["player1"]["ready"] and players["player2"]["ready"]
-    })
+    game = get_game()
+    with game.lock:
+        result = handlers.place_ships(game, request_data())
+    service.registry.sync()
+    return respond(handlers.encode_reply("place", result, game.rules, compact()))
+
+@app.route("/random_fleet", methods=["GET"])
+def random_fleet():
+    return jsonify(service.random_fleet(request.args))
 
 @app.route("/fire", methods=["POST"])
 def fire():
-    global current_turn, game_over, winner
-    
-    if game_over:
-        return jsonify({"result": "Игра окончена!", "winner": winner})
-    
-    data = request.json
-    player = data.get("player")
-    target = data.get("target")
-    
-    if player not in players:
-        return jsonify({"error": "Неверный игрок"}), 400
-    
-    if player != current_turn:
-        return jsonify({"error": "Сейчас не ваш ход!"}), 400
-    
-    opponent = "player2" if player == "player1" else "player1"
-    
-    # Проверка валидности координаты
-    valid_coords = [f"{l}{n}" for l in "ABCDEFGHIJ" for n in range(1, 11)]
-    if target not in valid_coords:
-        return jsonify({"error": "Неверная координата"}), 400
-    
-    if target in players[opponent]["hits"] or target in players[opponent]["misses"]:
-        return jsonify({"result": "Уже стреляли сюда!"})
-    
-    result = ""
-    if target in players[opponent]["ships"]:
-        players[opponent]["hits"].append(target)
-        result = "Попал!"
-        
-        # Проверяем, остались ли корабли у противника
-        remaining = set(players[opponent]["ships"]) - set(players[opponent]["hits"])
-        if not remaining:
-            result = "Все корабли противника уничтожены. Победа!"
-            game_over = True
-            winner = player
-    else:
-        players[opponent]["misses"].append(target)
-        result = "Мимо!"
-        current_turn = opponent
-    
-    return jsonify({
-        "result": result,
-        "turn": current_turn,
-        "game_over": game_over,
-        "winner": winner
-    })
+    game = get_game()
+    with game.lock:
+        result = handlers.fire(game, request_data())
+    service.registry.sync()
+    return respond(handlers.encode_reply("fire", result, game.rules, compact()))
 
 @app.route("/status", methods=["GET"])
 def status():
-    return jsonify({
-        "current_turn": current_turn,
-        "game_over": game_over,
-        "winner": winner,
-        "player1_ready": players["player1"]["ready"],
-        "player2_ready": players["player2"]["ready"],
-        "player1_hits": players["player1"]["hits"],
-        "player1_misses": players["player1"]["misses"],
-        "player2_hits": players["player2"]["hits"],
-        "player2_misses": players["player2"]["misses"]
-    })
+    game = get_game()
+    with game.lock:
+        reply = handlers.status_reply(game, request.args, compact(), request.headers.get("If-None-Match"))
+    return respond(reply)
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    results = []
+    for command in handlers.batch_commands(request_data()):
+        try:
+            game = service.command_game(command)
+            with game.lock:
+                results.append(game.execute(command))
+        except GameError as error:
+            results.append(handlers.error_result(error))
+    # Все ходы пакета уходят на диск одной группой
+    service.registry.sync()
+    return jsonify({"results": results})
+
+def event_stream(game, version, max_lag=None):
+    while not game.closed:
+        with game.lock:
+            if version == game.version:
+                game.wait_for_change(version, EVENTS_KEEPALIVE)
+            chunk, version, dropped = handlers.next_chunk(game, version, max_lag)
+        yield chunk
+        if dropped:
+            return
+
+def sse_response(stream):
+    return Response(stream, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+@app.route("/events", methods=["GET"])
+def events():
+    game = get_game()
+    return sse_response(event_stream(game, handlers.last_event_id(request.headers, request.args)))
+
+@app.route("/spectate", methods=["GET"])
+def spectate():
+    # Только чтение: те же кадры, что и у игроков, а после конца партии -
+    # расстановка кораблей (событие reveal и поле ships в снимке)
+    game = get_game()
+    version = handlers.last_event_id(request.headers, request.args)
+    with game.lock:
+        game.add_spectator()
+
+    def stream():
+        try:
+            yield from event_stream(game, version, SPECTATOR_MAX_LAG)
+        finally:
+            with game.lock:
+                game.remove_spectator()
+
+    return sse_response(stream())
 
 @app.route("/restart", methods=["POST"])
 def restart():
-    init_game()
-    return jsonify({"status": "Игра перезапущена!"})
+    game = get_game()
+    with game.lock:
+        result = handlers.restart(game)
+    service.registry.sync()
+    return jsonify(result)
 
 @app.route("/reset_ready", methods=["POST"])
 def reset_ready():
-    player = request.json.get("player")
-    if player in players:
-        players[player]["ready"] = False
-    return jsonify({"status": "Готовность сброшена"})
+    game = get_game()
+    with game.lock:
+        result = handlers.reset_ready(game, request_data())
+    service.registry.sync()
+    return jsonify(result)
+
+@app.route("/replays", methods=["GET"])
+def list_replays():
+    return jsonify(service.list_replays(request.args))
+
+@app.route("/replay/<int:number>", methods=["GET"])
+def get_replay(number):
+    return jsonify(service.replay(number, request.args))
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return respond(service.render_metrics())
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return respond(service.stats())
+
+@app.route("/debug/profile", methods=["GET"])
+def debug_profile():
+    return respond(handlers.profile(request.args))
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=5000, debug=True)
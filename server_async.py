@@ -0,0 +1,327 @@
+import asyncio
+import time
+
+from quart import Quart, Response, g, request, jsonify, websocket
+
+import handlers
+import protocol
+
+from admission import LIMITED_OPS, LIMITED_ROUTES
+from engine import GameError
+from game import SPECTATOR_MAX_LAG, parse_since
+from handlers import EVENTS_KEEPALIVE, SSE_HEADERS
+from sharding import SHARD_KEY_HEADER
+
+# Асинхронный режим сервера: те же маршруты, что и в server.py, но на asyncio.
+# Запуск: hypercorn server_async:app -b 0.0.0.0:5000
+app = Quart(__name__)
+
+# Партии, подбор соперника, допуск, метрики и архив; обработка запросов
+# общая с server.py, здесь только маршруты Quart (см. handlers.py).
+# Замки партий - asyncio.Condition, ожидание не занимает поток
+service = handlers.Service(lock_factory=asyncio.Condition)
+
+async def request_data():
+    # Тело (JSON или компактный протокол) разбирается один раз на запрос
+    if "data" not in g:
+        g.data = handlers.decode_body(request.mimetype, await request.get_data())
+    return g.data
+
+def compact():
+    return protocol.wants_compact(request.accept_mimetypes)
+
+def respond(reply):
+    return Response(reply.body, reply.status, reply.headers)
+
+async def sync_store():
+    # fsync журнала блокирует, поэтому ждём его в отдельном потоке
+    if service.registry.store is not None:
+        await asyncio.to_thread(service.registry.sync)
+
+async def get_game():
+    return service.get_game(request.args.get("game_id") or (await request_data()).get("game_id"))
+
+@app.before_request
+async def start_timer():
+    g.started = time.perf_counter()
+
+@app.before_request
+async def admit_request():
+    rule = request.url_rule
+    if rule is not None and rule.rule in LIMITED_ROUTES:
+        service.admit(request.remote_addr, request.args if request.method == "GET" else await request_data())
+        g.admitted = True
+
+@app.teardown_request
+async def release_request(error=None):
+    if g.pop("admitted", False):
+        service.limiter.release()
+
+@app.after_request
+async def allow_cors(response):
+    # Разрешаем кросс-доменные запросы, как flask_cors в server.py
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+@app.after_request
+async def observe_request(response):
+    # Маршрут берётся из шаблона (/games/<game_id>/join), а не из пути,
+    # чтобы число рядов метрик не росло с числом партий. У потоков SSE
+    # длина ответа неизвестна, учитывается только время до первого байта
+    rule = request.url_rule
+    service.metrics.observe_request(
+        rule.rule if rule is not None else "other", request.method, response.status_code,
+        time.perf_counter() - g.get("started", time.perf_counter()),
+        request.content_length, response.content_length
+    )
+    return response
+
+@app.errorhandler(GameError)
+async def handle_game_error(error):
+    return respond(handlers.error_reply(error, compact(), request.full_path))
+
+@app.route("/shards", methods=["GET"])
+async def shards():
+    return jsonify(service.shards())
+
+@app.route("/games", methods=["POST"])
+async def create_game():
+    result = service.create_game(await request_data())
+    await sync_store()
+    return jsonify(result)
+
+@app.route("/games", methods=["GET"])
+async def list_games():
+    return jsonify(service.list_games())
+
+@app.route("/games/<game_id>/join", methods=["POST"])
+async def join_game(game_id):
+    game = service.find_game(game_id)
+    data = await request_data()
+    async with game.lock:
+        result = handlers.join(game, data)
+    await sync_store()
+    return jsonify(result)
+
+@app.route("/matchmaking/enqueue", methods=["POST"])
+async def matchmaking_enqueue():
+    # Найденная пара может означать запрос к другому шарду, поэтому
+    # enqueue и poll идут в отдельном потоке
+    result = await asyncio.to_thread(service.enqueue, await request_data())
+    await sync_store()
+    return jsonify(result)
+
+@app.route("/matchmaking/poll", methods=["GET"])
+async def matchmaking_poll():
+    result = await asyncio.to_thread(service.poll, request.args)
+    await sync_store()
+    return jsonify(result)
+
+@app.route("/matchmaking/cancel", methods=["POST"])
+async def matchmaking_cancel():
+    return jsonify(service.cancel(await request_data()))
+
+@app.route("/matchmaking/metrics", methods=["GET"])
+async def matchmaking_metrics():
+    return jsonify(service.matchmaking_metrics())
+
+@app.route("/matchmaking/games", methods=["POST"])
+async def matchmaking_games():
+    # Только между шардами: очередь создаёт партию на владельце её game_id
+    result = service.start_match(await request_data(), request.headers.get(SHARD_KEY_HEADER))
+    await sync_store()
+    return jsonify(result)
+
+@app.route("/matchmaking/result", methods=["POST"])
+async def matchmaking_result():
+    # Только между шардами: победа в партии подбора для рейтингов очереди
+    return jsonify(service.report_result(await request_data(), request.headers.get(SHARD_KEY_HEADER)))
+
+@app.route("/place_ships", methods=["POST"])
+async def place_ships():
+    game = await get_game()
+    data = await request_data()
+    async with game.lock:
+        result = handlers.place_ships(game, data)
+    await sync_store()
+    return respond(handlers.encode_reply("place", result, game.rules, compact()))
+
+@app.route("/random_fleet", methods=["GET"])
+async def random_fleet():
+    return jsonify(service.random_fleet(request.args))
+
+@app.route("/fire", methods=["POST"])
+async def fire():
+    game = await get_game()
+    data = await request_data()
+    async with game.lock:
+        result = handlers.fire(game, data)
+    await sync_store()
+    return respond(handlers.encode_reply("fire", result, game.rules, compact()))
+
+@app.route("/status", methods=["GET"])
+async def status():
+    game = await get_game()
+    async with game.lock:
+        reply = handlers.status_reply(game, request.args, compact(), request.headers.get("If-None-Match"))
+    return respond(reply)
+
+@app.route("/batch", methods=["POST"])
+async def batch():
+    results = []
+    for command in handlers.batch_commands(await request_data()):
+        try:
+            game = service.command_game(command)
+            async with game.lock:
+                results.append(game.execute(command))
+        except GameError as error:
+            results.append(handlers.error_result(error))
+    # Все ходы пакета уходят на диск одной группой
+    await sync_store()
+    return jsonify({"results": results})
+
+async def wait_for_change(game, version):
+    # Вызывается под game.lock
+    try:
+        await asyncio.wait_for(
+            game.lock.wait_for(lambda: game.version > version or game.closed),
+            EVENTS_KEEPALIVE
+        )
+    except asyncio.TimeoutError:
+        pass
+
+async def event_stream(game, version, max_lag=None):
+    while not game.closed:
+        async with game.lock:
+            if version == game.version:
+                await wait_for_change(game, version)
+            chunk, version, dropped = handlers.next_chunk(game, version, max_lag)
+        yield chunk
+        if dropped:
+            return
+
+def sse_response(stream):
+    response = Response(stream, mimetype="text/event-stream", headers=SSE_HEADERS)
+    response.timeout = None
+    return response
+
+@app.route("/events", methods=["GET"])
+async def events():
+    game = await get_game()
+    return sse_response(event_stream(game, handlers.last_event_id(request.headers, request.args)))
+
+@app.route("/spectate", methods=["GET"])
+async def spectate():
+    # Только чтение: те же кадры, что и у игроков, а после конца партии -
+    # расстановка кораблей (событие reveal и поле ships в снимке)
+    game = await get_game()
+    version = handlers.last_event_id(request.headers, request.args)
+    async with game.lock:
+        game.add_spectator()
+
+    async def stream():
+        try:
+            async for frame in event_stream(game, version, SPECTATOR_MAX_LAG):
+                yield frame
+        finally:
+            async with game.lock:
+                game.remove_spectator()
+
+    return sse_response(stream())
+
+async def push_events(game, seq, version):
+    # Подписка по WebSocket: изменения партии в компактном виде с тем же seq,
+    # что у команды SUBSCRIBE. Первым приходит снимок, если версия не указана
+    while not game.closed:
+        async with game.lock:
+            if version is not None and game.version == version:
+                await wait_for_change(game, version)
+            result = game.status() if version is None else game.delta(version)
+            version = game.version
+        if "events" not in result or result["events"]:
+            await websocket.send(protocol.encode_reply(seq, "status", result, game.rules))
+
+@app.websocket("/ws")
+async def ws():
+    # Постоянное соединение в компактном протоколе: [seq, op, ...] -> [seq, тело].
+    # Команды place/fire/status выполняются как в /batch, SUBSCRIBE
+    # присылает изменения партии, пока соединение открыто
+    subscriptions = {}
+    try:
+        while True:
+            message = await websocket.receive()
+            seq = None
+            try:
+                if isinstance(message, str):
+                    raise GameError("Ожидается двоичное сообщение MessagePack")
+                seq, command = protocol.decode_message(message)
+                # fire, status и subscribe проходят допуск, как запросы по HTTP:
+                # лишняя команда получает ошибку 429 или 503 с retry_after
+                # и не выполняется
+                admitted = command["op"] in LIMITED_OPS
+                if admitted:
+                    service.admit(websocket.remote_addr, command)
+                try:
+                    game = service.find_game(command["game_id"])
+                    if command["op"] == "subscribe":
+                        if game.game_id not in subscriptions:
+                            subscriptions[game.game_id] = asyncio.ensure_future(
+                                push_events(game, seq, parse_since(command["since"]))
+                            )
+                        continue
+                    async with game.lock:
+                        result = game.execute(command)
+                    if command["op"] != "status":
+                        await sync_store()
+                finally:
+                    if admitted:
+                        service.limiter.release()
+                await websocket.send(protocol.encode_reply(seq, command["op"], result, game.rules))
+            except GameError as error:
+                await websocket.send(protocol.encode_error(error, seq))
+    finally:
+        for task in subscriptions.values():
+            task.cancel()
+
+@app.route("/restart", methods=["POST"])
+async def restart():
+    game = await get_game()
+    async with game.lock:
+        result = handlers.restart(game)
+    await sync_store()
+    return jsonify(result)
+
+@app.route("/reset_ready", methods=["POST"])
+async def reset_ready():
+    game = await get_game()
+    data = await request_data()
+    async with game.lock:
+        result = handlers.reset_ready(game, data)
+    await sync_store()
+    return jsonify(result)
+
+@app.route("/replays", methods=["GET"])
+async def list_replays():
+    return jsonify(service.list_replays(request.args))
+
+@app.route("/replay/<int:number>", methods=["GET"])
+async def get_replay(number):
+    # Первая перемотка проигрывает всю партию, поэтому идёт в отдельном потоке
+    result = await asyncio.to_thread(service.replay, number, request.args)
+    return jsonify(result)
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    return respond(service.render_metrics())
+
+@app.route("/stats", methods=["GET"])
+async def stats():
+    return respond(service.stats())
+
+@app.route("/debug/profile", methods=["GET"])
+async def debug_profile():
+    # Сэмплер работает в отдельном потоке и снимает стеки в том числе с цикла событий
+    return respond(await asyncio.to_thread(handlers.profile, request.args))
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
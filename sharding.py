@@ -0,0 +1,134 @@
+# Шардирование: партии распределяются по нескольким процессам сервера.
+# Владелец партии определяется согласованным хешированием её идентификатора,
+# поэтому каталог "партия -> процесс" не хранится, а вычисляется одинаково
+# на всех шардах и у клиента (кольцо отдаёт GET /shards). Шард создаёт только
+# партии, которыми владеет сам; запрос к чужой партии получает 307 на адрес
+# владельца. Очередь подбора соперника живёт на шарде - владельце ключа
+# MATCHMAKING_KEY, а партии из неё создаются на владельцах своих
+# идентификаторов внутренним запросом (call_shard, см. matchmaking.py).
+#
+# Настройка - переменные окружения, одинаковые для всех шардов, кроме своей:
+#   BATTLESHIP_SHARDS    = http://10.0.0.1:5000,http://10.0.0.2:5000,...
+#   BATTLESHIP_SHARD     = адрес этого процесса из списка (или его номер)
+#   BATTLESHIP_SHARD_KEY = общий секрет внутренних запросов между шардами;
+#                          без него их может прислать кто угодно
+# Без BATTLESHIP_SHARDS сервер работает одним процессом (LocalDirectory).
+import bisect
+import hashlib
+import json
+import os
+import urllib.request
+
+from engine import GameError
+
+# Точек на кольце у каждого шарда: чем больше, тем ровнее распределение
+VNODES = 64
+MATCHMAKING_KEY = "matchmaking"
+# Заголовок с BATTLESHIP_SHARD_KEY во внутренних запросах
+SHARD_KEY_HEADER = "X-Battleship-Shard-Key"
+# Сколько секунд ждать ответа другого шарда
+SHARD_TIMEOUT = 5
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, shards, vnodes=VNODES):
+        self.shards = list(shards)
+        self.vnodes = vnodes
+        points = sorted(
+            (ring_hash(f"{shard}#{i}"), shard) for shard in self.shards for i in range(vnodes)
+        )
+        self.hashes = [point for point, _ in points]
+        self.owners = [shard for _, shard in points]
+
+    def owner(self, key):
+        index = bisect.bisect(self.hashes, ring_hash(key))
+        return self.owners[index % len(self.owners)]
+
+
+class WrongShard(GameError):
+    # Партия или подбор соперника обслуживаются другим процессом
+    def __init__(self, url):
+        super().__init__(f"Обслуживается другим сервером: {url}", 307)
+        self.url = url
+
+
+class LocalDirectory:
+    # Один процесс: все партии и подбор соперника здесь
+    key = None
+
+    def owner(self, key):
+        return None
+
+    def owns(self, key):
+        return True
+
+    def to_json(self):
+        return {"shards": [], "vnodes": 0, "self": None}
+
+
+class ShardDirectory:
+    def __init__(self, shards, me, vnodes=VNODES, key=None):
+        if me not in shards:
+            raise ValueError(f"{me} нет в списке шардов")
+        self.ring = HashRing(shards, vnodes)
+        self.me = me
+        self.key = key
+
+    def owner(self, key):
+        # Адрес шарда-владельца или None, если владелец - этот процесс
+        url = self.ring.owner(key)
+        return None if url == self.me else url
+
+    def owns(self, key):
+        return self.ring.owner(key) == self.me
+
+    def to_json(self):
+        return {"shards": self.ring.shards, "vnodes": self.ring.vnodes, "self": self.me}
+
+
+def check_owner(directory, key):
+    owner = directory.owner(key)
+    if owner is not None:
+        raise WrongShard(owner)
+
+
+def check_shard_key(directory, value):
+    # Внутренний маршрут между шардами: в одном процессе его нет,
+    # а с BATTLESHIP_SHARD_KEY запрос должен нести тот же ключ
+    if isinstance(directory, LocalDirectory):
+        raise GameError("Только для запросов между шардами", 404)
+    if directory.key and value != directory.key:
+        raise GameError("Неверный ключ шарда", 403)
+
+
+def call_shard(url, path, payload, key=None, timeout=SHARD_TIMEOUT):
+    # Внутренний запрос к другому шарду: POST JSON, ответ - словарь.
+    # Недоступный шард или ответ с ошибкой - GameError 503
+    headers = {"Content-Type": "application/json"}
+    if key:
+        headers[SHARD_KEY_HEADER] = key
+    request = urllib.request.Request(url + path, json.dumps(payload).encode(), headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError) as error:
+        raise GameError(f"Шард {url} недоступен: {error}", 503)
+
+
+def open_directory(shards=None, me=None, key=None):
+    if shards is None:
+        shards = os.environ.get("BATTLESHIP_SHARDS", "")
+    if me is None:
+        me = os.environ.get("BATTLESHIP_SHARD", "")
+    if key is None:
+        key = os.environ.get("BATTLESHIP_SHARD_KEY") or None
+    urls = [url.strip().rstrip("/") for url in shards.split(",") if url.strip()]
+    if not urls:
+        return LocalDirectory()
+    if me.isdigit():
+        me = urls[int(me)]
+    return ShardDirectory(urls, me.rstrip("/"), key=key)
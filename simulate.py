@@ -0,0 +1,192 @@
+# Самоигра на движке правил (engine.Match) в пуле процессов.
+# Печатает партии/с, выстрелы/с и гистограммы задержек place и fire,
+# чтобы регрессии на горячем пути /fire были видны в CI.
+#
+#   python simulate.py --games 20000 --workers 4 --shooter random
+#   python simulate.py --games 5000 --max-fire-p99-us 20   # код возврата 1 при регрессии
+#   python simulate.py --games 4 --size 1000                # поле 1000x1000
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from engine import DEFAULT_FLEET, MISS, Match, Rules
+
+# Корзины гистограммы: корзина i - задержки от 2^(i-1) до 2^i наносекунд
+BUCKETS = 40
+
+
+class RandomShooter:
+    def __init__(self, rng, rules):
+        self.order = list(range(rules.cells))
+        rng.shuffle(self.order)
+
+    def next_shot(self):
+        return self.order.pop()
+
+    def observe(self, target, hit):
+        pass
+
+
+class ScriptedShooter:
+    # Проходит поле по строкам, от первой клетки до последней
+    def __init__(self, rng, rules):
+        self.order = list(range(rules.cells - 1, -1, -1))
+
+    def next_shot(self):
+        return self.order.pop()
+
+    def observe(self, target, hit):
+        pass
+
+
+def ai_shooter(rng, rules):
+    from ai_player import AIPlayer
+
+    return AIPlayer(rules, rng.randrange(1 << 31))
+
+
+SHOOTERS = {
+    "random": RandomShooter,
+    "scripted": ScriptedShooter,
+    "ai": ai_shooter,
+}
+
+
+def play_chunk(args):
+    games, shooter_name, seed, size = args
+    make_shooter = SHOOTERS[shooter_name]
+    rules = Rules(size, size)
+    rng = random.Random(seed)
+    clock = time.perf_counter_ns
+    hist = {"place": [0] * BUCKETS, "fire": [0] * BUCKETS}
+    place_hist, fire_hist = hist["place"], hist["fire"]
+    shots = 0
+
+    started = time.perf_counter()
+    for _ in range(games):
+        match = Match(rules)
+        for seat in ("player1", "player2"):
+            ships = rng.sample(range(rules.cells), len(DEFAULT_FLEET))
+            t0 = clock()
+            match.place(seat, ships)
+            place_hist[min(BUCKETS - 1, (clock() - t0).bit_length())] += 1
+
+        shooters = {seat: make_shooter(rng, rules) for seat in ("player1", "player2")}
+        while not match.game_over:
+            seat = match.current_turn
+            shooter = shooters[seat]
+            target = shooter.next_shot()
+            t0 = clock()
+            outcome = match.shoot(seat, target)
+            fire_hist[min(BUCKETS - 1, (clock() - t0).bit_length())] += 1
+            shooter.observe(target, outcome != MISS)
+            shots += 1
+
+    return {
+        "games": games,
+        "shots": shots,
+        "cpu_seconds": time.perf_counter() - started,
+        "hist": hist,
+    }
+
+
+def percentile_ns(hist, p):
+    # Верхняя граница корзины, в которую попадает p-й процентиль
+    total = sum(hist)
+    if not total:
+        return 0
+    threshold = total * p / 100
+    seen = 0
+    for i, count in enumerate(hist):
+        seen += count
+        if seen >= threshold:
+            return 1 << i
+    return 1 << (len(hist) - 1)
+
+
+def print_histogram(name, hist):
+    total = sum(hist)
+    print(f"{name}: {total} операций, p50 <= {percentile_ns(hist, 50) / 1000:.2f} мкс, "
+          f"p90 <= {percentile_ns(hist, 90) / 1000:.2f} мкс, "
+          f"p99 <= {percentile_ns(hist, 99) / 1000:.2f} мкс")
+    peak = max(hist) or 1
+    for i, count in enumerate(hist):
+        if count:
+            low = (1 << (i - 1)) if i else 0
+            bar = "#" * max(1, round(40 * count / peak))
+            print(f"  {low / 1000:>9.2f}-{(1 << i) / 1000:<9.2f} мкс {count:>10} {bar}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Самоигра и бенчмарк движка морского боя")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shooter", choices=sorted(SHOOTERS), default="random")
+    parser.add_argument("--size", type=int, default=10, help="сторона квадратного поля")
+    parser.add_argument("--chunk", type=int, default=500, help="партий на одно задание пула")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="вывести итог в JSON")
+    parser.add_argument("--max-fire-p99-us", type=float,
+                        help="порог p99 для fire, при превышении код возврата 1")
+    parser.add_argument("--min-shots-per-sec", type=float,
+                        help="минимум выстрелов в секунду, иначе код возврата 1")
+    args = parser.parse_args()
+
+    chunks = []
+    left = args.games
+    while left > 0:
+        size = min(args.chunk, left)
+        chunks.append((size, args.shooter, args.seed + len(chunks), args.size))
+        left -= size
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool:
+        results = pool.map(play_chunk, chunks)
+    elapsed = time.perf_counter() - started
+
+    games = sum(r["games"] for r in results)
+    shots = sum(r["shots"] for r in results)
+    hist = {
+        op: [sum(r["hist"][op][i] for r in results) for i in range(BUCKETS)]
+        for op in ("place", "fire")
+    }
+    summary = {
+        "games": games,
+        "shots": shots,
+        "workers": args.workers,
+        "shooter": args.shooter,
+        "size": args.size,
+        "seconds": elapsed,
+        "games_per_sec": games / elapsed,
+        "shots_per_sec": shots / elapsed,
+        "fire_p50_us": percentile_ns(hist["fire"], 50) / 1000,
+        "fire_p99_us": percentile_ns(hist["fire"], 99) / 1000,
+        "place_p99_us": percentile_ns(hist["place"], 99) / 1000,
+    }
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"{games} партий ({args.shooter}, поле {args.size}x{args.size}), {args.workers} процессов, {elapsed:.2f} с")
+        print(f"{summary['games_per_sec']:.0f} партий/с, {summary['shots_per_sec']:.0f} выстрелов/с")
+        print_histogram("place", hist["place"])
+        print_histogram("fire", hist["fire"])
+
+    failed = False
+    if args.max_fire_p99_us is not None and summary["fire_p99_us"] > args.max_fire_p99_us:
+        print(f"РЕГРЕССИЯ: p99 fire {summary['fire_p99_us']:.2f} мкс > {args.max_fire_p99_us} мкс",
+              file=sys.stderr)
+        failed = True
+    if args.min_shots_per_sec is not None and summary["shots_per_sec"] < args.min_shots_per_sec:
+        print(f"РЕГРЕССИЯ: {summary['shots_per_sec']:.0f} выстрелов/с < {args.min_shots_per_sec}",
+              file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
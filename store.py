@@ -0,0 +1,205 @@
+# Хранилища партий. Game пишет в хранилище каждый принятый ход
+# (create, join, place, fire, restart, reset_ready, evict), а при старте
+# сервера GameRegistry.restore() поднимает партии обратно.
+#
+# Выбор хранилища - переменная окружения BATTLESHIP_STORE:
+#   не задана        - без сохранения, как раньше;
+#   memory           - MemoryStore, копия партий в памяти процесса;
+#   путь к файлу     - FileStore, журнал <путь>.log и снимок <путь>.snapshot.
+import atexit
+import json
+import os
+import threading
+
+from engine import Rules
+from game import Game, GameError
+
+# Через сколько записей журнала делать новый снимок
+SNAPSHOT_EVERY = 10000
+
+
+def apply_record(games, record):
+    # Повторяет ход на копии партии; ходы в журнале уже были приняты,
+    # поэтому заново их не записываем и события не храним
+    op = record["op"]
+    game_id = record["game_id"]
+    if op == "create":
+        game = Game(game_id, event_log_size=0, rules=Rules.from_json(record.get("rules")))
+        for seat in record.get("seats", [record["player"]]):
+            game.claim_seat(seat)
+        games[game_id] = game
+        return
+    if op == "evict":
+        games.pop(game_id, None)
+        return
+
+    game = games.get(game_id)
+    if game is None:
+        return
+    with game.lock:
+        try:
+            if op == "join":
+                game.join(record["player"])
+            elif op == "place":
+                game.place_ships(record["player"], record["ships"])
+            elif op == "fire":
+                game.fire(record["player"], record["target"])
+            elif op == "restart":
+                game.restart()
+            elif op == "reset_ready":
+                game.reset_ready(record["player"])
+        except GameError:
+            pass
+
+
+class MemoryStore:
+    # Держит актуальную копию каждой партии в памяти процесса.
+    # Переживает пересоздание GameRegistry, но не перезапуск процесса
+    def __init__(self):
+        self.games = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            return [game.dump() for game in self.games.values()]
+
+    def append(self, record):
+        with self.lock:
+            apply_record(self.games, record)
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileStore:
+    # Журнал упреждающей записи: каждая строка "<номер> <json>\n".
+    # Запись идёт в фоновом потоке группами: пока выполняется fsync одной
+    # группы, следующие записи копятся в pending и уходят одним fsync.
+    # Каждые SNAPSHOT_EVERY записей состояние всех партий сохраняется
+    # в снимок, а журнал обрезается.
+    def __init__(self, path, snapshot_every=SNAPSHOT_EVERY):
+        self.log_path = path + ".log"
+        self.snapshot_path = path + ".snapshot"
+        self.snapshot_every = snapshot_every
+        self.cond = threading.Condition()
+        self.pending = []
+        self.appended = 0   # номер последней принятой записи
+        self.durable = 0    # номер последней записи, сброшенной на диск
+        self.closed = False
+        # Теневая копия партий, из неё пишутся снимки
+        self.games = {}
+        self.since_snapshot = 0
+        self.file = None
+        self.thread = None
+
+    def load(self):
+        seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            seq = snapshot["seq"]
+            self.games = {
+                data["game_id"]: Game.from_dump(data, event_log_size=0)
+                for data in snapshot["games"]
+            }
+
+        valid_size = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        number, body = line.decode("utf-8").split(" ", 1)
+                        number = int(number)
+                        record = json.loads(body)
+                    except ValueError:
+                        # Недописанная строка после сбоя - дальше журнала нет
+                        break
+                    valid_size += len(line)
+                    # Записи до снимка могли остаться, если сбой был
+                    # между записью снимка и обрезкой журнала
+                    if number > seq:
+                        apply_record(self.games, record)
+                        seq = number
+                        self.since_snapshot += 1
+
+        self.appended = self.durable = seq
+        self.file = open(self.log_path, "ab")
+        self.file.truncate(valid_size)
+        self.thread = threading.Thread(target=self.flush_loop, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+        return [game.dump() for game in self.games.values()]
+
+    def append(self, record):
+        body = json.dumps(record, separators=(",", ":"))
+        with self.cond:
+            self.appended += 1
+            self.pending.append((f"{self.appended} {body}\n".encode("utf-8"), record))
+            self.cond.notify_all()
+
+    def sync(self):
+        with self.cond:
+            target = self.appended
+            self.cond.wait_for(lambda: self.durable >= target or self.closed)
+
+    def flush_loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending or self.closed)
+                if not self.pending:
+                    return
+                batch, self.pending = self.pending, []
+                seq = self.appended
+
+            self.file.write(b"".join(line for line, _ in batch))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+            with self.cond:
+                self.durable = seq
+                self.cond.notify_all()
+
+            for _, record in batch:
+                apply_record(self.games, record)
+            self.since_snapshot += len(batch)
+            if self.since_snapshot >= self.snapshot_every:
+                self.write_snapshot(seq)
+
+    def write_snapshot(self, seq):
+        # Снимок пишется во временный файл и атомарно подменяет старый,
+        # только после этого журнал можно обрезать
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "seq": seq,
+                "games": [game.dump() for game in self.games.values()]
+            }, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self.file.truncate(0)
+        self.since_snapshot = 0
+
+    def close(self):
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        if self.file is not None:
+            self.file.close()
+
+
+def open_store(spec=None):
+    if spec is None:
+        spec = os.environ.get("BATTLESHIP_STORE", "")
+    if not spec:
+        return None
+    if spec == "memory":
+        return MemoryStore()
+    return FileStore(spec)
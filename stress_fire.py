@@ -0,0 +1,112 @@
+# Стресс-тест конкурентности: много потоков одновременно стреляют
+# в одни и те же партии через Flask-приложение из server.py.
+# Проверяется, что ни одна клетка не обстреляна дважды и что после промаха
+# следующий выстрел всегда делает противник (нет "двойных ходов").
+#
+#   python stress_fire.py --games 20 --threads 8
+import argparse
+import random
+import sys
+import threading
+
+import game
+import server
+from admission import Admission
+
+SHIPS = {
+    "player1": ["A1", "C3", "E5", "G7", "J10"],
+    "player2": ["B2", "D4", "F6", "H8", "I9"],
+}
+TARGETS = [f"{l}{n}" for l in "ABCDEFGHIJ" for n in range(1, 11)]
+ACCEPTED = ("Попал!", "Мимо!", "Все корабли противника уничтожены. Победа!")
+
+
+def setup_game(client):
+    game_id = client.post("/games").get_json()["game_id"]
+    client.post(f"/games/{game_id}/join")
+    for player, ships in SHIPS.items():
+        client.post("/place_ships", json={
+            "game_id": game_id, "player": player, "ships": ships
+        })
+    return game_id
+
+
+def shooter(game_id, player, barrier, accepted):
+    client = server.app.test_client()
+    targets = TARGETS[:]
+    random.shuffle(targets)
+    barrier.wait()
+    for target in targets:
+        response = client.post("/fire", json={
+            "game_id": game_id, "player": player, "target": target
+        }).get_json()
+        if response.get("result") in ACCEPTED:
+            accepted.append((player, target))
+        if response.get("game_over") or response.get("result") == "Игра окончена!":
+            return
+
+
+def check_game(game_id, accepted):
+    errors = []
+    if len(set(accepted)) != len(accepted):
+        errors.append("один и тот же выстрел принят дважды")
+
+    current = server.service.registry.get(game_id)
+    shots = [event for event in current.events if event["type"] == "shot"]
+    if len(shots) != len(accepted):
+        errors.append(f"в журнале {len(shots)} выстрелов, принято {len(accepted)}")
+
+    turn = "player1"
+    for event in shots:
+        if event["player"] != turn:
+            errors.append(f"выстрел вне очереди: версия {event['version']}")
+            break
+        if not event["hit"]:
+            turn = game.opponent_of(turn)
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стресс-тест одновременных выстрелов")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8, help="потоков на каждого игрока")
+    args = parser.parse_args()
+
+    # Полный журнал событий нужен для проверки очерёдности ходов
+    game.EVENT_LOG_SIZE = 10000
+    # Чаще переключаем потоки, чтобы гонки проявлялись быстрее
+    sys.setswitchinterval(1e-6)
+    # Все потоки стреляют с одного адреса: ограничения допуска не нужны
+    server.service.limiter = Admission()
+
+    client = server.app.test_client()
+    game_ids = [setup_game(client) for _ in range(args.games)]
+    accepted = {game_id: [] for game_id in game_ids}
+    barrier = threading.Barrier(args.games * args.threads * 2)
+    threads = [
+        threading.Thread(target=shooter, args=(game_id, player, barrier, accepted[game_id]))
+        for game_id in game_ids
+        for player in SHIPS
+        for _ in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    failed = 0
+    for game_id in game_ids:
+        errors = check_game(game_id, accepted[game_id])
+        if errors:
+            failed += 1
+            print(f"{game_id}: " + "; ".join(errors))
+    total = sum(len(shots) for shots in accepted.values())
+    print(f"партий: {len(game_ids)}, потоков: {len(threads)}, принято выстрелов: {total}")
+    if failed:
+        print(f"ОШИБКА: нарушения в {failed} партиях")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()